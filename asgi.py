@@ -0,0 +1,260 @@
+# file: asgi.py
+#
+# Optional asyncio runtime, served next to (not instead of) main.app:
+#
+#     pip install -r requirements-async.txt
+#     uvicorn asgi:app --host 0.0.0.0 --port $PORT
+#
+# /start deep links run natively on the event loop (httpx + motor, auto
+# deletes as loop timers). Every other update is handed to the sync
+# handlers.process_update in a worker thread.
+
+import asyncio
+import functools
+import json
+import threading
+
+import async_core
+import config
+import database
+import handlers
+import health
+import ingestion
+import jobs
+import leader
+import lifecycle
+import metrics
+import router
+import tenants
+import tracing
+
+
+# followed by the bot token; one route per bot (see tenants.py)
+WEBHOOK_PREFIX = "/webhook/"
+
+
+# ================= RESPONSES =================
+async def send_json(send, payload, status=200):
+    body = json.dumps(payload).encode()
+
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def send_text(send, text, status=200, content_type=b"text/plain; charset=utf-8"):
+    body = text.encode()
+
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def read_body(receive, limit=None):
+    # None once the body grows past limit (chunked requests have no length)
+    chunks = []
+    size = 0
+
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+
+        if limit is not None and size > limit:
+            return None
+
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+# ================= UPDATES =================
+def deep_link(update):
+    # returns (chat_id, user, token) for "/start <token>" messages
+    msg = update.get("message")
+    if not isinstance(msg, dict):
+        return None
+
+    text = msg.get("text") or ""
+    if not text.startswith("/") or router.command_token(text) != "/start":
+        return None
+
+    parts = text.split(maxsplit=1)
+    if len(parts) < 2:
+        return None
+
+    return msg["chat"]["id"], msg["from"], parts[1]
+
+
+async def handle_update(update):
+    try:
+        await _handle_update(update)
+    except Exception as e:
+        async_core.log("Async handler crash", "status", "error", {"error": str(e)})
+
+
+async def _handle_update(update):
+    update_id = update.get("update_id")
+
+    link = deep_link(update)
+
+    if link is None:
+        # admin commands, callbacks, uploads: reuse the sync router
+        await asyncio.to_thread(handlers.process_update, update)
+        return
+
+    key = (tenants.scope(), update_id)
+    if key in handlers.PROCESSED_UPDATES:
+        metrics.inc("dedup_hits_total", scope="update")
+        return
+    handlers.PROCESSED_UPDATES.add(key)
+
+    chat_id, user, token = link
+    ctx = {"user_id": user["id"], "user": user, "chat_id": chat_id}
+
+    if not handlers.rate_limited(ctx):
+        return
+
+    # this task's lane and trace; the task runs in its own context
+    async_core.LANE.set(router.update_lane(ctx))
+    tracing.begin(update_id, "/start")
+
+    try:
+        with metrics.timer("update_processing_seconds", command="/start", runtime="async"):
+            await async_core.handle_start(
+                chat_id,
+                user["id"],
+                handlers.get_user_display_name(user),
+                token,
+                track_user=not handlers.is_admin(user["id"])
+            )
+    finally:
+        tracing.end()
+
+
+async def handle_webhook(scope, receive, send):
+    if lifecycle.is_draining():
+        await send_json(send, {"status": "shutting_down"}, status=503)
+        return
+
+    with metrics.timer("webhook_request_seconds", runtime="async"):
+        headers = dict(scope["headers"])
+        length = headers.get(b"content-length")
+
+        status = ingestion.check_request(
+            headers.get(ingestion.SECRET_HEADER.lower().encode(), b"").decode(),
+            int(length) if length and length.isdigit() else None
+        )
+        if status:
+            await send_json(send, {"status": "rejected"}, status=status)
+            return
+
+        update = ingestion.parse_update(await read_body(receive, config.WEBHOOK_MAX_BODY))
+
+        if update is None:
+            await send_json(send, {"status": "ignored"})
+            return
+
+        # ack Telegram immediately; the update runs as its own task
+        async_core.spawn(handle_update(update))
+        await send_json(send, {"success": True})
+
+
+# ================= APP =================
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+
+        if message["type"] == "lifespan.startup":
+            try:
+                config.validate()
+                await async_core.startup()
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+
+            # the sync handlers used for non-/start updates keep their own
+            # Mongo client and per-process caches
+            handlers.start_memory_cleanup()
+            health.start_sampler()
+            threading.Thread(target=database.connect, daemon=True).start()
+
+            # leader jobs as under Flask, except that the restart cleanup
+            # reschedules pending deletes as loop timers
+            cleanup = functools.partial(async_core.recover_on_loop, asyncio.get_running_loop())
+            leader.run_when_leader(
+                functools.partial(jobs.start_leader_jobs, restart_cleanup=cleanup),
+                jobs.stop_leader_jobs,
+            )
+
+            await send({"type": "lifespan.startup.complete"})
+
+        elif message["type"] == "lifespan.shutdown":
+            # new requests get 503 while in-flight tasks finish
+            lifecycle.state["draining"] = True
+            await async_core.shutdown()
+            await asyncio.to_thread(lifecycle.drain, "lifespan shutdown")
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+
+    if scope["type"] != "http":
+        return
+
+    path, method = scope["path"], scope["method"]
+
+    if path == "/" and method == "GET":
+        await send_text(send, "Bot is running!")
+        return
+
+    if path == "/health" and method == "GET":
+        snap = health.snapshot()
+        await send_json(send, dict(
+            snap,
+            status="healthy" if health.is_fresh(snap) else "stale",
+            runtime="async",
+            pending_deletes=len(async_core.DELETE_HANDLES),
+            background_tasks=len(async_core.BACKGROUND_TASKS),
+        ))
+        return
+
+    if path == "/livez" and method == "GET":
+        await send_json(send, {"status": "alive"})
+        return
+
+    if path == "/readyz" and method == "GET":
+        ready, reason = health.readiness(health.snapshot())
+        await send_json(send, {"ready": ready, "reason": reason}, status=200 if ready else 503)
+        return
+
+    if path == "/metrics" and method == "GET":
+        await send_text(send, metrics.render(), content_type=b"text/plain; version=0.0.4")
+        return
+
+    if path.startswith(WEBHOOK_PREFIX) and method == "POST":
+        bot = tenants.by_token(path[len(WEBHOOK_PREFIX):])
+
+        if bot is None:
+            await send_json(send, {"error": "Not found"}, status=404)
+            return
+
+        # the update task copies this context, so it runs as this bot
+        with tenants.use(bot):
+            await handle_webhook(scope, receive, send)
+        return
+
+    await send_json(send, {"error": "Not found"}, status=404)
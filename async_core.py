@@ -0,0 +1,571 @@
+# file: async_core.py
+
+import asyncio
+import contextvars
+import time
+
+from config import (
+    MONGODB_URI,
+    TELEGRAM_API_BASE,
+    TELEGRAM_RATE,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_COMPRESSORS,
+    SHUTDOWN_GRACE_SECONDS,
+)
+import bot
+import database
+import lanes
+import logsinks
+import media
+import metrics
+import mongo_health
+import telegram_client
+import tenants
+import tracing
+import webhook
+
+# optional async runtime (pip install -r requirements-async.txt)
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:
+    AsyncIOMotorClient = None
+
+
+WARNING_TEXT = (
+    "⚠️ IMPORTANT\n\n"
+    "⏳ This file will be deleted in 15 minutes.\n\n"
+    "📌 Forward it to another chat to keep it permanently."
+)
+
+_clients = {"http": None, "db": None}
+# buffers live here, not in the shipper, so shutdown can flush them
+_discord = {"queue": None, "task": None, "buffers": {}}
+
+# queued by shutdown(): the shipper flushes its buffers and returns
+_SHIPPER_STOP = None
+
+# (bot scope, chat_id, file_message_id) -> asyncio.TimerHandle
+DELETE_HANDLES = {}
+BACKGROUND_TASKS = set()
+
+# the lanes.py lane of the current task (lanes.lane() is per thread, and
+# tasks share the loop thread)
+LANE = contextvars.ContextVar("lane", default=lanes.DEFAULT_LANE)
+
+
+def missing_dependencies():
+    missing = []
+    if httpx is None:
+        missing.append("httpx")
+    if AsyncIOMotorClient is None:
+        missing.append("motor")
+    return missing
+
+
+def spawn(coro):
+    # keep a reference so fire-and-forget tasks are not garbage collected
+    task = asyncio.get_running_loop().create_task(coro)
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+    return task
+
+
+# ================= TELEGRAM =================
+async def telegram_call(method, payload=None, timeout=10):
+    # as the bot of the current task (tenants context, copied into each task)
+    url = f"{TELEGRAM_API_BASE}/bot{tenants.current()['token']}/{method}"
+
+    # the same per-bot budget as telegram_client.call; waiting for a token
+    # blocks, so it happens off the loop
+    if TELEGRAM_RATE > 0 and method not in telegram_client.UNBUDGETED:
+        await asyncio.to_thread(lanes.acquire, LANE.get())
+
+    started = time.perf_counter()
+    outcome = "exception"
+
+    try:
+        with tracing.span("telegram", method):
+            res = await _clients["http"].post(url, json=payload, timeout=timeout)
+            data = res.json()
+
+        outcome = "ok" if data.get("ok") else "api_error"
+        return data
+
+    finally:
+        metrics.observe("telegram_api_seconds", time.perf_counter() - started, method=method)
+        metrics.inc("telegram_api_requests_total", method=method, outcome=outcome)
+
+
+async def send_message(chat_id, text):
+    try:
+        data = await telegram_call("sendMessage", {"chat_id": chat_id, "text": text})
+
+        if "Forbidden" in data.get("description", "") and chat_id > 0:
+            spawn(mark_user_blocked(chat_id))
+
+        return data
+    except Exception as e:
+        log("Telegram send crash", "status", "error", {"chat_id": chat_id, "error": str(e)})
+        return {"ok": False}
+
+
+# ================= MONGO =================
+async def db_call(name, coro_factory, default=None):
+    # same circuit breaker as the sync driver
+    if not mongo_health.allow_request():
+        metrics.inc("db_queries_total", query=name, outcome="short_circuit")
+        return default
+
+    started = time.perf_counter()
+    outcome = "ok"
+
+    try:
+        result = await coro_factory()
+    except mongo_health.CONNECTIVITY_ERRORS as e:
+        outcome = "failed"
+        mongo_health.record_failure(e)
+        return default
+    except Exception:
+        # the server answered (duplicate key, write error): not an outage
+        outcome = "error"
+        return default
+    finally:
+        metrics.observe("db_query_seconds", time.perf_counter() - started, query=name)
+        metrics.inc("db_queries_total", query=name, outcome=outcome)
+
+    mongo_health.record_success()
+    return result
+
+
+async def get_movie_by_token(token):
+    db = _clients["db"]
+    movie = await db_call(
+        "get_movie_by_token",
+        lambda: db.movies.find_one(
+            {"token": token},
+            {"name": 1, "file_status": 1, **{k: 1 for k in database.CACHE_FIELDS}}
+        )
+    )
+
+    if movie is None and not mongo_health.is_available():
+        return database.cached_movie_by_token(token)
+
+    return movie
+
+
+async def increment_movie_access(name):
+    db = _clients["db"]
+    await db_call(
+        "increment_movie_access",
+        lambda: db.movies.update_one({"name": name}, {"$inc": {"access_count": 1}})
+    )
+
+
+async def add_user(user_id, display_name):
+    db = _clients["db"]
+    update = database.audience_update(
+        {"$set": {
+            "user_id": user_id,
+            "display_name": display_name,
+            "last_seen": time.time(),
+        }},
+        {tenants.scope()}
+    )
+
+    await db_call(
+        "add_user",
+        lambda: db.users.update_one({"user_id": user_id}, update, upsert=True)
+    )
+
+
+async def record_access(user_id, movie):
+    # analytics events share the sync write-behind buffer (no I/O here)
+    database.record_access_event(user_id, movie)
+
+    db = _clients["db"]
+    await db_call(
+        "record_access",
+        lambda: db.users.update_one(
+            {"user_id": user_id},
+            {
+                "$addToSet": {"movies": movie},
+                "$push": {"history": {
+                    "$each": [{"movie": movie, "at": time.time()}],
+                    "$slice": -database.ACCESS_HISTORY_LIMIT
+                }}
+            }
+        )
+    )
+
+
+async def mark_user_blocked(user_id):
+    db = _clients["db"]
+    await db_call(
+        "mark_user_blocked",
+        lambda: db.users.update_one({"user_id": user_id}, database.blocked_update(tenants.scope()))
+    )
+
+
+async def save_sent_file(chat_id, file_message_id, warning_message_id, timestamp):
+    db = _clients["db"]
+    await db_call(
+        "save_sent_file",
+        lambda: db.sent_files.insert_one(
+            database.sent_file_record(chat_id, file_message_id, warning_message_id, timestamp)
+        )
+    )
+
+
+async def delete_sent_file_record(chat_id, file_message_id):
+    db = _clients["db"]
+    await db_call(
+        "delete_sent_file_record",
+        lambda: db.sent_files.delete_one(
+            {"chat_id": chat_id, "file_message_id": file_message_id, "bot": tenants.scope()}
+        )
+    )
+
+
+async def get_pending_files(expiry_minutes=15):
+    db = _clients["db"]
+    cutoff = time.time() - expiry_minutes * 60
+
+    return await db_call(
+        "get_pending_files",
+        lambda: db.sent_files.find({"timestamp": {"$gte": cutoff}}).to_list(length=None),
+        default=[]
+    )
+
+
+# ================= AUTO DELETE =================
+metrics.gauge_callback("pending_auto_deletes", lambda: len(DELETE_HANDLES), runtime="async")
+
+
+def schedule_delete(chat_id, file_message_id, warning_message_id, delay=bot.AUTO_DELETE_SECONDS):
+    # a TimerHandle per delivery: no thread, a few hundred bytes each. The
+    # callback runs in this context, so it deletes as the same bot
+    loop = asyncio.get_running_loop()
+    key = (tenants.scope(), chat_id, file_message_id)
+
+    DELETE_HANDLES[key] = loop.call_later(
+        max(0, delay),
+        lambda: spawn(delete_user_messages(chat_id, file_message_id, warning_message_id))
+    )
+
+
+async def delete_user_messages(chat_id, file_message_id, warning_message_id):
+    LANE.set("bulk")  # scheduled from a delivery's context
+    DELETE_HANDLES.pop((tenants.scope(), chat_id, file_message_id), None)
+
+    message_ids = [m for m in (file_message_id, warning_message_id) if m]
+
+    try:
+        await telegram_call("deleteMessages", {"chat_id": chat_id, "message_ids": message_ids})
+    except Exception:
+        pass
+
+    await delete_sent_file_record(chat_id, file_message_id)
+
+
+def recover_on_loop(loop):
+    """
+    Restart cleanup for the asyncio runtime (see jobs.start_leader_jobs):
+    reschedules the pending deletes on `loop`. Called on the election
+    thread, so the leader alone recovers them.
+    """
+
+    asyncio.run_coroutine_threadsafe(recover_pending_deletes(), loop)
+
+
+async def recover_pending_deletes():
+    # unlike the sync cleanup, keep each file for the rest of its 15 minutes
+    LANE.set("bulk")
+    now = time.time()
+
+    for f in await get_pending_files():
+        if not f.get("chat_id"):
+            continue
+
+        with tenants.use(f.get("bot")):
+            schedule_delete(
+                f["chat_id"],
+                f.get("file_message_id"),
+                f.get("warning_message_id"),
+                delay=f.get("timestamp", now) + bot.AUTO_DELETE_SECONDS - now
+            )
+
+
+# ================= DELIVERY =================
+async def forward_file_to_storage(file_id):
+    storage_chat_id = tenants.current()["storage_chat_id"]
+
+    if not storage_chat_id:
+        return None
+
+    try:
+        data = await telegram_call("sendDocument", {"chat_id": storage_chat_id, "document": file_id})
+        if data.get("ok"):
+            return data["result"]["message_id"]
+    except Exception:
+        log("Storage error", "access", "error")
+
+    return None
+
+
+async def send_file(chat_id, file_id, movie=None):
+    # file_id None: as bot.send_file, the storage copy resolves it
+    if not chat_id or not (file_id or movie):
+        return {"ok": False}
+
+    if bot.is_duplicate_send(chat_id, file_id or movie["name"]):
+        return {"ok": False, "duplicate": True}
+
+    if bot.is_rate_limited(chat_id):
+        return {"ok": False, "rate_limited": True}
+
+    if file_id:
+        # the storage copy does not gate the user's delivery, run it alongside
+        storage = spawn(forward_file_to_storage(file_id))
+    else:
+        # here it does: it yields this bot's file_id
+        file_id, stored = await asyncio.to_thread(media.resolve_by_storage_copy, movie)
+
+        if not file_id:
+            return {"ok": False, "unresolved": True}
+
+        storage = asyncio.get_running_loop().create_future()
+        storage.set_result(stored)
+
+    try:
+        data = await telegram_call("sendDocument", {"chat_id": chat_id, "document": file_id})
+    except Exception:
+        log("Send file crash", "status", "error")
+        return {"ok": False}
+
+    if not data.get("ok"):
+        if media.is_invalid_file_error(data.get("description")):
+            media.report_invalid(file_id)
+
+        log("Send file failed", "status", "error", {"chat_id": chat_id})
+        return data
+
+    file_message_id = data["result"]["message_id"]
+    warning = await send_message(chat_id, WARNING_TEXT)
+    warning_message_id = warning.get("result", {}).get("message_id")
+
+    # the file is deleted even if the warning could not be sent
+    spawn(save_sent_file(chat_id, file_message_id, warning_message_id, time.time()))
+    schedule_delete(chat_id, file_message_id, warning_message_id)
+
+    if not await storage:
+        log("Storage skipped", "access", "warning")
+
+    log("📤 File Delivered", "access", "info", {"chat_id": chat_id})
+    return data
+
+
+async def handle_start(chat_id, user_id, display_name, token, track_user=True):
+    if track_user:
+        spawn(add_user(user_id, display_name))
+
+    movie = await get_movie_by_token(token)
+
+    if not movie:
+        name = token.replace("_", " ")
+        cached = database.cached_movies().get(name)
+        movie = {"name": name, **cached} if cached else None
+
+    if movie and movie.get("file_status") == "invalid":
+        await send_message(chat_id, "⚠️ This file is temporarily unavailable")
+        return
+
+    if not movie:
+        await send_message(chat_id, "❌ Invalid or expired link")
+        log("❌ Invalid link attempt", "access", "warning", {"user": display_name, "query": token})
+        return
+
+    result = await send_file(chat_id, media.file_id_for(movie), movie)
+
+    if result.get("unresolved"):
+        await send_message(chat_id, "⚠️ This file is temporarily unavailable")
+        return
+    spawn(increment_movie_access(movie["name"]))
+
+    if track_user:
+        spawn(record_access(user_id, movie["name"]))
+
+    log("🎬 File accessed", "access", "info", {"user": display_name, "movie": movie["name"]})
+
+
+# ================= DISCORD =================
+def log(message, log_type="status", severity="info", fields=None):
+    if not logsinks.enabled(severity):
+        return
+
+    ev = logsinks.event(message, log_type, severity, fields)
+
+    # other sinks are cheap; Discord goes through the shipper below
+    logsinks.dispatch(ev, exclude=("discord",))
+
+    queue = _discord["queue"]
+    sink = logsinks.get("discord")
+
+    if queue is None or sink is None or logsinks.LEVELS.get(severity, 1) < sink.level:
+        return
+
+    channel = sink.route(log_type)
+
+    # summaries are posted by webhook's aggregator thread
+    if not sink.accept(channel, ev):
+        return
+
+    entry = webhook.to_entry(channel, ev)
+
+    try:
+        queue.put_nowait((channel, entry))
+    except asyncio.QueueFull:
+        webhook.write_fallback_log(entry)
+
+
+async def _post_embed(log_type, entries):
+    url = webhook.webhook_map.get(log_type)
+
+    if not webhook.validate_webhook_url(url):
+        for e in entries:
+            webhook.write_fallback_log(e)
+        return
+
+    started = time.perf_counter()
+
+    for delay in (1, 2, 4):
+        try:
+            res = await _clients["http"].post(url, json=webhook.build_embed(log_type, entries), timeout=5)
+
+            if res.status_code in (200, 204):
+                break
+
+            if res.status_code == 429:
+                delay = res.json().get("retry_after", 2)
+        except Exception:
+            pass
+
+        # sleeping here only parks this coroutine, deliveries keep flowing
+        await asyncio.sleep(delay)
+    else:
+        metrics.inc("discord_flush_failures_total", channel=log_type)
+        for e in entries:
+            webhook.write_fallback_log(e)
+
+    metrics.observe("discord_flush_seconds", time.perf_counter() - started, channel=log_type)
+
+
+async def discord_shipper():
+    queue = _discord["queue"]
+    buffers = _discord["buffers"]
+
+    while True:
+        try:
+            item = await asyncio.wait_for(queue.get(), timeout=webhook.FLUSH_INTERVAL)
+        except asyncio.TimeoutError:
+            item = (None, None)
+
+        if item is _SHIPPER_STOP:
+            await _flush_buffers()
+            return
+
+        log_type, entry = item
+
+        if entry is not None:
+            if entry["severity"] == "error":
+                await _post_embed(log_type, [entry])
+                continue
+            buffers.setdefault(log_type, []).append(entry)
+
+        for name, buffer in list(buffers.items()):
+            if buffer and (entry is None or len(buffer) >= webhook.MAX_FIELDS):
+                buffers[name] = []
+                await _post_embed(name, buffer)
+
+
+async def _flush_buffers():
+    buffers = _discord["buffers"]
+
+    for name in list(buffers):
+        buffer = buffers.pop(name)
+        if buffer:
+            await _post_embed(name, buffer)
+
+
+async def drain_discord():
+    # whatever the shipper left: its buffers, then entries still queued
+    queue = _discord["queue"]
+    buffers = _discord["buffers"]
+
+    while queue is not None and not queue.empty():
+        item = queue.get_nowait()
+        if item is not _SHIPPER_STOP:
+            log_type, entry = item
+            buffers.setdefault(log_type, []).append(entry)
+
+    await _flush_buffers()
+
+
+# ================= LIFECYCLE =================
+async def startup():
+    missing = missing_dependencies()
+    if missing:
+        raise RuntimeError(f"async runtime needs: {', '.join(missing)}")
+
+    _clients["http"] = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=200, max_keepalive_connections=50),
+        timeout=10
+    )
+
+    mongo = AsyncIOMotorClient(
+        MONGODB_URI,
+        serverSelectionTimeoutMS=5000,
+        connectTimeoutMS=5000,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        compressors=MONGO_COMPRESSORS,
+    )
+    _clients["db"] = mongo["telegram_bot"]
+
+    _discord["queue"] = asyncio.Queue(maxsize=10000)
+    # not spawn(): shutdown() waits for BACKGROUND_TASKS before it stops
+    # the shipper
+    _discord["task"] = asyncio.get_running_loop().create_task(discord_shipper())
+
+    log("🟢 Async runtime online", "status", "info")
+
+
+async def shutdown():
+    # in-flight updates finish before the clients they use are closed
+    if BACKGROUND_TASKS:
+        await asyncio.wait(list(BACKGROUND_TASKS), timeout=SHUTDOWN_GRACE_SECONDS)
+
+    if _discord["task"]:
+        # let the shipper flush its buffers; cancel it only if a Discord
+        # retry loop outlasts the grace period
+        await _discord["queue"].put(_SHIPPER_STOP)
+        try:
+            await asyncio.wait_for(_discord["task"], timeout=SHUTDOWN_GRACE_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
+    await drain_discord()
+
+    # pending deletes stay in sent_files and are rescheduled on next start
+    for handle in DELETE_HANDLES.values():
+        handle.cancel()
+    DELETE_HANDLES.clear()
+
+    if _clients["http"]:
+        await _clients["http"].aclose()
+
+    if _clients["db"] is not None:
+        _clients["db"].client.close()
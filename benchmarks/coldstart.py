@@ -0,0 +1,165 @@
+# file: benchmarks/coldstart.py
+"""
+Measure cold start: time from spawning `python main.py` to the first
+200 OK on `/`. Telegram and Discord are local fakes and Mongo points at a
+closed port, so only the import graph and create_app() are on the clock.
+
+    python benchmarks/coldstart.py                 # 5 runs, 300ms target
+    python benchmarks/coldstart.py -r 20 --target-ms 250
+    python benchmarks/coldstart.py --importtime    # slowest imports too
+
+Exits 1 when the median is above --target-ms.
+"""
+
+import argparse
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import FakeDiscord, FakeTelegram  # noqa: E402
+from benchmarks.run import ADMIN_ID, BOT_TOKEN, percentile  # noqa: E402
+
+
+# ================= ENVIRONMENT =================
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def child_environment(telegram, discord, port):
+    hooks = f"{discord.base_url}/api/webhooks/"
+
+    env = dict(os.environ)
+    env.update({
+        "BOT_TOKEN": BOT_TOKEN,
+        "ADMIN_ID": str(ADMIN_ID),
+        "BOT_USERNAME": "bench_bot",
+        "STORAGE_CHAT_ID": "-1000",
+        # nothing listens here: background connect fails, requests must not care
+        "MONGODB_URI": "mongodb://127.0.0.1:9/?serverSelectionTimeoutMS=200",
+        "TELEGRAM_API_BASE": telegram.base_url,
+        "DISCORD_WEBHOOK_PREFIX": hooks,
+        "DISCORD_WEBHOOK_STATUS": hooks + "status",
+        "WEBHOOK_URL": f"https://bench.invalid/webhook/{BOT_TOKEN}",
+        "BACKGROUND_JOBS": "inline",
+        "LEADER_LOCK_FILE": os.path.join(tempfile.gettempdir(), "rypera-coldstart.lock"),
+        "PORT": str(port),
+    })
+    return env
+
+
+# ================= MEASURE =================
+def first_ok(port, deadline):
+    url = f"http://127.0.0.1:{port}/"
+
+    while time.perf_counter() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as res:
+                if res.status == 200:
+                    return True
+        except (urllib.error.URLError, ConnectionError, OSError):
+            pass
+        time.sleep(0.002)
+
+    return False
+
+
+def measure_once(telegram, discord, timeout):
+    port = free_port()
+    env = child_environment(telegram, discord, port)
+
+    started = time.perf_counter()
+    child = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "main.py")],
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+    try:
+        ok = first_ok(port, started + timeout)
+        elapsed = time.perf_counter() - started
+    finally:
+        # SIGKILL: the app's SIGTERM handler waits for a Discord flush
+        child.kill()
+        child.wait()
+
+    return elapsed if ok else None
+
+
+def slowest_imports(limit):
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+    ).stderr
+
+    rows = []
+    for line in out.splitlines():
+        match = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)", line)
+        # main's direct imports (one nesting level below it)
+        if match and len(match.group(3)) == 3:
+            rows.append((int(match.group(2)), match.group(4)))
+
+    return sorted(rows, reverse=True)[:limit]
+
+
+# ================= MAIN =================
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rypera cold-start measurement")
+    parser.add_argument("-r", "--runs", type=int, default=5)
+    parser.add_argument("--target-ms", type=float, default=300)
+    parser.add_argument("--timeout", type=float, default=10, help="seconds per run")
+    parser.add_argument("--importtime", action="store_true",
+                        help="also list the slowest direct imports of main")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    telegram = FakeTelegram().start()
+    discord = FakeDiscord().start()
+
+    samples = []
+    for _ in range(args.runs):
+        elapsed = measure_once(telegram, discord, args.timeout)
+        if elapsed is None:
+            print(f"no 200 OK within {args.timeout}s")
+            return 1
+        samples.append(elapsed * 1000)
+
+    median = percentile(samples, 50)
+    print(
+        f"cold start to first 200: median {median:.0f}ms, "
+        f"min {min(samples):.0f}ms, max {max(samples):.0f}ms "
+        f"over {len(samples)} runs (target {args.target_ms:.0f}ms)"
+    )
+
+    if args.importtime:
+        print("\nslowest imports (cumulative):")
+        for micros, module in slowest_imports(10):
+            print(f"  {micros / 1000:>8.1f}ms  {module}")
+
+    if median > args.target_ms:
+        print("⚠️ cold start above target")
+        return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
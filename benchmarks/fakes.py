@@ -0,0 +1,136 @@
+# file: benchmarks/fakes.py
+
+import itertools
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# ================= BASE =================
+class _QuietHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body go out in two writes; without TCP_NODELAY a
+    # keep-alive client waits on delayed ACKs (~40ms per request)
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        try:
+            return json.loads(body or b"{}")
+        except ValueError:
+            return {}
+
+    def _reply(self, status, payload=None):
+        body = json.dumps(payload).encode() if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # the default backlog of 5 turns a burst into 1s SYN retries
+    request_queue_size = 256
+
+
+class FakeServer:
+    def __init__(self, handler):
+        self.server = _Server(("127.0.0.1", 0), handler)
+        self.server.fake = self
+        self.calls = Counter()
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def record(self, name):
+        with self.lock:
+            self.calls[name] += 1
+
+
+# ================= TELEGRAM =================
+class _TelegramHandler(_QuietHandler):
+    def _handle(self):
+        fake = self.server.fake
+        method = self.path.split("?", 1)[0].rsplit("/", 1)[-1]
+        payload = self._read_json()
+
+        fake.record(method)
+
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        chat_id = payload.get("chat_id")
+        if chat_id in fake.blocked_chats:
+            self._reply(403, {"ok": False, "error_code": 403,
+                              "description": "Forbidden: bot was blocked by the user"})
+            return
+
+        if method == "getWebhookInfo":
+            result = {"url": fake.webhook_url}
+        elif method == "setWebhook":
+            fake.webhook_url = payload.get("url")
+            result = True
+        elif method in ("deleteMessage", "deleteMessages", "answerCallbackQuery", "deleteWebhook"):
+            result = True
+        elif method == "getUpdates":
+            result = []
+        elif method == "getFile":
+            result = {"file_id": payload.get("file_id"), "file_unique_id": "u", "file_size": 1}
+        else:
+            result = {"message_id": next(fake.message_ids), "chat": {"id": chat_id}}
+
+        self._reply(200, {"ok": True, "result": result})
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class FakeTelegram(FakeServer):
+    """Minimal Bot API stand-in: every send succeeds with a fresh message_id."""
+
+    def __init__(self, latency=0.0):
+        super().__init__(_TelegramHandler)
+        self.latency = latency
+        self.blocked_chats = set()
+        self.webhook_url = None
+        self.message_ids = itertools.count(1)
+
+
+# ================= DISCORD =================
+class _DiscordHandler(_QuietHandler):
+    def do_POST(self):
+        fake = self.server.fake
+        payload = self._read_json()
+
+        fake.record("webhook")
+        with fake.lock:
+            fake.embeds += len(payload.get("embeds", []))
+
+        self._reply(204)
+
+
+class FakeDiscord(FakeServer):
+    """Accepts Discord webhook posts and counts embeds."""
+
+    def __init__(self):
+        super().__init__(_DiscordHandler)
+        self.embeds = 0
@@ -0,0 +1,512 @@
+# file: benchmarks/run.py
+"""
+Replay synthetic update streams against main.app with Telegram, Discord and
+Mongo replaced by local stand-ins, then report latency / throughput / RSS.
+
+    python benchmarks/run.py                       # all scenarios, mongomock
+    python benchmarks/run.py -s deep_links -n 5000
+    python benchmarks/run.py --mongo mongodb://127.0.0.1:27017
+    python benchmarks/run.py --save-baseline       # later runs compare to it
+    python benchmarks/run.py --compare benchmarks/results/<run>.json
+
+Each scenario runs --repeat times and its best run is kept. Results go
+to benchmarks/results/. A run fails (exit 1) when p95 or throughput is
+more than --tolerance worse than the committed
+benchmarks/results/baseline.json, recorded with the default arguments.
+Runs with other workload arguments are not compared.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+BASELINE = os.path.join(RESULTS_DIR, "baseline.json")
+
+sys.path.insert(0, ROOT)
+
+from benchmarks.fakes import FakeDiscord, FakeTelegram  # noqa: E402
+
+BOT_TOKEN = "123456:bench"
+WEBHOOK_SECRET = "bench-secret"
+ADMIN_ID = 1
+
+
+# ================= ENVIRONMENT =================
+def prepare_environment(args, telegram, discord):
+    hooks = f"{discord.base_url}/api/webhooks/"
+
+    os.environ.update({
+        "BOT_TOKEN": BOT_TOKEN,
+        "ADMIN_ID": str(ADMIN_ID),
+        "BOT_USERNAME": "bench_bot",
+        "STORAGE_CHAT_ID": "-1000",
+        "MONGODB_URI": args.mongo if args.mongo != "mongomock" else "mongodb://localhost",
+        "TELEGRAM_API_BASE": telegram.base_url,
+        "DISCORD_WEBHOOK_PREFIX": hooks,
+        "DISCORD_WEBHOOK_STATUS": hooks + "status",
+        "DISCORD_WEBHOOK_LIST_LOGS": hooks + "list",
+        "DISCORD_WEBHOOK_FILE_ACCESS": hooks + "access",
+        "WEBHOOK_URL": f"https://bench.invalid/webhook/{BOT_TOKEN}",
+        "WEBHOOK_SECRET": WEBHOOK_SECRET,
+        # the fake Bot API has no flood limits; measure our own overhead
+        "TELEGRAM_RATE": "0",
+    })
+
+    if not args.keep_webhook_limit:
+        os.environ["WEBHOOK_MIN_INTERVAL"] = "0"
+
+    if args.mongo == "mongomock":
+        import mongomock
+        import pymongo
+        pymongo.MongoClient = mongomock.MongoClient
+    else:
+        host = urlparse(args.mongo).hostname
+        if host not in ("localhost", "127.0.0.1", "::1"):
+            sys.exit("refusing to benchmark against a non-local mongod")
+
+
+# ================= SAMPLER =================
+class Sampler:
+    def __init__(self, interval=0.05):
+        import psutil
+
+        self.process = psutil.Process()
+        self.interval = interval
+        self.peak_threads = 0
+        self.peak_rss_mb = 0.0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+            rss = self.process.memory_info().rss / 1024 / 1024
+            self.peak_rss_mb = max(self.peak_rss_mb, rss)
+            time.sleep(self.interval)
+
+    def __enter__(self):
+        threading.Thread(target=self._run, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+# ================= DRIVER =================
+def post_update(client, update):
+    started = time.perf_counter()
+    res = client.post(
+        f"/webhook/{BOT_TOKEN}",
+        json=update,
+        headers={"X-Telegram-Bot-Api-Secret-Token": WEBHOOK_SECRET}
+    )
+    elapsed = time.perf_counter() - started
+    return elapsed, res.status_code
+
+
+def replay(app, streams, concurrency):
+    """
+    Each stream is a list of updates that must be applied in order (one
+    chat); streams run concurrently like Telegram's per-chat ordering.
+    """
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+
+    def run_stream(stream):
+        client = app.test_client()
+        local = []
+
+        for update in stream:
+            if callable(update):
+                update()  # scenario hook between steps
+                continue
+
+            elapsed, status = post_update(client, update)
+            local.append(elapsed)
+
+            with lock:
+                statuses[status] = statuses.get(status, 0) + 1
+
+        with lock:
+            latencies.extend(local)
+
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(run_stream, streams))
+
+    return time.perf_counter() - started, latencies, statuses
+
+
+def summarize(name, duration, latencies, statuses, sampler, telegram, discord, units=None):
+    count = units if units is not None else len(latencies)
+
+    return {
+        "scenario": name,
+        "requests": len(latencies),
+        "units": count,
+        "duration_s": round(duration, 3),
+        "throughput_per_s": round(count / duration, 2) if duration else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "statuses": statuses,
+        "peak_threads": sampler.peak_threads,
+        "peak_rss_mb": round(sampler.peak_rss_mb, 2),
+        "telegram_calls": dict(telegram.calls),
+        "discord_posts": discord.calls.get("webhook", 0),
+    }
+
+
+# ================= UPDATES =================
+_update_ids = iter(range(1, 10 ** 9))
+
+
+def message_update(user_id, text=None, document=None):
+    msg = {
+        "message_id": next(_update_ids),
+        "chat": {"id": user_id, "type": "private"},
+        "from": {"id": user_id, "first_name": f"user{user_id}"},
+        "date": int(time.time()),
+    }
+
+    if text is not None:
+        msg["text"] = text
+    if document is not None:
+        msg["document"] = document
+
+    return {"update_id": next(_update_ids), "message": msg}
+
+
+def callback_update(user_id, data):
+    return {
+        "update_id": next(_update_ids),
+        "callback_query": {
+            "id": str(next(_update_ids)),
+            "from": {"id": user_id},
+            "message": {"message_id": 1, "chat": {"id": user_id}},
+            "data": data,
+        },
+    }
+
+
+def reset_state(telegram, discord):
+    import bot
+    import deletions
+    import handlers
+
+    # deliveries from the previous scenario would sit in the delete queue
+    deletions.clear()
+    bot.USER_LAST_REQUEST.clear()
+    bot.RECENT_SENDS.clear()
+    handlers.USER_RATE_LIMIT.clear()
+
+    telegram.calls.clear()
+    discord.calls.clear()
+
+
+def drop_admin_rate_limit():
+    import handlers
+
+    # the per-user limiter drops a reply sent <1s after the previous one;
+    # uploads measure handler cost, not the limiter
+    handlers.USER_RATE_LIMIT.pop((None, ADMIN_ID), None)
+
+
+# ================= SCENARIOS =================
+def scenario_deep_links(app, args, telegram, discord):
+    import database
+
+    tokens = [database.save_movie(f"Bench Movie {i}", f"FILE_{i}") for i in range(50)]
+    database.load_movies()
+
+    # one stream per user: a storm of distinct users opening deep links
+    streams = [
+        [message_update(10_000 + i, f"/start {tokens[i % len(tokens)]}")]
+        for i in range(args.count)
+    ]
+
+    with Sampler() as sampler:
+        duration, latencies, statuses = replay(app, streams, args.concurrency)
+
+    return summarize("deep_links", duration, latencies, statuses, sampler, telegram, discord)
+
+
+def scenario_uploads(app, args, telegram, discord):
+    count = max(1, args.count // 10)
+    stream = []
+
+    for i in range(count):
+        doc = {"file_id": f"UPLOAD_{i}", "file_unique_id": f"U{i}", "file_name": f"m{i}.mkv"}
+        stream.append(message_update(ADMIN_ID, document=doc))
+        stream.append(drop_admin_rate_limit)
+        stream.append(message_update(ADMIN_ID, text=f"Uploaded Movie {i}"))
+        stream.append(drop_admin_rate_limit)
+
+    with Sampler() as sampler:
+        duration, latencies, statuses = replay(app, [stream], 1)
+
+    return summarize("admin_uploads", duration, latencies, statuses, sampler, telegram, discord)
+
+
+def scenario_broadcast(app, args, telegram, discord):
+    import bot
+    import database
+    import dialogs
+
+    users = args.users
+    database.users_collection.delete_many({})
+
+    for start in range(0, users, 5000):
+        database.users_collection.insert_many([
+            {"user_id": 1_000_000 + i, "display_name": f"u{i}"}
+            for i in range(start, min(users, start + 5000))
+        ])
+
+    bot.BROADCAST_DELAY = 0  # measure our overhead, not the pacing sleep
+    dialogs.start(ADMIN_ID, "confirm_announce", {"message": "📢 Benchmark announcement", "segment": {}})
+
+    with Sampler() as sampler:
+        started = time.perf_counter()
+        _, latencies, statuses = replay(
+            app, [[callback_update(ADMIN_ID, "announce_confirm")]], 1
+        )
+
+        # the confirm only starts the broadcast; time it until it is done
+        while database.broadcasts_collection.find_one({"status": "running"}):
+            time.sleep(0.05)
+        duration = time.perf_counter() - started
+
+    return summarize(
+        "broadcast", duration, latencies, statuses, sampler, telegram, discord, units=users
+    )
+
+
+def scenario_restart(app, args, telegram, discord):
+    import bot
+    import database
+
+    count = args.count
+    now = time.time()
+    database.sent_files_collection.delete_many({})
+    database.sent_files_collection.insert_many([
+        {
+            "chat_id": 2_000_000 + (i % 500),
+            "file_message_id": 10 * i + 1,
+            "warning_message_id": 10 * i + 2,
+            "timestamp": now,
+        }
+        for i in range(count)
+    ])
+
+    with Sampler() as sampler:
+        started = time.perf_counter()
+        bot.cleanup_pending_files()
+        duration = time.perf_counter() - started
+
+    return summarize(
+        "restart_recovery", duration, [duration], {}, sampler, telegram, discord, units=count
+    )
+
+
+SCENARIOS = {
+    "deep_links": scenario_deep_links,
+    "uploads": scenario_uploads,
+    "broadcast": scenario_broadcast,
+    "restart": scenario_restart,
+}
+
+
+# ================= REPORT =================
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+# arguments that change the workload; results are only comparable when equal
+WORKLOAD_ARGS = ("count", "concurrency", "users", "mongo", "telegram_latency", "keep_webhook_limit", "repeat")
+
+# a p95 over fewer requests is one or two timings, not a percentile;
+# and a few milliseconds either way is scheduler jitter
+MIN_P95_SAMPLES = 100
+P95_NOISE_MS = 5
+
+
+def comparable(report, baseline):
+    return all(report["args"].get(k) == baseline["args"].get(k) for k in WORKLOAD_ARGS)
+
+
+def check_regressions(report, tolerance):
+    """
+    Compare a run report with the baseline and print the verdict. Returns
+    the process exit code: 1 past the tolerance, else 0.
+    """
+
+    if not os.path.exists(BASELINE):
+        print("no baseline, nothing compared")
+        return 0
+
+    with open(BASELINE, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    if not comparable(report, baseline):
+        print("workload differs from the baseline's, not compared")
+        return 0
+
+    regressions = compare(report["results"], baseline, tolerance)
+
+    for line in regressions:
+        print(f"⚠️ regression: {line}")
+
+    if regressions:
+        return 1
+
+    print(f"no regression against the baseline ({baseline['revision']}, tolerance {tolerance:.0%})")
+    return 0
+
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    previous = {r["scenario"]: r for r in baseline.get("results", [])}
+
+    for r in results:
+        old = previous.get(r["scenario"])
+        if not old:
+            continue
+
+        enough = min(old["requests"], r["requests"]) >= MIN_P95_SAMPLES
+
+        slower = r["p95_ms"] > old["p95_ms"] * (1 + tolerance) and r["p95_ms"] - old["p95_ms"] > P95_NOISE_MS
+
+        if enough and old["p95_ms"] and slower:
+            regressions.append(f"{r['scenario']}: p95 {old['p95_ms']}ms -> {r['p95_ms']}ms")
+
+        if old["throughput_per_s"] and r["throughput_per_s"] < old["throughput_per_s"] * (1 - tolerance):
+            regressions.append(
+                f"{r['scenario']}: throughput {old['throughput_per_s']}/s -> {r['throughput_per_s']}/s"
+            )
+
+    return regressions
+
+
+def print_table(results):
+    header = f"{'scenario':<18}{'units':>8}{'tput/s':>10}{'p50ms':>9}{'p95ms':>9}{'p99ms':>9}{'threads':>9}{'rssMB':>9}"
+    print(header)
+    print("-" * len(header))
+
+    for r in results:
+        print(
+            f"{r['scenario']:<18}{r['units']:>8}{r['throughput_per_s']:>10}"
+            f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}"
+            f"{r['peak_threads']:>9}{r['peak_rss_mb']:>9}"
+        )
+
+
+# ================= MAIN =================
+def parse_args():
+    parser = argparse.ArgumentParser(description="Rypera benchmark harness")
+    parser.add_argument("-s", "--scenario", action="append", choices=sorted(SCENARIOS),
+                        help="scenario to run (repeatable, default: all)")
+    parser.add_argument("-n", "--count", type=int, default=2000,
+                        help="updates per scenario (uploads use n/10)")
+    parser.add_argument("-c", "--concurrency", type=int, default=16)
+    parser.add_argument("--users", type=int, default=5000, help="broadcast audience size")
+    parser.add_argument("--mongo", default="mongomock",
+                        help="'mongomock' or a local mongodb:// URI (database is wiped)")
+    parser.add_argument("--telegram-latency", type=float, default=0.0,
+                        help="seconds the fake Bot API waits per call")
+    parser.add_argument("--keep-webhook-limit", action="store_true",
+                        help="keep the production WEBHOOK_MIN_INTERVAL gate")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs per scenario; the best one is kept")
+    # best-of-3 runs on one machine still vary by up to ~25%
+    parser.add_argument("--tolerance", type=float, default=0.3)
+    parser.add_argument("--compare", metavar="REPORT",
+                        help="check a saved run against the baseline instead of running")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            return check_regressions(json.load(f), args.tolerance)
+
+    telegram = FakeTelegram(latency=args.telegram_latency).start()
+    discord = FakeDiscord().start()
+    prepare_environment(args, telegram, discord)
+
+    import main as bot_main
+    import database
+
+    if args.mongo != "mongomock":
+        database.client.drop_database("telegram_bot")
+        database.ensure_indexes()
+
+    results = []
+
+    for name in args.scenario or list(SCENARIOS):
+        runs = []
+
+        for _ in range(max(1, args.repeat)):
+            reset_state(telegram, discord)
+            runs.append(SCENARIOS[name](bot_main.app, args, telegram, discord))
+
+        # a slow run is the machine's noise, not the code's
+        results.append(max(runs, key=lambda r: r["throughput_per_s"]))
+
+    reset_state(telegram, discord)
+    print_table(results)
+
+    report = {
+        "revision": git_revision(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "args": {k: v for k, v in vars(args).items() if k not in ("save_baseline", "compare")},
+        "results": results,
+    }
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{report['revision']}.json")
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\nsaved {os.path.relpath(path, ROOT)}")
+
+    if args.save_baseline:
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print("baseline updated")
+        return 0
+
+    return check_regressions(report, args.tolerance)
+
+
+if __name__ == "__main__":
+    # the app's SIGINT/SIGTERM handlers call os._exit, so flush first
+    code = main()
+    sys.stdout.flush()
+    os._exit(code)
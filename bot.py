@@ -1,27 +1,39 @@
 # file: bot.py
 
-import requests
 import threading
 import time
 from collections import defaultdict
 
-from config import BOT_TOKEN, STORAGE_CHAT_ID
-from database import save_sent_file, delete_sent_file_record, get_pending_files
+from database import (
+    save_sent_file, get_pending_files,
+    get_users_page, get_user_count, mark_user_blocked,
+    save_broadcast_checkpoint, claim_stale_broadcast
+)
+from config import BROADCAST_LEASE_SECONDS
 from webhook import log_to_discord
+import deletions
+import lanes
+import lifecycle
+import media
+import metrics
+import telegram_client
+import tenants
 
 
 # ================= RATE LIMIT =================
-USER_LAST_REQUEST = defaultdict(float)
+USER_LAST_REQUEST = defaultdict(float)  # (bot scope, chat_id) -> last send
 RATE_LIMIT_SECONDS = 2
 
 
 def is_rate_limited(chat_id):
+    key = (tenants.scope(), chat_id)
     now = time.time()
 
-    if now - USER_LAST_REQUEST[chat_id] < RATE_LIMIT_SECONDS:
+    if now - USER_LAST_REQUEST[key] < RATE_LIMIT_SECONDS:
+        metrics.inc("rate_limit_rejections_total", scope="send")
         return True
 
-    USER_LAST_REQUEST[chat_id] = now
+    USER_LAST_REQUEST[key] = now
     return False
 
 
@@ -31,10 +43,11 @@ DUPLICATE_WINDOW = 5  # seconds
 
 
 def is_duplicate_send(chat_id, file_id):
-    key = f"{chat_id}:{file_id}"
+    key = f"{tenants.scope()}:{chat_id}:{file_id}"
     now = time.time()
 
     if key in RECENT_SENDS and now - RECENT_SENDS[key] < DUPLICATE_WINDOW:
+        metrics.inc("dedup_hits_total", scope="send_file")
         return True
 
     RECENT_SENDS[key] = now
@@ -47,27 +60,32 @@ def is_duplicate_send(chat_id, file_id):
 
 
 # ================= SEND MESSAGE =================
-def send_message(chat_id, text, parse_mode=None):
+def send_message(chat_id, text, parse_mode=None, inline=False):
+    # inline: handler's last call, may ride on the webhook response
     if not chat_id or not text:
         return {"ok": False}
 
     if is_rate_limited(chat_id):
         return {"ok": False, "rate_limited": True}
 
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendMessage'
     payload = {'chat_id': chat_id, 'text': text}
 
     if parse_mode:
         payload['parse_mode'] = parse_mode
 
     try:
-        res = requests.post(url, json=payload, timeout=10)
-        data = res.json()
+        if inline:
+            data = telegram_client.reply("sendMessage", payload)
+        else:
+            data = telegram_client.call("sendMessage", payload)
 
         if not data.get("ok"):
             error = data.get("description", "")
 
             if "Forbidden" in error or "blocked" in error:
+                # private chat ids are user ids; skip them in future broadcasts
+                if isinstance(chat_id, int) and chat_id > 0:
+                    mark_user_blocked(chat_id, tenants.scope())
                 return {"ok": False, "ignored": True}
 
             log_to_discord(
@@ -91,15 +109,15 @@ def send_message(chat_id, text, parse_mode=None):
 
 # ================= STORAGE =================
 def forward_file_to_storage(file_id):
-    if not STORAGE_CHAT_ID or not file_id:
+    storage_chat_id = tenants.current()["storage_chat_id"]
+
+    if not storage_chat_id or not file_id:
         return None
 
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendDocument'
-    payload = {'chat_id': STORAGE_CHAT_ID, 'document': file_id}
+    payload = {'chat_id': storage_chat_id, 'document': file_id}
 
     try:
-        res = requests.post(url, json=payload, timeout=10)
-        data = res.json()
+        data = telegram_client.call("sendDocument", payload)
 
         if data.get('ok'):
             log_to_discord("📦 File stored", "access", "info")
@@ -112,20 +130,26 @@ def forward_file_to_storage(file_id):
 
 
 # ================= SEND FILE =================
-def send_file(chat_id, file_id):
-    if not chat_id or not file_id:
+def send_file(chat_id, file_id, movie=None):
+    # file_id None: this bot has no id for `movie` yet, the storage copy
+    # resolves it (media.resolve_by_storage_copy)
+    if not chat_id or not (file_id or movie):
         return {"ok": False}
 
     # 🔥 duplicate protection
-    if is_duplicate_send(chat_id, file_id):
+    if is_duplicate_send(chat_id, file_id or movie["name"]):
         return {"ok": False, "duplicate": True}
 
     if is_rate_limited(chat_id):
         return {"ok": False, "rate_limited": True}
 
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/sendDocument'
+    if file_id:
+        storage_message_id = forward_file_to_storage(file_id)
+    else:
+        file_id, storage_message_id = media.resolve_by_storage_copy(movie)
 
-    storage_message_id = forward_file_to_storage(file_id)
+        if not file_id:
+            return {"ok": False, "unresolved": True}
 
     if not storage_message_id:
         log_to_discord("Storage skipped", "access", "warning")
@@ -133,10 +157,12 @@ def send_file(chat_id, file_id):
     payload = {'chat_id': chat_id, 'document': file_id}
 
     try:
-        res = requests.post(url, json=payload, timeout=10)
-        data = res.json()
+        data = telegram_client.call("sendDocument", payload)
 
         if not data.get('ok'):
+            if media.is_invalid_file_error(data.get("description")):
+                media.report_invalid(file_id)
+
             log_to_discord(
                 "Send file failed",
                 "status",
@@ -153,17 +179,17 @@ def send_file(chat_id, file_id):
             "📌 Forward it to another chat to keep it permanently."
         )
 
-        warning_response = send_message(chat_id, warning_text)
+        # part of this delivery: send_message would hit the per-chat rate
+        # limit checked above and drop it
+        warning_response = telegram_client.call(
+            "sendMessage",
+            {'chat_id': chat_id, 'text': warning_text}
+        )
         warning_message_id = warning_response.get('result', {}).get('message_id')
 
-        if warning_message_id:
-            save_sent_file(chat_id, file_message_id, warning_message_id, time.time())
-
-            threading.Timer(
-                900,
-                delete_user_messages,
-                args=[chat_id, file_message_id, warning_message_id]
-            ).start()
+        # the file is deleted even if the warning could not be sent
+        save_sent_file(chat_id, file_message_id, warning_message_id, time.time())
+        schedule_auto_delete(chat_id, file_message_id, warning_message_id)
 
         log_to_discord(
             "📤 File Delivered",
@@ -179,27 +205,25 @@ def send_file(chat_id, file_id):
         return {"ok": False}
 
 
+# ================= AUTO DELETE =================
+AUTO_DELETE_SECONDS = 900
+
+
+def schedule_auto_delete(chat_id, file_message_id, warning_message_id):
+    deletions.schedule(
+        chat_id,
+        file_message_id,
+        [file_message_id, warning_message_id],
+        AUTO_DELETE_SECONDS
+    )
+
+
 # ================= DELETE =================
 def delete_user_messages(chat_id, file_message_id, warning_message_id):
     if not isinstance(chat_id, int):
         return
 
-    url = f'https://api.telegram.org/bot{BOT_TOKEN}/deleteMessage'
-
-    for msg_id in [file_message_id, warning_message_id]:
-        if not msg_id:
-            continue
-
-        try:
-            requests.post(
-                url,
-                json={'chat_id': chat_id, 'message_id': msg_id},
-                timeout=10
-            )
-        except:
-            pass
-
-    delete_sent_file_record(chat_id, file_message_id)
+    deletions.flush([(chat_id, file_message_id, [file_message_id, warning_message_id])])
 
     log_to_discord(
         "🧹 Cleanup complete",
@@ -210,19 +234,98 @@ def delete_user_messages(chat_id, file_message_id, warning_message_id):
 
 
 # ================= ANNOUNCEMENT =================
-def send_announcement(user_ids, message, parse_mode=None):
-    success = 0
-    failed = 0
-
-    for user_id in user_ids:
-        result = send_message(user_id, message, parse_mode)
-
-        if result and result.get("ok"):
-            success += 1
-        else:
-            failed += 1
+BROADCAST_DELAY = 0.05  # seconds between messages (~20 msg/s)
+BROADCAST_BATCH_SIZE = 500  # users per page / checkpoint
+BROADCAST_RETRY_SECONDS = 5
+BROADCAST_MAX_RETRIES = 60  # ~5 minutes of Mongo outage before pausing
+BROADCAST_HEARTBEAT = BROADCAST_LEASE_SECONDS / 3  # checkpoint at least this often
+
+
+@lanes.bulk
+def send_announcement(broadcast):
+    """
+    Send a broadcast (see database.create_broadcast) to every user after
+    its checkpoint, one page of users at a time. Progress is saved after
+    each page, so an interrupted broadcast resumes instead of restarting.
+    Counts as in flight, so a drain lets it save its checkpoint.
+    """
+
+    # as the bot it was created on, also when resumed after a restart
+    with lifecycle.inflight(), tenants.use((broadcast.get("segment") or {}).get("bot")):
+        return _send_announcement(broadcast)
+
+
+def _send_announcement(broadcast):
+    success = broadcast.get("sent", 0)
+    failed = broadcast.get("failed", 0)
+    after_id = broadcast.get("checkpoint")
+    segment = broadcast.get("segment")
+    total = max(1, get_user_count(segment))
+    retries = 0
+    beat = time.monotonic()
+
+    while True:
+        page = get_users_page(after_id, BROADCAST_BATCH_SIZE, segment)
+
+        if page is None:
+            # Mongo unavailable: keep the checkpoint and wait for recovery
+            retries += 1
+
+            if retries > BROADCAST_MAX_RETRIES or lifecycle.is_draining():
+                log_to_discord(
+                    "📢 Announcement paused",
+                    "list",
+                    "warning",
+                    fields={"Success": success, "Failed": failed}
+                )
+                return success, failed
+
+            time.sleep(BROADCAST_RETRY_SECONDS)
+            continue
 
-        time.sleep(0.05)
+        retries = 0
+
+        if not page:
+            break
+
+        for user in page:
+            if lifecycle.is_draining():
+                # resumed from here by the next process (resume_broadcasts)
+                save_broadcast_checkpoint(broadcast["_id"], after_id, success, failed, release=True)
+                log_to_discord(
+                    "📢 Announcement paused for shutdown",
+                    "list",
+                    "warning",
+                    fields={"Success": success, "Failed": failed}
+                )
+                return success, failed
+
+            result = send_message(user["user_id"], broadcast["message"], broadcast.get("parse_mode"))
+
+            if result and result.get("ok"):
+                success += 1
+                metrics.inc("broadcast_messages_total", result="sent")
+            else:
+                failed += 1
+                metrics.inc(
+                    "broadcast_messages_total",
+                    result="blocked" if result.get("ignored") else "failed"
+                )
+
+            metrics.set_gauge("broadcast_progress_ratio", min(1, (success + failed) / total))
+            after_id = user["_id"]
+            time.sleep(BROADCAST_DELAY)
+
+            if time.monotonic() - beat > BROADCAST_HEARTBEAT:
+                if not _checkpoint(broadcast, after_id, success, failed):
+                    return success, failed
+                beat = time.monotonic()
+
+        if not _checkpoint(broadcast, after_id, success, failed):
+            return success, failed
+        beat = time.monotonic()
+
+    save_broadcast_checkpoint(broadcast["_id"], after_id, success, failed, status="done")
 
     log_to_discord(
         "📢 Announcement Summary",
@@ -238,20 +341,100 @@ def send_announcement(user_ids, message, parse_mode=None):
     return success, failed
 
 
+def _checkpoint(broadcast, after_id, success, failed):
+    # False once another process has taken the broadcast over
+    if save_broadcast_checkpoint(broadcast["_id"], after_id, success, failed) is not False:
+        return True
+
+    log_to_discord(
+        "📢 Announcement taken over by another process",
+        "list",
+        "warning",
+        fields={"Success": success, "Failed": failed}
+    )
+    return False
+
+
+def start_announcement(broadcast, notify_chat_id=None):
+    """
+    Run a broadcast on its own thread, as the current bot, so the request
+    or polling batch that confirmed it is not held for the whole send.
+    Returns the thread.
+    """
+
+    def run():
+        success, failed = send_announcement(broadcast)
+
+        if notify_chat_id:
+            send_message(notify_chat_id, f"✅ Announcement sent\n\nSuccess: {success}\nFailed: {failed}")
+
+    return tenants.start_thread(run)
+
+
+def resume_broadcasts():
+    """
+    Take over running broadcasts whose owner stopped checkpointing (a
+    restart or a crash) and continue each from its checkpoint. Claims are
+    atomic, so two processes never send the same broadcast.
+    """
+
+    while True:
+        broadcast = claim_stale_broadcast()
+
+        if not broadcast:
+            return
+
+        log_to_discord(
+            "📢 Resuming announcement",
+            "list",
+            "info",
+            fields={"Sent": broadcast.get("sent", 0), "Failed": broadcast.get("failed", 0)}
+        )
+
+        threading.Thread(target=send_announcement, args=(broadcast,), daemon=True).start()
+
+
+def watch_broadcasts(should_claim=None):
+    # a crashed owner's lease runs out while the leader is already up
+    while True:
+        if should_claim is None or should_claim():
+            resume_broadcasts()
+
+        time.sleep(BROADCAST_LEASE_SECONDS / 2)
+
+
 # ================= CLEANUP =================
 def cleanup_pending_files():
     try:
         pending_files = get_pending_files()
 
-        for f in pending_files:
-            if not f.get("chat_id"):
-                continue
-
-            delete_user_messages(
+        entries = [
+            (
+                f.get("bot"),
                 f['chat_id'],
                 f.get('file_message_id'),
-                f.get('warning_message_id')
+                [f.get('file_message_id'), f.get('warning_message_id')]
             )
+            for f in pending_files
+            if f.get("chat_id")
+        ]
+
+        if not entries:
+            return
+
+        calls, saved = deletions.flush_scoped(entries)
+
+        log_to_discord(
+            "🧹 Restart cleanup complete",
+            "status",
+            "info",
+            fields={
+                "files": len(entries),
+                "chats": len({(e[0], e[1]) for e in entries}),
+                "api_calls": calls,
+                "calls_saved": saved
+            }
+        )
 
     except Exception as e:
         log_to_discord("Cleanup error", "status", "error")
\ No newline at end of file
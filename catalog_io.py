@@ -0,0 +1,182 @@
+# file: catalog_io.py
+#
+# Streaming backup / restore of the catalog as NDJSON (gzip when the path
+# ends in .gz). One line per document: {"collection": ..., "doc": {...}}.
+#
+#     python catalog_io.py export backup.ndjson.gz
+#     python catalog_io.py import backup.ndjson.gz --batch-size 2000
+#
+# Exports read through a cursor and imports write in unordered bulk_write
+# batches, so memory stays flat whatever the catalog size. The same
+# functions back the admin /export and /import commands.
+
+import argparse
+import contextlib
+import gzip
+import io
+import sys
+import time
+
+from bson import json_util
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from database import load_movies, movies_catalog, users_collection
+import config
+import mongo_health
+
+
+# collection -> (handle, natural key used to upsert)
+# movies carry access_count; users carry last_seen and access history
+COLLECTIONS = {
+    "movies": (movies_catalog, "name"),
+    "users": (users_collection, "user_id"),
+}
+
+BATCH_SIZE = 1000
+JSON_OPTIONS = json_util.RELAXED_JSON_OPTIONS
+
+
+# ================= FILES =================
+def open_stream(binary, gzipped):
+    # line-by-line text reader over a binary stream (file, HTTP body)
+    if gzipped:
+        binary = gzip.GzipFile(fileobj=binary, mode="rb")
+    return io.TextIOWrapper(binary, encoding="utf-8")
+
+
+def open_path(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+# ================= EXPORT =================
+def export_catalog(out, collections=tuple(COLLECTIONS), batch_size=BATCH_SIZE, progress=None):
+    """
+    Write every document of `collections` to the text stream `out`.
+    progress(stats) is called after each batch. Returns the counts.
+    """
+
+    stats = {name: 0 for name in collections}
+
+    for name in collections:
+        collection, _ = COLLECTIONS[name]
+
+        for doc in collection.find({}, {"_id": 0}, batch_size=batch_size):
+            out.write(json_util.dumps({"collection": name, "doc": doc}, json_options=JSON_OPTIONS))
+            out.write("\n")
+
+            stats[name] += 1
+            if progress and stats[name] % batch_size == 0:
+                progress(stats)
+
+    mongo_health.record_success()
+    return stats
+
+
+# ================= IMPORT =================
+def _flush(name, ops, stats):
+    collection, _ = COLLECTIONS[name]
+
+    try:
+        result = collection.bulk_write(ops, ordered=False)
+        stats[name] += result.upserted_count + result.matched_count
+
+    except BulkWriteError as e:
+        # e.g. a token that already belongs to another movie
+        stats[name] += e.details.get("nUpserted", 0) + e.details.get("nMatched", 0)
+        stats["errors"] += len(e.details.get("writeErrors", []))
+
+
+def import_catalog(lines, batch_size=BATCH_SIZE, progress=None):
+    """
+    Upsert documents from an iterable of NDJSON lines, keyed on each
+    collection's natural key (existing documents are replaced).
+    progress(stats) is called after each batch. Returns the counts.
+    """
+
+    stats = {name: 0 for name in COLLECTIONS}
+    stats.update(errors=0, skipped=0)
+    pending = {name: [] for name in COLLECTIONS}
+
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+
+        try:
+            record = json_util.loads(line)
+            name, doc = record["collection"], record["doc"]
+            _, key = COLLECTIONS[name]
+            doc.pop("_id", None)
+            ops = pending[name]
+            ops.append(ReplaceOne({key: doc[key]}, doc, upsert=True))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            stats["skipped"] += 1
+            continue
+
+        if len(ops) >= batch_size:
+            _flush(name, ops, stats)
+            pending[name] = []
+
+            if progress:
+                progress(stats)
+
+    for name, ops in pending.items():
+        if ops:
+            _flush(name, ops, stats)
+
+    mongo_health.record_success()
+
+    # fresh titles and tokens must be servable right away
+    load_movies()
+    return stats
+
+
+def describe(stats):
+    return ", ".join(f"{k}: {v}" for k, v in stats.items())
+
+
+# ================= CLI =================
+def main():
+    parser = argparse.ArgumentParser(description="Export / import the Rypera catalog")
+    parser.add_argument("action", choices=("export", "import"))
+    parser.add_argument("path", help="NDJSON file; gzip when it ends in .gz, '-' for stdio")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--only", choices=sorted(COLLECTIONS), action="append",
+                        help="export only this collection (repeatable)")
+    args = parser.parse_args()
+
+    config.validate()
+
+    started = time.perf_counter()
+
+    def report(stats):
+        elapsed = time.perf_counter() - started
+        print(f"\r{describe(stats)} ({elapsed:.1f}s)", end="", file=sys.stderr, flush=True)
+
+    try:
+        if args.action == "export":
+            # only close what we opened; '-' leaves stdout to the shell
+            out = contextlib.nullcontext(sys.stdout) if args.path == "-" else open_path(args.path, "w")
+            with out as fh:
+                stats = export_catalog(fh, args.only or tuple(COLLECTIONS), args.batch_size, report)
+        else:
+            src = contextlib.nullcontext(sys.stdin) if args.path == "-" else open_path(args.path, "r")
+            with src as fh:
+                stats = import_catalog(fh, args.batch_size, report)
+
+    except PyMongoError as e:
+        if isinstance(e, mongo_health.CONNECTIVITY_ERRORS):
+            mongo_health.record_failure(e)
+        print(f"\nMongoDB error: {e}", file=sys.stderr)
+        return 1
+
+    report(stats)
+    print(file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
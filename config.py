@@ -1,5 +1,7 @@
 # file: config.py
 
+import hashlib
+import json
 import os
 from dotenv import load_dotenv
 
@@ -8,27 +10,27 @@ load_dotenv()
 
 
 # ================= REQUIRED VARS =================
+# checked by validate() when the app is wired, not at import
 REQUIRED_VARS = [
     "BOT_TOKEN",
     "ADMIN_ID",
     "BOT_USERNAME",
     "MONGODB_URI",
     "STORAGE_CHAT_ID",
-    "DISCORD_WEBHOOK_STATUS"
 ]
 
-missing = [var for var in REQUIRED_VARS if not os.getenv(var)]
-
-if missing:
-    raise ValueError(f"Missing environment variables: {missing}")
-
 
 # ================= ENV VARIABLES =================
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 BOT_USERNAME = os.getenv("BOT_USERNAME")
 
-ADMIN_ID = int(os.getenv("ADMIN_ID"))
-STORAGE_CHAT_ID = int(os.getenv("STORAGE_CHAT_ID"))
+ADMIN_ID = int(os.getenv("ADMIN_ID") or 0)
+# comma separated; more admins of the primary bot besides ADMIN_ID
+ADMIN_IDS = [int(a) for a in os.getenv("ADMIN_IDS", "").split(",") if a.strip()]
+STORAGE_CHAT_ID = int(os.getenv("STORAGE_CHAT_ID") or 0)
+
+# more bots on the same catalog, served by this process (see tenants.py)
+EXTRA_BOTS = os.getenv("EXTRA_BOTS", "")
 
 MONGODB_URI = os.getenv("MONGODB_URI")
 
@@ -36,21 +38,182 @@ DISCORD_WEBHOOK_STATUS = os.getenv("DISCORD_WEBHOOK_STATUS")
 DISCORD_WEBHOOK_LIST_LOGS = os.getenv("DISCORD_WEBHOOK_LIST_LOGS")
 DISCORD_WEBHOOK_FILE_ACCESS = os.getenv("DISCORD_WEBHOOK_FILE_ACCESS")
 
+# overridable so benchmarks can point at local stand-ins
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+DISCORD_WEBHOOK_PREFIX = os.getenv("DISCORD_WEBHOOK_PREFIX", "https://discord.com/api/webhooks/")
+
+
+# ================= MONGO HEALTH =================
+# consecutive failed queries before the circuit opens
+MONGO_FAILURE_THRESHOLD = int(os.getenv("MONGO_FAILURE_THRESHOLD", 3))
+# seconds an open circuit waits before letting a trial query through
+MONGO_RECOVERY_TIMEOUT = int(os.getenv("MONGO_RECOVERY_TIMEOUT", 30))
+# ping interval while healthy / fastest ping interval while degraded
+MONGO_PROBE_INTERVAL = int(os.getenv("MONGO_PROBE_INTERVAL", 60))
+MONGO_PROBE_MIN_INTERVAL = int(os.getenv("MONGO_PROBE_MIN_INTERVAL", 5))
+
+
+# ================= MONGO CLIENT =================
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 50))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 2))
+MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", 60000))
+# comma separated; zstd/snappy need their extra packages installed
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "zlib")
+# read preference for hot lookups (token -> file_id)
+MONGO_HOT_READ_PREFERENCE = os.getenv("MONGO_HOT_READ_PREFERENCE", "secondaryPreferred")
+# write concern for counters / user upserts / sent-file records (0 = fire and forget)
+MONGO_TELEMETRY_W = int(os.getenv("MONGO_TELEMETRY_W", 1))
+
+
+# ================= LOGGING =================
+# comma separated sinks: "discord", "jsonl" (see logsinks.py)
+LOG_SINKS = os.getenv("LOG_SINKS", "discord").lower()
+# info / warning / error; DISCORD_LOG_LEVEL overrides it for Discord only
+LOG_LEVEL = os.getenv("LOG_LEVEL", "info").lower()
+DISCORD_LOG_LEVEL = os.getenv("DISCORD_LOG_LEVEL", LOG_LEVEL).lower()
+# "-" writes JSON lines to stdout
+LOG_JSONL_PATH = os.getenv("LOG_JSONL_PATH", "-")
+
+
+# ================= ANALYTICS =================
+# raw access events are kept this long; the hourly/daily rollups forever
+ACCESS_EVENT_RETENTION_DAYS = int(os.getenv("ACCESS_EVENT_RETENTION_DAYS", 90))
+
+
+# ================= TELEGRAM BUDGET =================
+# outbound Bot API calls per second shared by all lanes (0 = unlimited)
+TELEGRAM_RATE = float(os.getenv("TELEGRAM_RATE", 30))
+TELEGRAM_BURST = float(os.getenv("TELEGRAM_BURST", 30))
+# keep-alive connections to the Bot API, shared by all bots in the process
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", 50))
+# background (bulk) calls wait while interactive calls queue longer than
+# this for a token, but never more than BULK_MAX_DEFER_SECONDS
+INTERACTIVE_SLO_MS = int(os.getenv("INTERACTIVE_SLO_MS", 500))
+BULK_MAX_DEFER_SECONDS = float(os.getenv("BULK_MAX_DEFER_SECONDS", 30))
+
+
+# ================= WEBHOOK =================
+# minimum gap between accepted webhook requests (0 disables the gate)
+WEBHOOK_MIN_INTERVAL = float(os.getenv("WEBHOOK_MIN_INTERVAL", 0.05))
+def derive_webhook_secret(token):
+    return hashlib.sha256(f"webhook:{token}".encode()).hexdigest() if token else None
+
+
+# sent by Telegram in X-Telegram-Bot-Api-Secret-Token; derived from the
+# bot token unless set ([A-Za-z0-9_-], up to 256 chars)
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or derive_webhook_secret(BOT_TOKEN)
+# concurrent HTTPS connections Telegram opens to us (1-100)
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", 40))
+# larger bodies are rejected before they are parsed
+WEBHOOK_MAX_BODY = int(os.getenv("WEBHOOK_MAX_BODY", 256 * 1024))
+
+
+# ================= SHUTDOWN =================
+# how long a stopping process waits for in-flight updates (Render allows 30s)
+SHUTDOWN_GRACE_SECONDS = float(os.getenv("SHUTDOWN_GRACE_SECONDS", 20))
+
+
+# ================= AUTO DELETE =================
+# due deletes are drained at most this often, so deliveries expiring close
+# together share deleteMessages calls (and may be removed this much late)
+DELETE_COALESCE_SECONDS = float(os.getenv("DELETE_COALESCE_SECONDS", 2))
+
+
+# ================= INGESTION =================
+# "webhook" (default) or "polling" (getUpdates, no public HTTPS needed)
+INGESTION_MODE = os.getenv("INGESTION_MODE", "webhook").lower()
+POLL_BATCH_LIMIT = int(os.getenv("POLL_BATCH_LIMIT", 100))
+POLL_TIMEOUT = int(os.getenv("POLL_TIMEOUT", 30))
+POLL_WORKERS = int(os.getenv("POLL_WORKERS", 8))
+
+
+# ================= BACKGROUND JOBS =================
+# webhook setup, startup report, Mongo monitor and restart cleanup run once
+# per deployment:
+#   leader   - workers elect one leader (default)
+#   inline   - every process runs them (single-process deployments)
+#   external - only `python scheduler.py` runs them
+BACKGROUND_JOBS = os.getenv("BACKGROUND_JOBS", "leader").lower()
+# "file" (flock, one host) or "mongo" (lease document, many hosts)
+LEADER_BACKEND = os.getenv("LEADER_BACKEND", "file").lower()
+LEADER_LEASE_SECONDS = int(os.getenv("LEADER_LEASE_SECONDS", 30))
+LEADER_LOCK_FILE = os.getenv("LEADER_LOCK_FILE", "/tmp/rypera-leader.lock")
+# a running broadcast whose owner has not checkpointed for this long is
+# taken over by the leader
+BROADCAST_LEASE_SECONDS = int(os.getenv("BROADCAST_LEASE_SECONDS", 120))
+
+
+# ================= METRICS =================
+# shared directory for per-worker metric snapshots under gunicorn
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR") or os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+
+# ================= HEALTH =================
+# seconds between background health samples (CPU, RSS, Mongo ping, rates)
+HEALTH_INTERVAL = int(os.getenv("HEALTH_INTERVAL", 15))
+
+
+# ================= TRACING =================
+# per-update span recording; /profile arms it temporarily even when off
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+SLOW_UPDATE_MS = int(os.getenv("SLOW_UPDATE_MS", 2000))
+SLOW_TRACE_BUFFER = int(os.getenv("SLOW_TRACE_BUFFER", 50))
+# GET /debug/slow needs it in the X-Debug-Token header; unset disables it
+DEBUG_TOKEN = os.getenv("DEBUG_TOKEN")
+
 
 # ================= OPTIONAL VALIDATION =================
 def validate_webhook(url):
-    return url and url.startswith("https://discord.com/api/webhooks/")
+    return url and url.startswith(DISCORD_WEBHOOK_PREFIX)
+
+
+def parse_extra_bots():
+    return json.loads(EXTRA_BOTS) if EXTRA_BOTS.strip() else []
+
+
+def validate_extra_bots():
+    try:
+        bots = parse_extra_bots()
+    except ValueError:
+        raise ValueError("EXTRA_BOTS is not valid JSON")
+
+    if not isinstance(bots, list):
+        raise ValueError("EXTRA_BOTS must be a JSON list")
+
+    tokens = {BOT_TOKEN}
+
+    for entry in bots:
+        if not isinstance(entry, dict) or not entry.get("token") or not entry.get("username"):
+            raise ValueError("Every EXTRA_BOTS entry needs a token and a username")
+
+        if entry["token"] in tokens:
+            raise ValueError("EXTRA_BOTS repeats a bot token")
+        tokens.add(entry["token"])
+
+
+def validate():
+    """
+    Fail fast on a broken environment. Called by main.create_app() and
+    the other entry points, so importing config stays side-effect free.
+    """
+
+    missing = [var for var in REQUIRED_VARS if not os.getenv(var)]
+
+    if missing:
+        raise ValueError(f"Missing environment variables: {missing}")
 
+    # Discord is only required while it is a log sink
+    if "discord" in LOG_SINKS and not validate_webhook(DISCORD_WEBHOOK_STATUS):
+        raise ValueError("Missing or invalid DISCORD_WEBHOOK_STATUS")
 
-if not validate_webhook(DISCORD_WEBHOOK_STATUS):
-    raise ValueError("Invalid DISCORD_WEBHOOK_STATUS")
+    validate_extra_bots()
 
-# optional (no crash if missing)
-if DISCORD_WEBHOOK_LIST_LOGS and not validate_webhook(DISCORD_WEBHOOK_LIST_LOGS):
-    print("⚠️ Invalid LIST_LOGS webhook")
+    # optional (no crash if missing)
+    if DISCORD_WEBHOOK_LIST_LOGS and not validate_webhook(DISCORD_WEBHOOK_LIST_LOGS):
+        print("⚠️ Invalid LIST_LOGS webhook")
 
-if DISCORD_WEBHOOK_FILE_ACCESS and not validate_webhook(DISCORD_WEBHOOK_FILE_ACCESS):
-    print("⚠️ Invalid FILE_ACCESS webhook")
+    if DISCORD_WEBHOOK_FILE_ACCESS and not validate_webhook(DISCORD_WEBHOOK_FILE_ACCESS):
+        print("⚠️ Invalid FILE_ACCESS webhook")
 
 
 # ================= EMBED CONFIG =================
@@ -1,11 +1,28 @@
 # file: database.py
 
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, DuplicateKeyError
-from config import MONGODB_URI, ADMIN_ID
+from pymongo import MongoClient, ReadPreference, ReturnDocument, UpdateOne
+from pymongo.errors import CollectionInvalid, ConnectionFailure, DuplicateKeyError, OperationFailure, PyMongoError
+from pymongo.write_concern import WriteConcern
+from config import (
+    MONGODB_URI, ADMIN_ID,
+    MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_MAX_IDLE_MS,
+    MONGO_COMPRESSORS, MONGO_HOT_READ_PREFERENCE, MONGO_TELEMETRY_W,
+    ACCESS_EVENT_RETENTION_DAYS, BROADCAST_LEASE_SECONDS
+)
 from webhook import log_to_discord
+import mongo_health
+import metrics
+import telegram_client
+import tenants
+import tracing
+import copy
+import functools
+import os
+import socket
+import threading
 import time
 import secrets
+from datetime import datetime, timezone
 import string
 
 
@@ -25,270 +42,960 @@ def generate_unique_token():
 
 
 # ================= MONGODB SETUP =================
-MONGO_AVAILABLE = True
-max_retries = 5
+# Handles are lazy singletons: the MongoClient (and its monitor threads,
+# DNS lookups for mongodb+srv) is only built on first use, so importing
+# this module does no I/O. mongo_health decides whether queries may run.
+class Lazy:
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+        self._lock = threading.Lock()
+
+    def resolve(self):
+        if self._target is None:
+            with self._lock:
+                if self._target is None:
+                    self._target = self._factory()
+        return self._target
+
+    def __getattr__(self, name):
+        return getattr(self.resolve(), name)
+
+    def __getitem__(self, name):
+        return self.resolve()[name]
+
+
+def create_client():
+    return MongoClient(
+        MONGODB_URI,
+        serverSelectionTimeoutMS=5000,
+        connectTimeoutMS=5000,
+        maxPoolSize=MONGO_MAX_POOL_SIZE,
+        minPoolSize=MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=MONGO_MAX_IDLE_MS,
+        compressors=MONGO_COMPRESSORS,
+        retryReads=True,
+        retryWrites=True
+    )
+
+
+client = Lazy(create_client)
+
+db = Lazy(lambda: client['telegram_bot'])
+movies_collection = Lazy(lambda: db['movies'])
+users_collection = Lazy(lambda: db['users'])
+sent_files_collection = Lazy(lambda: db['sent_files'])
+
+
+# ================= WORKLOAD PROFILES =================
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+DB_PROFILES = {
+    # token lookups on /start: tolerate replication lag, spread load
+    "hot_read": {
+        "read_preference": READ_PREFERENCES.get(
+            MONGO_HOT_READ_PREFERENCE, ReadPreference.SECONDARY_PREFERRED
+        ),
+    },
+    # counters, user upserts, sent-file records: losing one is harmless
+    "telemetry": {
+        "write_concern": WriteConcern(w=MONGO_TELEMETRY_W),
+    },
+    # admin edits to the catalog must survive a failover
+    "catalog": {
+        "read_preference": ReadPreference.PRIMARY,
+        "write_concern": WriteConcern(w="majority"),
+    },
+}
+
+
+def profiled(collection, profile):
+    return collection.with_options(**DB_PROFILES[profile])
+
+
+movies_hot = Lazy(lambda: profiled(movies_collection, "hot_read"))
+movies_catalog = Lazy(lambda: profiled(movies_collection, "catalog"))
+movies_telemetry = Lazy(lambda: profiled(movies_collection, "telemetry"))
+users_telemetry = Lazy(lambda: profiled(users_collection, "telemetry"))
+sent_files_telemetry = Lazy(lambda: profiled(sent_files_collection, "telemetry"))
+leases_collection = Lazy(lambda: profiled(db['leases'], "catalog"))
+broadcasts_collection = Lazy(lambda: profiled(db['broadcasts'], "catalog"))
+# process-wide settings every worker must agree on (ingestion mode, offset)
+settings_collection = Lazy(lambda: profiled(db['settings'], "catalog"))
+# analytics: raw access events plus the rollups every query reads
+access_events = Lazy(lambda: profiled(db['access_events'], "telemetry"))
+movie_hourly = Lazy(lambda: profiled(db['movie_hourly'], "telemetry"))
+user_daily = Lazy(lambda: profiled(db['user_daily'], "telemetry"))
+
+
+def ping():
+    client.admin.command("ping")
+
+
+def ensure_indexes():
+    sent_files_collection.create_index([("chat_id", 1), ("file_message_id", 1)])
+    users_collection.create_index([("user_id", 1)], unique=True)
+    # broadcast segments: recently active / accessed a movie
+    users_collection.create_index([("last_seen", -1)])
+    users_collection.create_index([("movies", 1), ("_id", 1)])
+    movies_collection.create_index([("name", 1)], unique=True)
+    movies_collection.create_index(
+        [("token", 1)],
+        unique=True,
+        partialFilterExpression={"token": {"$exists": True}}
+    )
+    # re-upload detection; not unique so a legacy duplicate cannot block startup
+    movies_collection.create_index(
+        [("file_unique_id", 1)],
+        partialFilterExpression={"file_unique_id": {"$exists": True}}
+    )
+    create_access_events()
+    movie_hourly.create_index([("movie", 1), ("hour", 1)], unique=True)
+    movie_hourly.create_index([("hour", -1)])
+    user_daily.create_index([("user_id", 1), ("day", 1)], unique=True)
+    user_daily.create_index([("day", -1)])
+
+
+def create_access_events():
+    # time-series collection (MongoDB 5.0+); elsewhere a plain one with a TTL index
+    if "access_events" in db.list_collection_names():
+        return
+
+    retention = ACCESS_EVENT_RETENTION_DAYS * 86400
 
-for attempt in range(max_retries):
     try:
-        client = MongoClient(
-            MONGODB_URI,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=5000
+        db.create_collection(
+            "access_events",
+            timeseries={"timeField": "ts", "metaField": "movie", "granularity": "minutes"},
+            expireAfterSeconds=retention
         )
+    except CollectionInvalid:
+        pass  # created by another worker meanwhile
+    except (OperationFailure, NotImplementedError):
+        # server or driver without time-series support
+        access_events.create_index([("ts", 1)], expireAfterSeconds=retention)
 
-        client.server_info()
-
-        db = client['telegram_bot']
-        movies_collection = db['movies']
-        users_collection = db['users']
-        sent_files_collection = db['sent_files']
-
-        # indexes
-        sent_files_collection.create_index([("chat_id", 1), ("file_message_id", 1)])
-        users_collection.create_index([("user_id", 1)], unique=True)
-        movies_collection.create_index([("name", 1)], unique=True)
-        movies_collection.create_index(
-    [("token", 1)],
-    unique=True,
-    partialFilterExpression={"token": {"$exists": True}}
-)
 
-        log_to_discord("MongoDB connected", "status", "info")
-        break
+def connect(max_retries=5):
+    for attempt in range(max_retries):
+        try:
+            ping()
+            ensure_indexes()
+            mongo_health.record_success()
 
-    except ConnectionFailure as e:
-        MONGO_AVAILABLE = False
+            log_to_discord("MongoDB connected", "status", "info")
+            load_movies()  # warm the catalog cache
+            return True
 
-        if attempt == max_retries - 1:
-            log_to_discord("MongoDB connection failed", "status", "error")
+        except PyMongoError as e:
+            mongo_health.record_failure(e)
 
-            try:
-                from bot import send_message
-                send_message(ADMIN_ID, "❌ MongoDB connection failed")
-            except:
-                pass
+            if attempt == max_retries - 1:
+                log_to_discord("MongoDB connection failed", "status", "error")
+
+                try:
+                    telegram_client.call(
+                        "sendMessage",
+                        {"chat_id": ADMIN_ID, "text": "❌ MongoDB connection failed"}
+                    )
+                except:
+                    pass
 
-            raise
+                # keep serving from the cache; the monitor will recover
+                return False
 
-        time.sleep(5)
+            time.sleep(5)
+
+
+@mongo_health.on_recovery
+def _after_recovery():
+    ensure_indexes()
+    load_movies()
+
+
+def monitor_mongo(should_probe=None):
+    mongo_health.run_monitor(ping, should_probe)
 
 
 # ================= DB STATUS =================
 def is_db_available():
-    return MONGO_AVAILABLE
+    return mongo_health.is_available()
+
+
+def db_call(default=None, degraded=None):
+    """
+    Route a query through the circuit breaker. While the circuit is open
+    (or the query fails) `degraded` is served if given, else a copy of
+    `default`.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            def fallback():
+                if degraded:
+                    return degraded(*args, **kwargs)
+                return copy.copy(default)
+
+            if not mongo_health.allow_request():
+                metrics.inc("db_queries_total", query=func.__name__, outcome="short_circuit")
+                return fallback()
+
+            started = time.perf_counter()
+            outcome = "ok"
+
+            try:
+                with tracing.span("db", func.__name__):
+                    result = func(*args, **kwargs)
+            except mongo_health.CONNECTIVITY_ERRORS as e:
+                outcome = "failed"
+                mongo_health.record_failure(e)
+                log_to_discord(
+                    "DB query failed",
+                    "status",
+                    "warning",
+                    fields={"query": func.__name__, "error": str(e)}
+                )
+                return fallback()
+            except Exception as e:
+                # includes application errors (DuplicateKeyError, WriteError):
+                # the breaker is left alone
+                outcome = "error"
+                log_to_discord(
+                    "DB query error",
+                    "status",
+                    "warning",
+                    fields={"query": func.__name__, "error": str(e)}
+                )
+                return copy.copy(default)
+            finally:
+                metrics.observe("db_query_seconds", time.perf_counter() - started, query=func.__name__)
+                metrics.inc("db_queries_total", query=func.__name__, outcome=outcome)
+
+            mongo_health.record_success()
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+# ================= CATALOG CACHE =================
+# last known catalog, used to keep /start links working while degraded
+CATALOG_CACHE = {}   # name -> {"file_id", "token", "file_ids", "source"}
+TOKEN_INDEX = {}     # token -> name
+_cache_lock = threading.Lock()
+
+# what delivery needs: the primary's file_id, the link token and what
+# other bots use to find their own file_id (see media.file_id_for)
+CACHE_FIELDS = ("file_id", "token", "file_ids", "source")
+
+
+def _cache_movie(name, movie):
+    token = movie.get("token")
+
+    with _cache_lock:
+        old = CATALOG_CACHE.get(name)
+        if old and old.get("token"):
+            TOKEN_INDEX.pop(old["token"], None)
+
+        CATALOG_CACHE[name] = {k: movie[k] for k in CACHE_FIELDS if movie.get(k)}
+        if token:
+            TOKEN_INDEX[token] = name
+
+
+def _uncache_movie(name):
+    with _cache_lock:
+        old = CATALOG_CACHE.pop(name, None)
+        if old and old.get("token"):
+            TOKEN_INDEX.pop(old["token"], None)
+
+
+def _replace_cache(movies):
+    with _cache_lock:
+        CATALOG_CACHE.clear()
+        TOKEN_INDEX.clear()
+
+        for name, movie in movies.items():
+            CATALOG_CACHE[name] = dict(movie)
+            if movie.get("token"):
+                TOKEN_INDEX[movie["token"]] = name
+
+
+def cached_movies(*_):
+    with _cache_lock:
+        return {name: dict(movie) for name, movie in CATALOG_CACHE.items()}
+
+
+def cached_movie_by_token(token):
+    with _cache_lock:
+        name = TOKEN_INDEX.get(token)
+        if not name:
+            return None
+
+        return dict(CATALOG_CACHE[name], name=name)
 
 
 # ================= MOVIES =================
+@db_call(default={}, degraded=cached_movies)
 def load_movies():
-    if not MONGO_AVAILABLE:
-        return {}
+    movies = {
+        doc['name']: {k: doc[k] for k in CACHE_FIELDS if doc.get(k)}
+        for doc in movies_collection.find(
+            {}, {"name": 1, "_id": 0, **{k: 1 for k in CACHE_FIELDS}}
+        )
+    }
 
-    try:
-        return {
-            doc['name']: {
-                "file_id": doc['file_id'],
-                "token": doc.get("token")
-            }
-            for doc in movies_collection.find(
-                {}, {"name": 1, "file_id": 1, "token": 1, "_id": 0}
-            )
-        }
-    except Exception as e:
-        log_to_discord("Load movies failed", "status", "error")
-        return {}
+    _replace_cache(movies)
+    return movies
 
 
-def save_movie(name, file_id):
-    if not name or not file_id or not MONGO_AVAILABLE:
+@db_call()
+def save_movie(name, file_id, metadata=None):
+    if not name or not file_id:
         return None
 
-    try:
-        token = generate_unique_token()
+    token = generate_unique_token()
 
-        movies_collection.update_one(
+    # size, mime type, duration, file_unique_id... from the upload payload
+    fields = {k: v for k, v in (metadata or {}).items() if k != "file_id"}
+    fields.update({"file_id": file_id, "token": token, "file_status": "ok"})
+
+    try:
+        movies_catalog.update_one(
             {"name": name},
-            {
-                "$set": {
-                    "file_id": file_id,
-                    "token": token
-                },
-                "$setOnInsert": {"access_count": 0}
-            },
+            dict(_file_update(fields), **{"$setOnInsert": {"access_count": 0}}),
             upsert=True
         )
 
-        return token
-
     except DuplicateKeyError:
-        return save_movie(name, file_id)
+        return save_movie(name, file_id, metadata)
+
+    _cache_movie(name, fields)
+    return token
 
-    except Exception as e:
-        log_to_discord("Save movie failed", "status", "error")
-        return None
 
+def _file_update(fields):
+    # other bots' file_ids and the source message belong to the old file
+    # when a name gets a new one
+    update = {"$set": fields}
+    stale = {k: "" for k in ("file_ids", "source") if k not in fields}
 
+    if stale:
+        update["$unset"] = stale
+
+    return update
+
+
+@db_call(degraded=lambda token: cached_movie_by_token(token) if token else None)
 def get_movie_by_token(token):
-    if not token or not MONGO_AVAILABLE:
+    if not token:
         return None
 
-    try:
-        return movies_collection.find_one({"token": token})
-    except:
-        return None
+    movie = movies_hot.find_one({"token": token})
 
+    # a link generated moments ago may not have replicated yet
+    if not movie and movies_hot.read_preference != ReadPreference.PRIMARY:
+        movie = movies_catalog.find_one({"token": token})
 
-def delete_movie(name):
-    if not MONGO_AVAILABLE:
-        return
+    if movie:
+        _cache_movie(movie["name"], movie)
 
-    try:
-        movies_collection.delete_one({"name": name})
-    except:
-        pass
+    return movie
+
+
+@db_call()
+def delete_movie(name):
+    movies_catalog.delete_one({"name": name})
+    _uncache_movie(name)
 
 
+@db_call(default=False)
 def rename_movie(old_name, new_name):
-    if not MONGO_AVAILABLE:
+    movie = movies_catalog.find_one({"name": old_name})
+
+    if not movie:
         return False
 
-    try:
-        movie = movies_collection.find_one({"name": old_name})
+    movies_catalog.delete_one({"name": old_name})
+
+    # keep token, counters and file metadata
+    movie.pop("_id", None)
+    movies_catalog.insert_one(dict(movie, name=new_name))
+
+    _uncache_movie(old_name)
+    _cache_movie(new_name, movie)
+    return True
 
-        if not movie:
-            return False
 
-        movies_collection.delete_one({"name": old_name})
+# ================= FILE METADATA =================
+@db_call()
+def find_movie_by_unique_id(file_unique_id):
+    if not file_unique_id:
+        return None
+    return movies_catalog.find_one(
+        {"file_unique_id": file_unique_id},
+        {"name": 1, "token": 1, "file_status": 1}
+    )
 
-        movies_collection.insert_one({
-            "name": new_name,
-            "file_id": movie["file_id"],
-            "token": movie.get("token"),
-            "access_count": movie.get("access_count", 0)
-        })
 
-        return True
+@db_call(default=False)
+def refresh_movie_file(name, metadata):
+    # a re-upload of a file whose stored file_id went stale
+    fields = dict(metadata, file_status="ok", validated_at=time.time())
+    movie = movies_catalog.find_one_and_update({"name": name}, _file_update(fields))
 
-    except:
+    if not movie:
         return False
 
+    _cache_movie(name, dict(fields, token=movie.get("token")))
+    return True
+
+
+@db_call()
+def save_bot_file_id(name, bot_id, file_id):
+    movies_catalog.update_one({"name": name}, {"$set": {f"file_ids.{bot_id}": file_id}})
+
+    with _cache_lock:
+        if name in CATALOG_CACHE:
+            CATALOG_CACHE[name].setdefault("file_ids", {})[bot_id] = file_id
+
+
+@db_call()
+def forget_bot_file_id(bot_id, file_id):
+    # the bot resolves the file again on its next delivery
+    movies_catalog.update_many(
+        {f"file_ids.{bot_id}": file_id},
+        {"$unset": {f"file_ids.{bot_id}": ""}}
+    )
+
+    with _cache_lock:
+        for movie in CATALOG_CACHE.values():
+            if (movie.get("file_ids") or {}).get(bot_id) == file_id:
+                del movie["file_ids"][bot_id]
+
+
+@db_call()
+def save_movie_source(name, source):
+    movies_catalog.update_one({"name": name}, {"$set": {"source": source}})
+
+    with _cache_lock:
+        if name in CATALOG_CACHE:
+            CATALOG_CACHE[name]["source"] = source
+
+
+@db_call(default=[])
+def get_catalog_file_ids():
+    # files already known to be invalid wait for a re-upload, not a check
+    return movies_collection.distinct("file_id", {"file_status": {"$ne": "invalid"}})
+
+
+@db_call(default=[])
+def set_file_status(file_id, status):
+    # returns the names of the movies whose status changed; movies that
+    # already have it are not written
+    query = {"file_id": file_id, "file_status": {"$ne": status}}
+    names = [m["name"] for m in movies_catalog.find(query, {"name": 1})]
+
+    if names:
+        movies_catalog.update_many(query, {"$set": {"file_status": status, "validated_at": time.time()}})
+
+    return names
+
 
 # ================= ACCESS =================
+@db_call()
 def increment_movie_access(name):
-    if not MONGO_AVAILABLE:
-        return
-
-    try:
-        movies_collection.update_one(
-            {"name": name},
-            {"$inc": {"access_count": 1}},
-            upsert=True
-        )
-    except:
-        pass
+    movies_telemetry.update_one(
+        {"name": name},
+        {"$inc": {"access_count": 1}},
+        upsert=True
+    )
 
 
+@db_call(default=[])
 def get_top_movies(limit=5):
-    if not MONGO_AVAILABLE:
-        return []
-
-    try:
-        return list(
-            movies_collection
-            .find({}, {"name": 1, "access_count": 1, "_id": 0})
-            .sort("access_count", -1)
-            .limit(limit)
-        )
-    except:
-        return []
+    return list(
+        movies_collection
+        .find({}, {"name": 1, "access_count": 1, "_id": 0})
+        .sort("access_count", -1)
+        .limit(limit)
+    )
 
 
 # ================= USERS =================
 def add_user(user_id, display_name):
-    if not MONGO_AVAILABLE:
+    record_activity(user_id, display_name=display_name)
+
+
+# ================= USER ACTIVITY =================
+# last_seen, access history and un-blocking are written behind: updates for
+# the same user are merged and flushed as one unordered bulk_write
+ACTIVITY_FLUSH_SECONDS = 5
+ACCESS_HISTORY_LIMIT = 20
+
+_activity = {}  # user_id -> pending update
+_events = []    # (user_id, movie, at) for the analytics store
+_activity_lock = threading.Lock()
+_activity_worker = {"thread": None}
+
+
+def record_activity(user_id, display_name=None, movie=None):
+    now = time.time()
+
+    with _activity_lock:
+        entry = _activity.setdefault(user_id, {"accesses": [], "bots": set()})
+        entry["last_seen"] = now
+        entry["bots"].add(tenants.scope())
+
+        if display_name:
+            entry["display_name"] = display_name
+
+        if movie:
+            entry["accesses"].append({"movie": movie, "at": now})
+            _events.append((user_id, movie, now))
+
+        _ensure_activity_worker()
+
+
+def record_access_event(user_id, movie):
+    # analytics only; for callers that update the user document themselves
+    with _activity_lock:
+        _events.append((user_id, movie, time.time()))
+        _ensure_activity_worker()
+
+
+def _ensure_activity_worker():
+    # caller holds _activity_lock
+    if _activity_worker["thread"] is None:
+        _activity_worker["thread"] = threading.Thread(target=_activity_loop, daemon=True)
+        _activity_worker["thread"].start()
+
+
+def _activity_loop():
+    while True:
+        time.sleep(ACTIVITY_FLUSH_SECONDS)
+        flush_activity()
+
+
+def flush_activity():
+    with _activity_lock:
+        pending = dict(_activity)
+        _activity.clear()
+        events = list(_events)
+        _events.clear()
+
+    if events:
+        flush_access_events(events)
+
+    if not pending:
         return
 
-    try:
-        users_collection.update_one(
-            {"user_id": user_id},
-            {"$set": {"user_id": user_id, "display_name": display_name}},
-            upsert=True
+    ops = []
+
+    for user_id, entry in pending.items():
+        fields = {"user_id": user_id, "last_seen": entry["last_seen"]}
+
+        if "display_name" in entry:
+            fields["display_name"] = entry["display_name"]
+
+        update = audience_update({"$set": fields}, entry["bots"])
+
+        if entry["accesses"]:
+            update.setdefault("$addToSet", {})["movies"] = {
+                "$each": [a["movie"] for a in entry["accesses"]]
+            }
+            update["$push"] = {
+                "history": {"$each": entry["accesses"], "$slice": -ACCESS_HISTORY_LIMIT}
+            }
+
+        ops.append(UpdateOne({"user_id": user_id}, update, upsert=True))
+
+    # activity is telemetry: a batch lost to an outage is not retried
+    _write_activity(ops)
+
+
+@db_call()
+def _write_activity(ops):
+    users_telemetry.bulk_write(ops, ordered=False)
+
+
+# ================= ANALYTICS =================
+# Every access becomes a compact event in access_events (kept for
+# ACCESS_EVENT_RETENTION_DAYS) and an $inc on two rollups: movie_hourly
+# {movie, hour, count} and user_daily {user_id, day, count}. Analytics
+# queries only read the rollups, so their cost does not grow with history.
+HOUR = 3600
+DAY = 86400
+
+
+def flush_access_events(events):
+    hourly = {}
+    daily = {}
+
+    for user_id, movie, at in events:
+        hour_key = (movie, int(at // HOUR * HOUR))
+        day_key = (user_id, int(at // DAY * DAY))
+        hourly[hour_key] = hourly.get(hour_key, 0) + 1
+        daily[day_key] = daily.get(day_key, 0) + 1
+
+    _write_access_events(
+        [
+            {"ts": datetime.fromtimestamp(at, timezone.utc), "movie": movie, "user_id": user_id}
+            for user_id, movie, at in events
+        ],
+        [
+            UpdateOne({"movie": movie, "hour": hour}, {"$inc": {"count": count}}, upsert=True)
+            for (movie, hour), count in hourly.items()
+        ],
+        [
+            UpdateOne({"user_id": user_id, "day": day}, {"$inc": {"count": count}}, upsert=True)
+            for (user_id, day), count in daily.items()
+        ]
+    )
+
+
+@db_call()
+def _write_access_events(docs, hourly_ops, daily_ops):
+    access_events.insert_many(docs, ordered=False)
+    movie_hourly.bulk_write(hourly_ops, ordered=False)
+    user_daily.bulk_write(daily_ops, ordered=False)
+
+
+@db_call(default=0)
+def get_access_count(since):
+    result = list(movie_hourly.aggregate([
+        {"$match": {"hour": {"$gte": int(since // HOUR * HOUR)}}},
+        {"$group": {"_id": None, "count": {"$sum": "$count"}}},
+    ]))
+    return result[0]["count"] if result else 0
+
+
+@db_call(default=[])
+def get_hourly_load(since):
+    # [(hour, accesses)] oldest first
+    return [
+        (r["_id"], r["count"])
+        for r in movie_hourly.aggregate([
+            {"$match": {"hour": {"$gte": int(since // HOUR * HOUR)}}},
+            {"$group": {"_id": "$hour", "count": {"$sum": "$count"}}},
+            {"$sort": {"_id": 1}},
+        ])
+    ]
+
+
+@db_call(default=[])
+def get_top_movies_since(since, limit=5):
+    return [
+        (r["_id"], r["count"])
+        for r in movie_hourly.aggregate([
+            {"$match": {"hour": {"$gte": int(since // HOUR * HOUR)}}},
+            {"$group": {"_id": "$movie", "count": {"$sum": "$count"}}},
+            {"$sort": {"count": -1}},
+            {"$limit": limit},
+        ])
+    ]
+
+
+@db_call(default=([], 0))
+def get_top_users_since(since, limit=5):
+    """
+    ([(user_id, display_name, accesses)], active user count) from the
+    per-day rollup.
+    """
+
+    result = list(user_daily.aggregate([
+        {"$match": {"day": {"$gte": int(since // DAY * DAY)}}},
+        {"$group": {"_id": "$user_id", "count": {"$sum": "$count"}}},
+        {"$facet": {
+            "top": [{"$sort": {"count": -1}}, {"$limit": limit}],
+            "total": [{"$count": "users"}],
+        }},
+    ]))
+
+    facet = result[0] if result else {"top": [], "total": []}
+    top = facet["top"]
+
+    names = {
+        u["user_id"]: u.get("display_name")
+        for u in users_collection.find(
+            {"user_id": {"$in": [r["_id"] for r in top]}},
+            {"user_id": 1, "display_name": 1, "_id": 0}
         )
-    except:
-        pass
+    }
 
+    active = facet["total"][0]["users"] if facet["total"] else 0
+    return [(r["_id"], names.get(r["_id"]), r["count"]) for r in top], active
 
-def get_all_users():
-    if not MONGO_AVAILABLE:
-        return []
 
-    try:
-        return list(users_collection.find({}, {"user_id": 1, "_id": 0}))
-    except:
-        return []
+# ================= PER-BOT AUDIENCE =================
+# Users of the primary bot keep the single-bot "blocked" flag. Users of the
+# other bots (see tenants.py) are listed per bot id in "bots", and the bots
+# they blocked in "blocked_bots".
+def audience_update(update, scopes):
+    # user upsert: the user just reached us through these bot scopes
+    extra = sorted(scope for scope in scopes if scope)
 
+    if None in scopes:
+        update.setdefault("$set", {})["blocked"] = False
 
-def get_stats():
-    if not MONGO_AVAILABLE:
-        return {"movie_count": 0, "user_count": 0}
+    if extra:
+        update.setdefault("$addToSet", {})["bots"] = {"$each": extra}
+        update["$pull"] = {"blocked_bots": {"$in": extra}}
 
-    try:
-        return {
-            "movie_count": movies_collection.count_documents({}),
-            "user_count": users_collection.count_documents({})
-        }
-    except:
-        return {"movie_count": 0, "user_count": 0}
+    return update
+
+
+def blocked_update(scope):
+    if scope:
+        return {"$addToSet": {"blocked_bots": scope}}
+    return {"$set": {"blocked": True, "blocked_at": time.time()}}
+
+
+@db_call()
+def mark_user_blocked(user_id, scope=None):
+    users_telemetry.update_one({"user_id": user_id}, blocked_update(scope))
+
+
+# ================= SEGMENTS =================
+def segment_filter(segment=None):
+    """
+    Audience filter for broadcasts. `segment` may hold "active_days" (seen
+    in the last N days) and/or "movie" (accessed that movie), and "bot"
+    for a broadcast of a non-primary bot. Users who blocked the bot are
+    always left out.
+    """
+
+    segment = segment or {}
+
+    if segment.get("bot"):
+        query = {"bots": segment["bot"], "blocked_bots": {"$ne": segment["bot"]}}
+    else:
+        query = {"blocked": {"$ne": True}}
+
+    if segment.get("active_days"):
+        query["last_seen"] = {"$gte": time.time() - segment["active_days"] * 86400}
+
+    if segment.get("movie"):
+        query["movies"] = segment["movie"]
+
+    return query
+
+
+@db_call()
+def get_users_page(after_id=None, batch_size=500, segment=None):
+    # keyset pagination on _id; None (not []) means Mongo was unavailable
+    query = segment_filter(segment)
+
+    if after_id is not None:
+        query["_id"] = {"$gt": after_id}
+
+    return list(
+        users_collection.find(query, {"user_id": 1}).sort("_id", 1).limit(batch_size)
+    )
+
+
+def iter_users(batch_size=500, after_id=None, segment=None, retries=3, retry_seconds=5):
+    """
+    Yield user documents of a segment in _id order, holding one page in
+    memory. Pass the last seen _id as `after_id` to resume a walk.
+    Only an empty page ends the walk: while Mongo is unavailable a page
+    is retried, then ConnectionFailure is raised so a caller never takes
+    an outage for the end of the list.
+    """
+
+    failures = 0
+
+    while True:
+        page = get_users_page(after_id, batch_size, segment)
+
+        if page is None:
+            failures += 1
+
+            if failures > retries:
+                raise ConnectionFailure(f"users page after {after_id!r} unavailable")
+
+            time.sleep(retry_seconds)
+            continue
+
+        failures = 0
+
+        if not page:
+            return
+
+        yield from page
+        after_id = page[-1]["_id"]
+
+
+@db_call(default=0)
+def get_user_count(segment=None):
+    if not segment:
+        # metadata count; includes blocked users, fine for progress
+        return users_collection.estimated_document_count()
+    return users_collection.count_documents(segment_filter(segment))
+
+
+@db_call(default={"movie_count": 0, "user_count": 0})
+def get_stats():
+    # collection metadata, not a scan of every document
+    return {
+        "movie_count": movies_collection.estimated_document_count(),
+        "user_count": users_collection.estimated_document_count()
+    }
+
+
+# ================= SETTINGS =================
+@db_call()
+def get_setting(key):
+    doc = settings_collection.find_one({"_id": key})
+    return doc and doc.get("value")
+
+
+@db_call(default=False)
+def save_setting(key, value):
+    settings_collection.update_one({"_id": key}, {"$set": {"value": value}}, upsert=True)
+    return True
+
+
+# ================= BROADCASTS =================
+# the process sending a broadcast owns it and renews heartbeat_at on every
+# checkpoint; only a broadcast with a stale heartbeat may be taken over
+BROADCAST_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+@db_call()
+def create_broadcast(message, parse_mode=None, segment=None):
+    segment = dict(segment or {})
+
+    # the audience of the bot the admin asked on
+    if tenants.scope():
+        segment["bot"] = tenants.scope()
+
+    broadcast = {
+        "message": message,
+        "parse_mode": parse_mode,
+        "segment": segment,
+        "status": "running",
+        "checkpoint": None,  # _id of the last user handled
+        "sent": 0,
+        "failed": 0,
+        "owner": BROADCAST_OWNER,
+        "heartbeat_at": time.time(),
+        "created_at": time.time(),
+        "updated_at": time.time()
+    }
+
+    broadcasts_collection.insert_one(broadcast)
+    return broadcast
+
+
+@db_call()
+def save_broadcast_checkpoint(broadcast_id, checkpoint, sent, failed, status="running", release=False):
+    """
+    Save progress and renew the heartbeat. False if another process took
+    the broadcast over (the caller must stop), None if Mongo is down.
+    `release` hands it to the next claimer without waiting for the lease.
+    """
+
+    result = broadcasts_collection.update_one(
+        {"_id": broadcast_id, "owner": BROADCAST_OWNER},
+        {"$set": {
+            "checkpoint": checkpoint,
+            "sent": sent,
+            "failed": failed,
+            "status": status,
+            "heartbeat_at": 0 if release else time.time(),
+            "updated_at": time.time()
+        }}
+    )
+    return result.matched_count > 0
+
+
+@db_call()
+def claim_stale_broadcast():
+    # atomic: of two processes racing for a broadcast, one gets it
+    return broadcasts_collection.find_one_and_update(
+        {
+            "status": "running",
+            "$or": [
+                {"heartbeat_at": {"$lt": time.time() - BROADCAST_LEASE_SECONDS}},
+                {"heartbeat_at": {"$exists": False}},  # created before leases
+            ],
+        },
+        {"$set": {"owner": BROADCAST_OWNER, "heartbeat_at": time.time()}},
+        return_document=ReturnDocument.AFTER,
+    )
 
 
 # ================= FILE CLEAN =================
-def save_sent_file(chat_id, file_message_id, warning_message_id, timestamp):
-    if not MONGO_AVAILABLE:
-        return
+def sent_file_record(chat_id, file_message_id, warning_message_id, timestamp):
+    record = {
+        "chat_id": chat_id,
+        "file_message_id": file_message_id,
+        "warning_message_id": warning_message_id,
+        "timestamp": timestamp
+    }
 
-    try:
-        sent_files_collection.insert_one({
-            "chat_id": chat_id,
-            "file_message_id": file_message_id,
-            "warning_message_id": warning_message_id,
-            "timestamp": timestamp
-        })
-    except:
-        pass
+    # message ids are per bot; the restart cleanup deletes as this one
+    if tenants.scope():
+        record["bot"] = tenants.scope()
 
+    return record
 
-def get_pending_files(expiry_minutes=15):
-    if not MONGO_AVAILABLE:
-        return []
 
-    try:
-        cutoff = time.time() - (expiry_minutes * 60)
-        return list(sent_files_collection.find({"timestamp": {"$gte": cutoff}}))
-    except:
-        return []
+@db_call()
+def save_sent_file(chat_id, file_message_id, warning_message_id, timestamp):
+    sent_files_telemetry.insert_one(
+        sent_file_record(chat_id, file_message_id, warning_message_id, timestamp)
+    )
+
+
+@db_call(default=[])
+def get_pending_files(expiry_minutes=15):
+    cutoff = time.time() - (expiry_minutes * 60)
+    return list(sent_files_collection.find({"timestamp": {"$gte": cutoff}}))
 
 
+@db_call()
 def delete_sent_file_record(chat_id, file_message_id):
-    if not MONGO_AVAILABLE:
+    sent_files_telemetry.delete_one({
+        "chat_id": chat_id,
+        "file_message_id": file_message_id,
+        "bot": tenants.scope()  # None also matches records without the field
+    })
+
+
+@db_call()
+def delete_sent_file_records(records):
+    # (chat_id, file_message_id) pairs, removed in one round trip
+    by_chat = {}
+    for chat_id, file_message_id in records:
+        by_chat.setdefault(chat_id, []).append(file_message_id)
+
+    if not by_chat:
         return
 
-    try:
-        sent_files_collection.delete_one({
-            "chat_id": chat_id,
-            "file_message_id": file_message_id
-        })
-    except:
-        pass
+    # records of the current bot only (None also matches the primary's)
+    sent_files_telemetry.delete_many({
+        "bot": tenants.scope(),
+        "$or": [
+            {"chat_id": chat_id, "file_message_id": {"$in": ids}}
+            for chat_id, ids in by_chat.items()
+        ]
+    })
 
 
 # ================= DB SIZE =================
+@db_call(default=0)
 def get_db_size_mb():
-    if not MONGO_AVAILABLE:
-        return 0
+    stats = db.command("dbStats")
+    size_bytes = stats.get("dataSize", 0)
+    size_mb = size_bytes / 1024 / 1024
+    return round(size_mb, 2)
 
-    try:
-        stats = db.command("dbStats")
-        size_bytes = stats.get("dataSize", 0)
-        size_mb = size_bytes / 1024 / 1024
-        return round(size_mb, 2)
-    except:
-        return 0
\ No newline at end of file
@@ -0,0 +1,202 @@
+# file: deletions.py
+
+import heapq
+import itertools
+import threading
+import time
+
+from config import DELETE_COALESCE_SECONDS
+from database import delete_sent_file_records
+from webhook import log_to_discord
+import metrics
+import telegram_client
+import tenants
+
+
+# Telegram's cap on message_ids per deleteMessages call
+BATCH_LIMIT = 100
+
+# heap of (due_at, seq, bot scope, chat_id, file_message_id, message_ids);
+# one worker thread drains it instead of a Timer thread per delivery
+_queue = []
+_keys = set()  # (bot scope, chat_id, file_message_id) still queued
+_seq = itertools.count()
+_cond = threading.Condition()
+_worker = {"thread": None}
+
+metrics.gauge_callback("pending_auto_deletes", lambda: len(_keys))
+
+
+# ================= TELEGRAM =================
+def delete_messages(chat_id, message_ids):
+    """
+    Delete message_ids from one chat, BATCH_LIMIT per call. A rejected
+    batch is retried one message at a time so a single bad ID does not
+    keep the rest around. Returns the number of API calls made.
+    """
+
+    ids = [m for m in dict.fromkeys(message_ids) if m]
+    calls = 0
+
+    for i in range(0, len(ids), BATCH_LIMIT):
+        chunk = ids[i:i + BATCH_LIMIT]
+        calls += 1
+
+        try:
+            data = telegram_client.call(
+                "deleteMessages",
+                {"chat_id": chat_id, "message_ids": chunk}
+            )
+        except Exception as e:
+            metrics.inc("deleted_messages_total", len(chunk), outcome="failed")
+            log_to_discord(
+                "Batch delete crash",
+                "status",
+                "warning",
+                fields={"chat_id": chat_id, "error": str(e)}
+            )
+            continue
+
+        if data.get("ok"):
+            metrics.inc("deleted_messages_total", len(chunk), outcome="batched")
+            continue
+
+        for msg_id in chunk:
+            calls += 1
+
+            try:
+                data = telegram_client.call(
+                    "deleteMessage",
+                    {"chat_id": chat_id, "message_id": msg_id}
+                )
+                outcome = "single" if data.get("ok") else "failed"
+            except Exception:
+                outcome = "failed"
+
+            metrics.inc("deleted_messages_total", outcome=outcome)
+
+    return calls
+
+
+def flush(entries):
+    """
+    Delete a set of the current bot's deliveries now: message IDs are
+    grouped per chat, then the matching sent_files records go in a single
+    delete_many. `entries` are (chat_id, file_message_id, message_ids)
+    tuples. Returns (api_calls, calls_saved).
+    """
+
+    by_chat = {}
+    records = []
+
+    for chat_id, file_message_id, message_ids in entries:
+        if not isinstance(chat_id, int):
+            continue
+
+        by_chat.setdefault(chat_id, []).extend(message_ids)
+        records.append((chat_id, file_message_id))
+
+    calls = 0
+    messages = 0
+
+    for chat_id, message_ids in by_chat.items():
+        messages += len([m for m in message_ids if m])
+        calls += delete_messages(chat_id, message_ids)
+
+    delete_sent_file_records(records)
+
+    # one deleteMessage per message is what this replaced
+    saved = max(0, messages - calls)
+    metrics.inc("delete_calls_saved_total", saved)
+
+    return calls, saved
+
+
+def flush_scoped(entries):
+    """
+    flush() for deliveries of several bots: `entries` are (bot scope,
+    chat_id, file_message_id, message_ids) tuples, each group deleted as
+    its own bot. Returns (api_calls, calls_saved).
+    """
+
+    by_bot = {}
+    for scope, *entry in entries:
+        by_bot.setdefault(scope, []).append(entry)
+
+    calls = saved = 0
+
+    for scope, group in by_bot.items():
+        with tenants.use(scope):
+            group_calls, group_saved = flush(group)
+
+        calls += group_calls
+        saved += group_saved
+
+    return calls, saved
+
+
+# ================= QUEUE =================
+def schedule(chat_id, file_message_id, message_ids, delay):
+    # deleted later as the bot that sent the messages
+    scope = tenants.scope()
+
+    with _cond:
+        heapq.heappush(
+            _queue,
+            (time.time() + max(0, delay), next(_seq), scope, chat_id, file_message_id, list(message_ids))
+        )
+        _keys.add((scope, chat_id, file_message_id))
+
+        if _worker["thread"] is None:
+            _worker["thread"] = threading.Thread(target=_run, daemon=True)
+            _worker["thread"].start()
+
+        _cond.notify()
+
+
+def drain():
+    # shutdown: send the deletes already due; later ones stay in sent_files
+    return flush_scoped(_take_due(time.time()))
+
+
+def pending_count():
+    return len(_keys)
+
+
+def clear():
+    # drop queued deletes (their sent_files records stay for the next restart)
+    with _cond:
+        _queue.clear()
+        _keys.clear()
+
+
+def _take_due(now):
+    due = []
+
+    with _cond:
+        while _queue and _queue[0][0] <= now:
+            _, _, scope, chat_id, file_message_id, message_ids = heapq.heappop(_queue)
+            _keys.discard((scope, chat_id, file_message_id))
+            due.append((scope, chat_id, file_message_id, message_ids))
+
+    return due
+
+
+def _run():
+    while True:
+        with _cond:
+            while not _queue:
+                _cond.wait()
+
+            wait = _queue[0][0] - time.time()
+            if wait > 0:
+                _cond.wait(wait)
+                continue
+
+        try:
+            flush_scoped(_take_due(time.time()))
+        except Exception as e:
+            log_to_discord("Auto-delete error", "status", "error", fields={"error": str(e)})
+
+        # deliveries that fall due in the meantime go out as one batch
+        time.sleep(DELETE_COALESCE_SECONDS)
@@ -0,0 +1,107 @@
+# file: dialogs.py
+#
+# Admin conversation state: at most one open dialog per user and bot, each
+# with its own deadline. Starting a dialog replaces the user's previous one;
+# nothing else discards it early. Expired dialogs are invisible as soon as their
+# deadline passes and are reclaimed by sweep(), which the memory cleanup
+# loop calls, so no thread is started per interaction.
+#
+#     upload          -> awaiting_name    -> movie saved
+#     /delete_movie   -> confirm_delete   -> deleted / cancelled
+#     /announce       -> confirm_announce -> broadcast / cancelled
+#     /import         -> awaiting_import  -> restore started
+
+import threading
+import time
+
+import metrics
+import tenants
+
+
+# state -> seconds the dialog stays open
+STATES = {
+    "awaiting_name": 600,
+    "confirm_delete": 30,
+    "confirm_announce": 600,
+    "awaiting_import": 600,
+}
+
+_dialogs = {}  # (bot scope, user_id) -> {"state", "data", "expires"}
+_lock = threading.Lock()
+
+metrics.gauge_callback("open_dialogs", lambda: len(_dialogs))
+
+
+# ================= STATE =================
+def _key(user_id):
+    # an admin of two bots holds a dialog with each
+    return tenants.scope(), user_id
+
+
+def start(user_id, state, data=None):
+    # also how a user abandons a dialog: the new one replaces it
+    with _lock:
+        _dialogs[_key(user_id)] = {
+            "state": state,
+            "data": data,
+            "expires": time.time() + STATES[state],
+        }
+
+
+def _current(user_id, state):
+    dialog = _dialogs.get(_key(user_id))
+
+    if dialog is None or dialog["state"] != state:
+        return None
+
+    if dialog["expires"] <= time.time():
+        del _dialogs[_key(user_id)]
+        return None
+
+    return dialog
+
+
+def get(user_id, state):
+    # the dialog's data if `state` is open for user_id, else None
+    with _lock:
+        dialog = _current(user_id, state)
+        return dialog and dialog["data"]
+
+
+def active(user_id, state):
+    with _lock:
+        return _current(user_id, state) is not None
+
+
+def finish(user_id, state):
+    """
+    Close the dialog and return its data, or None if `state` was not open.
+    Only one caller gets the data, so a double tap cannot act twice.
+    """
+
+    with _lock:
+        dialog = _current(user_id, state)
+
+        if dialog is None:
+            return None
+
+        del _dialogs[_key(user_id)]
+        return dialog["data"]
+
+
+# ================= EXPIRY =================
+def sweep():
+    now = time.time()
+
+    with _lock:
+        expired = [key for key, d in _dialogs.items() if d["expires"] <= now]
+
+        for key in expired:
+            del _dialogs[key]
+
+    return len(expired)
+
+
+def clear():
+    with _lock:
+        _dialogs.clear()
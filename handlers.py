@@ -1,24 +1,32 @@
 # file: handlers.py
 
-from config import ADMIN_ID, BOT_TOKEN, BOT_USERNAME
 from database import (
     load_movies, save_movie, delete_movie,
     add_user, get_stats, rename_movie,
-    get_all_users, increment_movie_access,
+    create_broadcast, increment_movie_access,
+    get_user_count, record_activity,
+    find_movie_by_unique_id, refresh_movie_file,
     get_top_movies, get_movie_by_token,
-    get_db_size_mb, is_db_available
+    get_access_count, get_hourly_load,
+    get_top_movies_since, get_top_users_since,
+    is_db_available
 )
-from bot import send_message, send_file
+from bot import send_message, send_file, start_announcement
 from webhook import log_to_discord
+import os
+import tempfile
 import time
-import psutil
-import requests
 import threading
-from globals import start_time
-
-TEMP_FILE_IDS = {}
-PENDING_ANNOUNCEMENT = {}
-PENDING_DELETE = {}
+import catalog_io
+import dialogs
+import health
+import ingestion
+import media
+import metrics
+import router
+import telegram_client
+import tenants
+import tracing
 
 PROCESSED_UPDATES = set()
 USER_RATE_LIMIT = {}
@@ -26,10 +34,8 @@ USER_RATE_LIMIT = {}
 
 # ================= HELPERS =================
 def is_admin(user_id):
-    try:
-        return int(user_id) == int(ADMIN_ID)
-    except:
-        return False
+    # admins of the bot this update came to
+    return tenants.is_admin(user_id)
 
 
 def get_user_display_name(user):
@@ -38,8 +44,8 @@ def get_user_display_name(user):
     return user.get('first_name', 'User')
 
 
-def safe_send(chat_id, text):
-    result = send_message(chat_id, text)
+def safe_send(chat_id, text, inline=False):
+    result = send_message(chat_id, text, inline=inline)
     if not result or not result.get("ok"):
         log_to_discord(
             "Telegram send failed",
@@ -53,356 +59,705 @@ def safe_send(chat_id, text):
 def cleanup_memory():
     while True:
         time.sleep(300)
-        TEMP_FILE_IDS.clear()
-        PENDING_ANNOUNCEMENT.clear()
-        PENDING_DELETE.clear()
+        # only expired dialogs; open ones keep their own deadline
+        dialogs.sweep()
         PROCESSED_UPDATES.clear()
         USER_RATE_LIMIT.clear()
 
 
-threading.Thread(target=cleanup_memory, daemon=True).start()
+def start_memory_cleanup():
+    # process-local state, so every worker runs its own sweeper
+    threading.Thread(target=cleanup_memory, daemon=True).start()
+
+
+# ================= MIDDLEWARE =================
+# each returns False to stop the update before the handler runs
+def admin_only(ctx):
+    return is_admin(ctx["user_id"])
+
+
+def rate_limited(ctx):
+    # one bucket per user and bot
+    key = (tenants.scope(), ctx["user_id"])
+    now = time.time()
+
+    if now - USER_RATE_LIMIT.get(key, 0) < 1:
+        metrics.inc("rate_limit_rejections_total", scope="update")
+        return False
+
+    USER_RATE_LIMIT[key] = now
+    return True
+
+
+def db_required(ctx):
+    if is_db_available():
+        return True
+
+    log_to_discord("DB unavailable", "status", "error")
+    safe_send(ctx["chat_id"], "⚠️ Database unavailable", inline=True)
+    return False
+
+
+def track_user(ctx):
+    if not is_admin(ctx["user_id"]):
+        add_user(ctx["user_id"], get_user_display_name(ctx["user"]))
+    return True
+
+
+def record_access(ctx, movie_name):
+    # admins are not part of the audience (see track_user)
+    if not is_admin(ctx["user_id"]):
+        record_activity(ctx["user_id"], movie=movie_name)
+
+
+def answer_callback(ctx):
+    # sent before the handler runs: an inline reply would only reach the
+    # user once the handler returned (a whole broadcast, for some)
+    telegram_client.call(
+        "answerCallbackQuery",
+        {"callback_query_id": ctx["query"]["id"]}
+    )
+    return True
+
+
+ADMIN = (rate_limited, admin_only)
+ADMIN_DB = (rate_limited, admin_only, db_required)
+ADMIN_CALLBACK = (answer_callback, admin_only)
 
 
 # ================= MAIN =================
 def process_update(update):
-    try:
-        if not isinstance(update, dict):
-            return
+    if not isinstance(update, dict):
+        return
 
-        # ===== DUPLICATE PROTECTION =====
-        update_id = update.get("update_id")
-        if update_id in PROCESSED_UPDATES:
-            return
+    # ===== DUPLICATE PROTECTION =====
+    # update_ids are counted per bot
+    key = (tenants.scope(), update.get("update_id"))
+    if key in PROCESSED_UPDATES:
+        metrics.inc("dedup_hits_total", scope="update")
+        return
+
+    PROCESSED_UPDATES.add(key)
 
-        PROCESSED_UPDATES.add(update_id)
+    if len(PROCESSED_UPDATES) > 1000:
+        PROCESSED_UPDATES.clear()
 
-        if len(PROCESSED_UPDATES) > 1000:
-            PROCESSED_UPDATES.clear()
+    router.dispatch(update)
 
-        # ================= CALLBACK =================
-        if "callback_query" in update:
-            query = update["callback_query"]
-            data = query.get("data")
-            user_id = query["from"]["id"]
-            chat_id = query["message"]["chat"]["id"]
 
-            requests.post(
-                f"https://api.telegram.org/bot{BOT_TOKEN}/answerCallbackQuery",
-                json={"callback_query_id": query["id"]}
-            )
+# ================= CALLBACKS =================
+@router.callback("announce_confirm", *ADMIN_CALLBACK)
+def on_announce_confirm(ctx):
+    user_id, chat_id = ctx["user_id"], ctx["chat_id"]
+    # closed before sending so a second tap cannot start a duplicate
+    announcement = dialogs.finish(user_id, "confirm_announce")
 
-            # ===== ANNOUNCE CONFIRM =====
-            if data == "announce_confirm" and is_admin(user_id):
-                announcement = PENDING_ANNOUNCEMENT.get(user_id)
-
-                if not announcement:
-                    safe_send(chat_id, "No pending announcement")
-                    return
-
-                users = get_all_users()
-                success, failed = 0, 0
-
-                for u in users:
-                    res = send_message(u['user_id'], announcement)
-                    if res and res.get("ok"):
-                        success += 1
-                    else:
-                        failed += 1
-                    time.sleep(0.05)
-
-                PENDING_ANNOUNCEMENT.pop(user_id, None)
-
-                safe_send(chat_id, f"✅ Announcement sent\n\nSuccess: {success}\nFailed: {failed}")
-
-                log_to_discord(
-                    "📢 Announcement Sent",
-                    "list",
-                    "info",
-                    fields={"Success": success, "Failed": failed}
-                )
-                return
-
-            # ===== ANNOUNCE CANCEL =====
-            if data == "announce_cancel" and is_admin(user_id):
-                PENDING_ANNOUNCEMENT.pop(user_id, None)
-                safe_send(chat_id, "❌ Announcement cancelled")
-
-                log_to_discord("Announcement cancelled", "list", "warning")
-                return
-
-            # ===== DELETE CONFIRM =====
-            if data == "delete_confirm" and is_admin(user_id):
-                d = PENDING_DELETE.get(user_id)
-
-                if not d:
-                    safe_send(chat_id, "No pending delete")
-                    return
-
-                if time.time() - d["time"] > 30:
-                    PENDING_DELETE.pop(user_id, None)
-                    safe_send(chat_id, "⌛ Delete expired")
-                    return
-
-                delete_movie(d["movie"])
-                PENDING_DELETE.pop(user_id, None)
-
-                safe_send(chat_id, f"🗑 Deleted '{d['movie']}'")
-
-                log_to_discord(
-                    "🗑 Movie deleted",
-                    "list",
-                    "info",
-                    fields={"movie": d["movie"]}
-                )
-                return
-
-            # ===== DELETE CANCEL =====
-            if data == "delete_cancel" and is_admin(user_id):
-                PENDING_DELETE.pop(user_id, None)
-                safe_send(chat_id, "❌ Cancelled")
-                return
-
-        # ================= MESSAGE =================
-        if "message" not in update:
-            return
+    if not announcement:
+        safe_send(chat_id, "No pending announcement")
+        return
+
+    broadcast = create_broadcast(announcement["message"], segment=announcement["segment"])
+
+    if not broadcast:
+        # reopened so the same button works once Mongo is back
+        dialogs.start(user_id, "confirm_announce", announcement)
+        safe_send(chat_id, "❌ Database unavailable, try again later")
+        return
+
+    start_announcement(broadcast, notify_chat_id=chat_id)
+
+    safe_send(chat_id, "📢 Announcement started, you will get a summary when it is done")
+
+
+@router.callback("announce_cancel", *ADMIN_CALLBACK)
+def on_announce_cancel(ctx):
+    dialogs.finish(ctx["user_id"], "confirm_announce")
+    safe_send(ctx["chat_id"], "❌ Announcement cancelled")
+
+    log_to_discord("Announcement cancelled", "list", "warning")
+
+
+@router.callback("delete_confirm", *ADMIN_CALLBACK)
+def on_delete_confirm(ctx):
+    user_id, chat_id = ctx["user_id"], ctx["chat_id"]
+    d = dialogs.finish(user_id, "confirm_delete")
+
+    if not d:
+        safe_send(chat_id, "⌛ No pending delete (requests expire after 30s)")
+        return
+
+    delete_movie(d["movie"])
 
-        msg = update["message"]
-        chat_id = msg["chat"]["id"]
-        user = msg["from"]
-        user_id = user["id"]
+    safe_send(chat_id, f"🗑 Deleted '{d['movie']}'")
 
-        # ===== RATE LIMIT =====
+    log_to_discord(
+        "🗑 Movie deleted",
+        "list",
+        "info",
+        fields={"movie": d["movie"]}
+    )
+
+
+@router.callback("delete_cancel", *ADMIN_CALLBACK)
+def on_delete_cancel(ctx):
+    dialogs.finish(ctx["user_id"], "confirm_delete")
+    safe_send(ctx["chat_id"], "❌ Cancelled")
+
+
+# ================= CATALOG BACKUP =================
+# registered before UPLOAD so a document sent after /import is restored,
+# not added as a movie
+def progress_reporter(chat_id, title):
+    # one status message, edited at most every 2s
+    try:
+        res = telegram_client.call("sendMessage", {"chat_id": chat_id, "text": f"⏳ {title}"})
+        message_id = res.get("result", {}).get("message_id")
+    except Exception:
+        message_id = None
+
+    last = {"at": 0.0}
+
+    def report(stats, done=False):
         now = time.time()
-        if now - USER_RATE_LIMIT.get(user_id, 0) < 1:
+
+        if not message_id or (not done and now - last["at"] < 2):
             return
-        USER_RATE_LIMIT[user_id] = now
 
-        text = msg.get("text", "")
-        document = msg.get("document")
-        video = msg.get("video")
+        last["at"] = now
 
-        display_name = get_user_display_name(user)
+        try:
+            telegram_client.call(
+                "editMessageText",
+                {
+                    "chat_id": chat_id,
+                    "message_id": message_id,
+                    "text": f"{'✅' if done else '⏳'} {title}\n\n{catalog_io.describe(stats)}"
+                }
+            )
+        except Exception:
+            pass
 
-        if not is_admin(user_id):
-            add_user(user_id, display_name)
+    return report
 
-        # ===== DB SAFETY =====
-        if not is_db_available():
-            log_to_discord("DB unavailable", "status", "error")
-            safe_send(chat_id, "⚠️ Database unavailable")
-            return
 
-        # ===== UPLOAD =====
-        if (document or video) and is_admin(user_id):
-            file_id = document["file_id"] if document else video["file_id"]
-            TEMP_FILE_IDS[chat_id] = file_id
+def run_export(chat_id):
+    report = progress_reporter(chat_id, "Exporting catalog")
+    path = os.path.join(tempfile.gettempdir(), f"catalog-{int(time.time())}.ndjson.gz")
 
-            safe_send(chat_id, "Send movie name")
+    try:
+        with catalog_io.open_path(path, "w") as out:
+            stats = catalog_io.export_catalog(out, progress=report)
 
-            log_to_discord(
-                "📤 File uploaded",
-                "list",
-                "info",
-                fields={"admin": display_name}
+        report(stats, done=True)
+
+        with open(path, "rb") as f:
+            telegram_client.call(
+                "sendDocument",
+                {"chat_id": chat_id, "caption": catalog_io.describe(stats)},
+                timeout=300,
+                files={"document": (os.path.basename(path), f)}
             )
-            return
 
-        # ===== SAVE =====
-        if is_admin(user_id) and chat_id in TEMP_FILE_IDS and text:
-            token = save_movie(text, TEMP_FILE_IDS[chat_id])
-            TEMP_FILE_IDS.pop(chat_id)
+        log_to_discord("📦 Catalog exported", "list", "info", fields=dict(stats))
 
-            safe_send(chat_id, f"Movie '{text}' added")
+    except Exception as e:
+        safe_send(chat_id, f"❌ Export failed: {e}")
+        log_to_discord("Catalog export failed", "list", "error", fields={"error": str(e)})
 
-            log_to_discord(
-                "🎬 Movie added",
-                "list",
-                "info",
-                fields={"movie": text, "token": token}
-            )
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def run_import(chat_id, document):
+    report = progress_reporter(chat_id, "Importing catalog")
+
+    try:
+        res = telegram_client.download(document["file_id"])
+
+        if res is None:
+            safe_send(chat_id, "❌ Could not fetch the file (bots can download up to 20MB)")
             return
 
-        # ===== GENERATE LINK =====
-        if text.startswith("/generate_link") and is_admin(user_id):
-            parts = text.split(maxsplit=1)
+        with res:
+            gzipped = document.get("file_name", "").endswith(".gz")
+            stats = catalog_io.import_catalog(
+                catalog_io.open_stream(res.raw, gzipped),
+                progress=report
+            )
 
-            if len(parts) < 2:
-                safe_send(chat_id, "Usage: /generate_link MovieName")
-                return
+        report(stats, done=True)
+        log_to_discord("📥 Catalog imported", "list", "info", fields=dict(stats))
 
-            movie_name = parts[1]
-            movies = load_movies()
+    except Exception as e:
+        safe_send(chat_id, f"❌ Import failed: {e}")
+        log_to_discord("Catalog import failed", "list", "error", fields={"error": str(e)})
 
-            if movie_name not in movies:
-                safe_send(chat_id, "Movie not found")
-                return
 
-            token = movies[movie_name]["token"]
-            link = f"https://t.me/{BOT_USERNAME}?start={token}"
+def is_pending_import(ctx):
+    return bool(ctx["msg"].get("document")) and dialogs.active(ctx["user_id"], "awaiting_import")
 
-            safe_send(chat_id, f"🔗 {link}")
 
-            log_to_discord(
-                "🔗 Link generated",
-                "list",
-                "info",
-                fields={"movie": movie_name}
-            )
-            return
+@router.message("import_file", is_pending_import, *ADMIN_DB)
+def on_import_file(ctx):
+    if not dialogs.finish(ctx["user_id"], "awaiting_import"):
+        return
 
-        # ===== RENAME =====
-        if text.startswith("/rename_file") and is_admin(user_id):
-            parts = text.split(maxsplit=2)
-
-            if len(parts) < 3:
-                safe_send(chat_id, "Usage: /rename_file old new")
-                return
-
-            if rename_movie(parts[1], parts[2]):
-                safe_send(chat_id, "Renamed successfully")
-
-                log_to_discord(
-                    "✏️ Movie renamed",
-                    "list",
-                    "info",
-                    fields={"old": parts[1], "new": parts[2]}
-                )
-            else:
-                safe_send(chat_id, "Rename failed")
-            return
+    tenants.start_thread(run_import, ctx["chat_id"], ctx["msg"]["document"])
 
-        # ===== DELETE =====
-        if text.startswith("/delete_movie") and is_admin(user_id):
-            parts = text.split(maxsplit=1)
 
-            if len(parts) < 2:
-                safe_send(chat_id, "Usage: /delete_movie MovieName")
-                return
+@router.command("/export", *ADMIN_DB)
+def cmd_export(ctx):
+    tenants.start_thread(run_export, ctx["chat_id"])
 
-            movie = parts[1]
-            movies = load_movies()
 
-            if movie not in movies:
-                safe_send(chat_id, "Movie not found")
-                return
+@router.command("/import", *ADMIN_DB)
+def cmd_import(ctx):
+    dialogs.start(ctx["user_id"], "awaiting_import", {"chat_id": ctx["chat_id"]})
+    safe_send(ctx["chat_id"], "Send the .ndjson or .ndjson.gz backup as a document")
 
-            PENDING_DELETE[user_id] = {"movie": movie, "time": time.time()}
 
-            threading.Thread(
-                target=lambda: (time.sleep(30), PENDING_DELETE.pop(user_id, None)),
-                daemon=True
-            ).start()
+# ================= UPLOAD =================
+def is_upload(ctx):
+    return bool(ctx["msg"].get("document") or ctx["msg"].get("video"))
 
-            keyboard = {
-                "inline_keyboard": [[
-                    {"text": "✅ Confirm", "callback_data": "delete_confirm"},
-                    {"text": "❌ Cancel", "callback_data": "delete_cancel"}
-                ]]
-            }
 
-            requests.post(
-                f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage",
-                json={
-                    "chat_id": chat_id,
-                    "text": f"⚠️ Delete '{movie}'?",
-                    "reply_markup": keyboard
-                }
-            )
+def is_pending_name(ctx):
+    return bool(ctx["text"]) and dialogs.active(ctx["user_id"], "awaiting_name")
 
-            log_to_discord(
-                "Delete requested",
-                "list",
-                "warning",
-                fields={"movie": movie}
-            )
-            return
 
-        # ===== TOP =====
-        if text == "/top_movies" and is_admin(user_id):
-            top = get_top_movies()
+@router.message("upload", is_upload, *ADMIN_DB)
+def on_upload(ctx):
+    chat_id = ctx["chat_id"]
+    metadata = media.extract_metadata(ctx["msg"])
 
-            msg = "🔥 Top Movies:\n\n"
-            for i, m in enumerate(top, 1):
-                msg += f"{i}. {m['name']} — {m.get('access_count', 0)} downloads\n"
+    # indexed lookup on file_unique_id, no Bot API call
+    existing = find_movie_by_unique_id(metadata.get("file_unique_id"))
 
-            safe_send(chat_id, msg)
+    if existing and existing.get("file_status") != "invalid":
+        safe_send(chat_id, f"⚠️ Already stored as '{existing['name']}'")
+        return
 
-            log_to_discord("Top movies viewed", "list", "info")
-            return
+    # an upload to another bot: the catalog stores the primary's file_id
+    metadata = media.catalog_metadata(metadata)
 
-        # ===== STATS =====
-        if text == "/stats" and is_admin(user_id):
-            s = get_stats()
-            safe_send(chat_id, f"Movies: {s['movie_count']} | Users: {s['user_count']}")
+    if not metadata:
+        safe_send(chat_id, "⚠️ Could not store the file for the primary bot, check that both bots are in the storage chat")
+        return
 
-            log_to_discord("Stats viewed", "list", "info")
-            return
+    if existing:
+        refresh_movie_file(existing["name"], metadata)
+        safe_send(chat_id, f"♻️ '{existing['name']}' refreshed, its link works again")
 
-        # ===== HEALTH =====
-        if text == "/health" and is_admin(user_id):
-            p = psutil.Process()
+        log_to_discord(
+            "♻️ Stale file replaced",
+            "list",
+            "info",
+            fields={"movie": existing["name"]}
+        )
+        return
 
-            mem = p.memory_info().rss / 1024 / 1024
-            cpu = p.cpu_percent(interval=0.1)
+    dialogs.start(ctx["user_id"], "awaiting_name", metadata)
 
-            uptime = time.time() - start_time
-            h = int(uptime // 3600)
-            m = int((uptime % 3600) // 60)
-            s = int(uptime % 60)
+    safe_send(chat_id, "Send movie name")
 
-            db_size = get_db_size_mb()
+    log_to_discord(
+        "📤 File uploaded",
+        "list",
+        "info",
+        fields={"admin": get_user_display_name(ctx["user"])}
+    )
 
-            safe_send(
-                chat_id,
-                f"🟢 Health\n\n"
-                f"⏱ {h}h {m}m {s}s\n"
-                f"🧠 {mem:.2f}MB\n"
-                f"⚡ {cpu:.2f}%\n"
-                f"🗄 {db_size}/512 MB"
-            )
 
-            log_to_discord("Health checked", "list", "info")
-            return
+@router.message("save_movie", is_pending_name, *ADMIN_DB)
+def on_movie_name(ctx):
+    chat_id, text = ctx["chat_id"], ctx["text"]
 
-        # ===== START =====
-        if text.startswith("/start "):
-            query = text.split(" ", 1)[1]
+    metadata = dialogs.get(ctx["user_id"], "awaiting_name")
 
-            movie = get_movie_by_token(query)
+    if not metadata:
+        return
 
-            if movie:
-                send_file(chat_id, movie["file_id"])
-                increment_movie_access(movie["name"])
+    token = save_movie(text, metadata["file_id"], metadata)
 
-                log_to_discord(
-                    "🎬 File accessed",
-                    "access",
-                    "info",
-                    fields={"user": display_name, "movie": movie["name"]}
-                )
-                return
+    if not token:
+        # the upload stays pending: sending the name again retries the save
+        safe_send(chat_id, f"❌ Could not save '{text}', send the name again")
+        return
 
-            name = query.replace("_", " ")
-            movies = load_movies()
+    dialogs.finish(ctx["user_id"], "awaiting_name")
 
-            if name in movies:
-                send_file(chat_id, movies[name]["file_id"])
-                increment_movie_access(name)
-                return
+    safe_send(chat_id, f"Movie '{text}' added")
 
-            safe_send(chat_id, "❌ Invalid or expired link")
+    log_to_discord(
+        "🎬 Movie added",
+        "list",
+        "info",
+        fields={"movie": text, "token": token}
+    )
 
-            log_to_discord(
-                "❌ Invalid link attempt",
-                "access",
-                "warning",
-                fields={"user": display_name, "query": query}
-            )
 
-    except Exception as e:
+# ================= ADMIN COMMANDS =================
+@router.command("/generate_link", *ADMIN_DB)
+def cmd_generate_link(ctx):
+    chat_id, movie_name = ctx["chat_id"], ctx["args"]
+
+    if not movie_name:
+        safe_send(chat_id, "Usage: /generate_link MovieName")
+        return
+
+    movies = load_movies()
+
+    if movie_name not in movies:
+        safe_send(chat_id, "Movie not found")
+        return
+
+    token = movies[movie_name]["token"]
+    link = f"https://t.me/{tenants.current()['username']}?start={token}"
+
+    safe_send(chat_id, f"🔗 {link}")
+
+    log_to_discord(
+        "🔗 Link generated",
+        "list",
+        "info",
+        fields={"movie": movie_name}
+    )
+
+
+@router.command("/rename_file", *ADMIN_DB)
+def cmd_rename_file(ctx):
+    chat_id = ctx["chat_id"]
+    parts = ctx["args"].split(maxsplit=1)
+
+    if len(parts) < 2:
+        safe_send(chat_id, "Usage: /rename_file old new")
+        return
+
+    if rename_movie(parts[0], parts[1]):
+        safe_send(chat_id, "Renamed successfully")
+
         log_to_discord(
-            "Handler crash",
-            "status",
-            "error",
-            fields={"error": str(e)}
-        )
\ No newline at end of file
+            "✏️ Movie renamed",
+            "list",
+            "info",
+            fields={"old": parts[0], "new": parts[1]}
+        )
+    else:
+        safe_send(chat_id, "Rename failed")
+
+
+@router.command("/delete_movie", *ADMIN_DB)
+def cmd_delete_movie(ctx):
+    chat_id, user_id, movie = ctx["chat_id"], ctx["user_id"], ctx["args"]
+
+    if not movie:
+        safe_send(chat_id, "Usage: /delete_movie MovieName")
+        return
+
+    movies = load_movies()
+
+    if movie not in movies:
+        safe_send(chat_id, "Movie not found")
+        return
+
+    dialogs.start(user_id, "confirm_delete", {"movie": movie})
+
+    keyboard = {
+        "inline_keyboard": [[
+            {"text": "✅ Confirm", "callback_data": "delete_confirm"},
+            {"text": "❌ Cancel", "callback_data": "delete_cancel"}
+        ]]
+    }
+
+    telegram_client.call(
+        "sendMessage",
+        {
+            "chat_id": chat_id,
+            "text": f"⚠️ Delete '{movie}'?",
+            "reply_markup": keyboard
+        }
+    )
+
+    log_to_discord(
+        "Delete requested",
+        "list",
+        "warning",
+        fields={"movie": movie}
+    )
+
+
+def parse_segment(text):
+    # leading "active:N" / "movie:Movie_Name" words pick the audience
+    segment = {}
+
+    while True:
+        head, _, rest = text.partition(" ")
+        key, _, value = head.partition(":")
+
+        if key == "active" and value.isdigit():
+            segment["active_days"] = int(value)
+        elif key == "movie" and value:
+            segment["movie"] = value.replace("_", " ")
+        else:
+            return segment, text
+
+        text = rest.lstrip()
+
+
+def describe_segment(segment):
+    parts = []
+    if segment.get("active_days"):
+        parts.append(f"active in the last {segment['active_days']} days")
+    if segment.get("movie"):
+        parts.append(f"who opened '{segment['movie']}'")
+    return ", ".join(parts) or "all reachable users"
+
+
+@router.command("/announce", *ADMIN_DB)
+def cmd_announce(ctx):
+    chat_id, user_id = ctx["chat_id"], ctx["user_id"]
+    segment, text = parse_segment(ctx["args"])
+
+    if not text:
+        safe_send(
+            chat_id,
+            "Usage: /announce [active:DAYS] [movie:Movie_Name] Your message"
+        )
+        return
+
+    if segment.get("movie") and segment["movie"] not in load_movies():
+        safe_send(chat_id, "Movie not found")
+        return
+
+    dialogs.start(user_id, "confirm_announce", {"message": text, "segment": segment})
+
+    keyboard = {
+        "inline_keyboard": [[
+            {"text": "✅ Send", "callback_data": "announce_confirm"},
+            {"text": "❌ Cancel", "callback_data": "announce_cancel"}
+        ]]
+    }
+
+    telegram_client.call(
+        "sendMessage",
+        {
+            "chat_id": chat_id,
+            "text": (
+                f"📢 Send to ~{get_user_count(segment)} users "
+                f"({describe_segment(segment)})?\n\n{text}"
+            ),
+            "reply_markup": keyboard
+        }
+    )
+
+    log_to_discord(
+        "Announcement requested",
+        "list",
+        "info",
+        fields={"segment": describe_segment(segment)}
+    )
+
+
+@router.command("/top_movies", *ADMIN_DB)
+def cmd_top_movies(ctx):
+    top = get_top_movies()
+
+    msg = "🔥 Top Movies:\n\n"
+    for i, m in enumerate(top, 1):
+        msg += f"{i}. {m['name']} — {m.get('access_count', 0)} downloads\n"
+
+    safe_send(ctx["chat_id"], msg, inline=True)
+
+    log_to_discord("Top movies viewed", "list", "info")
+
+
+@router.command("/stats", *ADMIN_DB)
+def cmd_stats(ctx):
+    s = get_stats()
+    accesses = get_access_count(time.time() - 86400)
+
+    safe_send(
+        ctx["chat_id"],
+        f"Movies: {s['movie_count']} | Users: {s['user_count']} | Accesses (24h): {accesses}",
+        inline=True
+    )
+
+    log_to_discord("Stats viewed", "list", "info")
+
+
+SPARK = "▁▂▃▄▅▆▇█"
+
+
+def sparkline(hourly, since, hours=24):
+    # one character per hour, oldest first; empty hours are blank
+    counts = dict(hourly)
+    start = int(since // 3600 * 3600)
+    series = [counts.get(start + i * 3600, 0) for i in range(hours)]
+    peak = max(series) or 1
+    return "".join(SPARK[c * (len(SPARK) - 1) // peak] if c else " " for c in series)
+
+
+@router.command("/analytics", *ADMIN_DB)
+def cmd_analytics(ctx):
+    days = int(ctx["args"]) if ctx["args"].strip().isdigit() else 7
+    now = time.time()
+    since = now - days * 86400
+    day_ago = now - 23 * 3600
+
+    # rollups only: cost does not grow with the event history
+    hourly = get_hourly_load(day_ago)
+    movies = get_top_movies_since(since)
+    users, active = get_top_users_since(since)
+
+    peak_hour, peak = max(hourly, key=lambda h: h[1], default=(None, 0))
+    peak_text = time.strftime("%H:00 UTC", time.gmtime(peak_hour)) if peak_hour else "—"
+
+    lines = [
+        f"📊 Analytics, last {days} days",
+        "",
+        f"Accesses: {get_access_count(since)} | Active users: {active}",
+        "",
+        "Top movies:",
+        *[f"{i}. {name} — {count}" for i, (name, count) in enumerate(movies, 1)],
+        "",
+        "Top users:",
+        *[f"{i}. {name or user_id} — {count}" for i, (user_id, name, count) in enumerate(users, 1)],
+        "",
+        f"Last 24h by hour (peak {peak} at {peak_text}):",
+        sparkline(hourly, day_ago),
+    ]
+
+    safe_send(ctx["chat_id"], "\n".join(lines), inline=True)
+
+    log_to_discord("Analytics viewed", "list", "info", fields={"days": days})
+
+
+@router.command("/health", *ADMIN)
+def cmd_health(ctx):
+    snap = health.snapshot()
+    mongo = snap["mongo"]
+    queues = snap["queues"]
+
+    safe_send(
+        ctx["chat_id"],
+        f"🟢 Health\n\n"
+        f"⏱ {health.uptime_readable(snap['uptime_seconds'])}\n"
+        f"🧠 {snap['memory_mb']:.2f}MB, {snap['threads']} threads\n"
+        f"⚡ {snap['cpu_percent']:.2f}%\n"
+        f"🗄 {mongo['db_size_mb']}/512 MB, ping {mongo['ping_ms']}ms ({mongo['status']})\n"
+        f"📡 Telegram errors {snap['error_rates']['telegram']:.1%}, "
+        f"Discord {snap['error_rates']['discord']:.1%}\n"
+        f"🧹 {queues.get('pending_auto_deletes', 0)} pending deletes",
+        inline=True
+    )
+
+    log_to_discord("Health checked", "list", "info")
+
+
+@router.command("/slow", *ADMIN)
+def cmd_slow(ctx):
+    traces = tracing.recent_slow(5)
+
+    if not traces:
+        safe_send(ctx["chat_id"], "🐢 No slow updates recorded")
+        return
+
+    safe_send(
+        ctx["chat_id"],
+        ("🐢 Slow updates\n\n" + "\n\n".join(tracing.format_trace(t) for t in traces))[:4000]
+    )
+
+
+@router.command("/profile", *ADMIN)
+def cmd_profile(ctx):
+    arg = ctx["args"]
+    count = int(arg) if arg.isdigit() else 1
+
+    tracing.request_profile(count)
+    safe_send(ctx["chat_id"], f"🔬 Profiling the next {count} update(s), see /slow")
+
+
+@router.command("/ingest", *ADMIN)
+def cmd_ingest(ctx):
+    chat_id, mode = ctx["chat_id"], ctx["args"].strip().lower()
+
+    if not tenants.current()["primary"]:
+        # process-wide, and polling only serves the primary bot
+        safe_send(chat_id, "❌ Ingestion is switched from the primary bot")
+        return
+
+    if mode not in ("webhook", "polling"):
+        safe_send(chat_id, f"Usage: /ingest webhook|polling (now: {ingestion.stored_mode()})")
+        return
+
+    def switch():
+        # off-thread: stopping the poller waits for its batch, which may be this one
+        ok = ingestion.request_mode(mode)
+        safe_send(chat_id, f"✅ Ingestion: {mode}" if ok else f"❌ Could not switch to {mode}")
+
+    threading.Thread(target=switch, daemon=True).start()
+
+
+# ================= START =================
+# no db_required: deep links are served from the catalog cache while degraded
+def deliver(chat_id, movie):
+    # False when this bot has no usable file_id for the movie
+    result = send_file(chat_id, media.file_id_for(movie), movie)
+
+    if result.get("unresolved"):
+        safe_send(chat_id, "⚠️ This file is temporarily unavailable", inline=True)
+        return False
+
+    return True
+
+
+@router.command("/start", rate_limited, track_user)
+def cmd_start(ctx):
+    chat_id, query = ctx["chat_id"], ctx["args"]
+
+    if not query:
+        return
+
+    display_name = get_user_display_name(ctx["user"])
+    movie = get_movie_by_token(query)
+
+    if movie and movie.get("file_status") == "invalid":
+        # known stale file_id: do not burn a send that will fail
+        safe_send(chat_id, "⚠️ This file is temporarily unavailable", inline=True)
+        return
+
+    if movie:
+        if not deliver(chat_id, movie):
+            return
+
+        increment_movie_access(movie["name"])
+        record_access(ctx, movie["name"])
+
+        log_to_discord(
+            "🎬 File accessed",
+            "access",
+            "info",
+            fields={"user": display_name, "movie": movie["name"]}
+        )
+        return
+
+    name = query.replace("_", " ")
+    movies = load_movies()
+
+    if name in movies:
+        if not deliver(chat_id, dict(movies[name], name=name)):
+            return
+
+        increment_movie_access(name)
+        record_access(ctx, name)
+        return
+
+    safe_send(chat_id, "❌ Invalid or expired link", inline=True)
+
+    log_to_discord(
+        "❌ Invalid link attempt",
+        "access",
+        "warning",
+        fields={"user": display_name, "query": query}
+    )
@@ -0,0 +1,180 @@
+# file: health.py
+#
+# Background health sampler. One thread per process refreshes a snapshot
+# every HEALTH_INTERVAL seconds; /health, /livez, /readyz and the admin
+# /health command only read it, so a probe never waits on psutil or Mongo.
+
+import threading
+import time
+
+import psutil
+
+from config import HEALTH_INTERVAL
+from globals import start_time
+import database
+import metrics
+import mongo_health
+
+
+# dbStats is a heavier command than ping; refresh it rarely
+DB_SIZE_INTERVAL = 600
+
+_process = psutil.Process()
+_state = {
+    "snapshot": None,
+    "thread": None,
+    "previous": None,   # counters at the last sample, for error rates
+    "db_size_mb": None,
+    "db_size_at": 0.0,
+}
+
+
+# ================= SAMPLING =================
+def _total(counters, name, **match):
+    return sum(
+        value for (metric, labels), value in counters.items()
+        if metric == name and all(dict(labels).get(k) == v for k, v in match.items())
+    )
+
+
+def _calls(histograms, name):
+    # observation count is the last slot of a histogram
+    return sum(hist[-1] for (metric, _), hist in histograms.items() if metric == name)
+
+
+def _error_rate(errors, total, previous):
+    # share of failed calls since the previous sample
+    errors, total = errors - previous[0], total - previous[1]
+    return round(errors / total, 4) if total > 0 else 0.0
+
+
+def _ping_mongo():
+    if not mongo_health.is_available():
+        return None
+
+    started = time.perf_counter()
+
+    try:
+        database.ping()
+    except Exception as e:
+        mongo_health.record_failure(e)
+        return None
+
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def _db_size(now):
+    if now - _state["db_size_at"] >= DB_SIZE_INTERVAL and mongo_health.is_available():
+        try:
+            _state["db_size_mb"] = database.get_db_size_mb()
+            _state["db_size_at"] = now
+        except Exception:
+            pass
+
+    return _state["db_size_mb"]
+
+
+def sample(probe=True):
+    now = time.time()
+
+    with _process.oneshot():
+        # interval=None: usage since the previous call, no sleep
+        cpu = _process.cpu_percent(interval=None)
+        rss_mb = _process.memory_info().rss / 1024 / 1024
+        threads = _process.num_threads()
+        fds = _process.num_fds() if hasattr(_process, "num_fds") else None
+
+    snap = metrics.snapshot()
+    counters, histograms, gauges = snap["counters"], snap["histograms"], snap["gauges"]
+
+    telegram = (
+        _total(counters, "telegram_api_requests_total") - _total(counters, "telegram_api_requests_total", outcome="ok"),
+        _total(counters, "telegram_api_requests_total"),
+    )
+    discord = (
+        _total(counters, "discord_flush_failures_total"),
+        _calls(histograms, "discord_flush_seconds"),
+    )
+    previous = _state["previous"] or {"telegram": (0, 0), "discord": (0, 0)}
+    if probe:
+        _state["previous"] = {"telegram": telegram, "discord": discord}
+
+    mongo = mongo_health.snapshot()
+
+    return {
+        "sampled_at": now,
+        "uptime_seconds": now - start_time,
+        "cpu_percent": cpu,
+        "memory_mb": round(rss_mb, 2),
+        "threads": threads,
+        "open_fds": fds,
+        "mongo": {
+            "status": mongo["status"],
+            "ping_ms": _ping_mongo() if probe else mongo["last_ping_ms"],
+            "db_size_mb": _db_size(now) if probe else _state["db_size_mb"],
+            "catalog_cached": len(database.CATALOG_CACHE),
+        },
+        "error_rates": {
+            "telegram": _error_rate(*telegram, previous["telegram"]),
+            "discord": _error_rate(*discord, previous["discord"]),
+        },
+        "queues": {
+            name: value for (name, labels), value in gauges.items()
+            if name in ("pending_auto_deletes", "open_dialogs") and not labels
+        },
+    }
+
+
+def _loop():
+    # usable at once; the first Mongo ping may take a server selection timeout
+    _state["snapshot"] = sample(probe=False)
+
+    while True:
+        try:
+            _state["snapshot"] = sample()
+        except Exception:
+            pass
+
+        time.sleep(HEALTH_INTERVAL)
+
+
+def start_sampler():
+    # per process: psutil and the queues describe this worker only
+    if _state["thread"] is None:
+        _state["thread"] = threading.Thread(target=_loop, daemon=True)
+        _state["thread"].start()
+
+
+# ================= READ =================
+def snapshot():
+    # before the first sample, a cheap one without the Mongo round trips
+    return _state["snapshot"] or sample(probe=False)
+
+
+def is_fresh(snap):
+    return time.time() - snap["sampled_at"] <= 3 * HEALTH_INTERVAL
+
+
+def readiness(snap):
+    """
+    (ready, reason). Deep links are served from the catalog cache, so a
+    Mongo outage alone does not make the worker unready.
+    """
+
+    if _state["snapshot"] is None:
+        return False, "starting"
+
+    if not is_fresh(snap):
+        return False, "sampler stalled"
+
+    if mongo_health.is_available() or database.CATALOG_CACHE:
+        return True, "ok"
+
+    return False, "no database and empty catalog cache"
+
+
+def uptime_readable(seconds):
+    h = int(seconds // 3600)
+    m = int((seconds % 3600) // 60)
+    s = int(seconds % 60)
+    return f"{h}h {m}m {s}s"
@@ -0,0 +1,389 @@
+# file: ingestion.py
+
+import hmac
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    INGESTION_MODE,
+    POLL_BATCH_LIMIT,
+    POLL_TIMEOUT,
+    POLL_WORKERS,
+    WEBHOOK_MAX_BODY,
+    WEBHOOK_MAX_CONNECTIONS,
+)
+from database import get_setting, save_setting
+from webhook import log_to_discord
+import leader
+import metrics
+import telegram_client
+import tenants
+
+try:
+    # optional: several times faster on update-sized payloads
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+
+# ================= STATE =================
+state = {
+    "mode": None,       # "webhook" | "polling"
+    "offset": None,     # next update_id to ask getUpdates for
+    "thread": None,
+    "process_update": None,
+}
+
+_stop = threading.Event()
+_switch_lock = threading.Lock()
+
+# the mode and the getUpdates offset live in Mongo: every worker reports
+# the same mode, /ingest works from any worker, and a new leader (or a
+# restarted one) continues from the stored offset. Only the leader acts
+# on them, checking the stored mode every MODE_CHECK_SECONDS.
+MODE_SETTING = "ingestion_mode"
+OFFSET_SETTING = "ingestion_offset"
+MODE_CHECK_SECONDS = 10
+
+metrics.gauge_callback("ingestion_polling", lambda: 1 if state["mode"] == "polling" else 0)
+
+
+# ================= AUTO WEBHOOK =================
+# the update types the router handles; Telegram does not send the rest
+ALLOWED_UPDATES = ["message", "callback_query"]
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def webhook_settings(webhook_url, bot=None):
+    bot = bot or tenants.current()
+    settings = {
+        "url": webhook_url,
+        "allowed_updates": ALLOWED_UPDATES,
+        "max_connections": WEBHOOK_MAX_CONNECTIONS,
+    }
+
+    if bot["secret"]:
+        settings["secret_token"] = bot["secret"]
+
+    return settings
+
+
+def set_webhook(bots=None):
+    # every bot of the process by default; False if any registration failed
+    results = [_set_webhook(bot) for bot in (tenants.BOTS if bots is None else bots)]
+    return all(results)
+
+
+def _set_webhook(bot):
+    try:
+        webhook_url = tenants.webhook_url(bot)
+
+        if not webhook_url:
+            log_to_discord("WEBHOOK_URL not set", "status", "error", fields={"bot": bot["username"]})
+            return False
+
+        # always re-registered: getWebhookInfo cannot tell whether the
+        # secret token still matches
+        with tenants.use(bot):
+            res = telegram_client.call("setWebhook", webhook_settings(webhook_url, bot))
+
+        if res.get("ok"):
+            log_to_discord(
+                "Webhook set successfully",
+                "status",
+                "info",
+                fields={
+                    "bot": bot["username"],
+                    "url": webhook_url,
+                    "updates": ", ".join(ALLOWED_UPDATES),
+                    "max_connections": WEBHOOK_MAX_CONNECTIONS,
+                }
+            )
+            return True
+
+        log_to_discord(
+            "Webhook setup failed",
+            "status",
+            "error",
+            fields={"bot": bot["username"], "response": str(res)}
+        )
+
+    except Exception as e:
+        log_to_discord(
+            "Webhook setup error",
+            "status",
+            "error",
+            fields={"bot": bot["username"], "error": str(e)}
+        )
+
+    return False
+
+
+# ================= WEBHOOK REQUESTS =================
+def check_request(secret, content_length):
+    """
+    Vet a webhook request for the current bot from its headers alone,
+    before the body is read. Returns None to accept it, else the HTTP
+    status to answer with.
+    """
+
+    expected = tenants.current()["secret"]
+
+    if expected and not hmac.compare_digest(secret or "", expected):
+        metrics.inc("webhook_rejections_total", reason="secret")
+        return 403
+
+    if content_length is not None and content_length > WEBHOOK_MAX_BODY:
+        metrics.inc("webhook_rejections_total", reason="too_large")
+        return 413
+
+    return None
+
+
+def parse_update(body):
+    # None for anything that is not a JSON object
+    if not body or len(body) > WEBHOOK_MAX_BODY:
+        return None
+
+    try:
+        update = _loads(body)
+    except ValueError:
+        return None
+
+    return update if isinstance(update, dict) else None
+
+
+def delete_webhook():
+    # pending updates stay queued at Telegram and arrive via getUpdates
+    try:
+        with tenants.use(tenants.PRIMARY):
+            res = telegram_client.call("deleteWebhook", {"drop_pending_updates": False})
+        return bool(res.get("ok"))
+    except Exception:
+        return False
+
+
+# ================= LONG POLLING =================
+def chat_key(update):
+    if "message" in update:
+        return update["message"].get("chat", {}).get("id")
+
+    if "callback_query" in update:
+        msg = update["callback_query"].get("message") or {}
+        return msg.get("chat", {}).get("id")
+
+    return update.get("update_id")
+
+
+def process_batch(updates, process_update, pool):
+    # one sequential lane per chat keeps per-chat order; chats run in parallel
+    lanes = {}
+    for update in updates:
+        lanes.setdefault(chat_key(update), []).append(update)
+
+    def run_lane(lane):
+        for update in lane:
+            try:
+                process_update(update)
+            except Exception as e:
+                log_to_discord(
+                    "Polling update failed",
+                    "status",
+                    "error",
+                    fields={"update_id": update.get("update_id"), "error": str(e)}
+                )
+
+    list(pool.map(run_lane, lanes.values()))
+
+
+def poll_loop(process_update):
+    with ThreadPoolExecutor(max_workers=POLL_WORKERS) as pool:
+        # a deposed leader stops at once, even before stop() reaches it
+        while not _stop.is_set() and leader.is_leader():
+            payload = {
+                "limit": POLL_BATCH_LIMIT,
+                "timeout": POLL_TIMEOUT,
+                "allowed_updates": ALLOWED_UPDATES,
+            }
+
+            if state["offset"] is not None:
+                # also confirms every update below offset to Telegram
+                payload["offset"] = state["offset"]
+
+            try:
+                data = telegram_client.call("getUpdates", payload, timeout=POLL_TIMEOUT + 10)
+            except Exception as e:
+                log_to_discord("getUpdates failed", "status", "warning", fields={"error": str(e)})
+                time.sleep(3)
+                continue
+
+            if not data.get("ok"):
+                # 409 = a webhook is still registered or another poller is running
+                log_to_discord(
+                    "getUpdates rejected",
+                    "status",
+                    "warning",
+                    fields={"error": data.get("description")}
+                )
+                time.sleep(5)
+                continue
+
+            updates = data.get("result") or []
+
+            if not updates:
+                continue
+
+            process_batch(updates, process_update, pool)
+            metrics.inc("polled_updates_total", len(updates))
+
+            # commit only after the whole batch is processed
+            state["offset"] = max(u["update_id"] for u in updates) + 1
+            save_setting(OFFSET_SETTING, state["offset"])
+
+
+def confirm_offset():
+    if state["offset"] is None:
+        return
+
+    try:
+        with tenants.use(tenants.PRIMARY):
+            telegram_client.call(
+                "getUpdates",
+                {"offset": state["offset"], "limit": 1, "timeout": 0}
+            )
+    except Exception:
+        pass
+
+
+# ================= MODE SWITCH =================
+def _resume_polling(process_update):
+    # caller holds _switch_lock
+    _stop.clear()
+    thread = threading.Thread(target=poll_loop, args=(process_update,), daemon=True)
+    state["thread"] = thread
+    state["process_update"] = process_update
+    state["mode"] = "polling"
+    thread.start()
+
+
+def start_polling(process_update):
+    with _switch_lock:
+        if state["mode"] == "polling":
+            return True
+
+        if not delete_webhook():
+            log_to_discord("deleteWebhook failed, staying on webhook", "status", "error")
+            return False
+
+        _resume_polling(process_update)
+
+    # polling serves the primary bot; the others stay on their webhooks
+    if len(tenants.BOTS) > 1:
+        set_webhook(tenants.BOTS[1:])
+
+    log_to_discord("📥 Ingestion switched to polling", "status", "info")
+    return True
+
+
+def stop_polling():
+    thread = state["thread"]
+
+    _stop.set()
+
+    if thread:
+        # waits for the current long poll and its batch to finish
+        thread.join(timeout=POLL_TIMEOUT + 15)
+
+    state["thread"] = None
+    confirm_offset()
+
+
+def stop():
+    # leadership lost: stop polling without registering the webhook, so
+    # the new leader can poll (getUpdates allows one poller per bot)
+    with _switch_lock:
+        if state["mode"] != "polling":
+            return
+
+        stop_polling()
+        state["mode"] = None
+
+    log_to_discord("Polling stopped, no longer leader", "status", "warning")
+
+
+def start_webhook():
+    with _switch_lock:
+        was_polling = state["mode"] == "polling"
+
+        if was_polling:
+            stop_polling()
+
+        if set_webhook():
+            state["mode"] = "webhook"
+        elif was_polling:
+            # never leave the bot with no ingestion at all
+            _resume_polling(state["process_update"])
+            return False
+        else:
+            state["mode"] = "webhook"
+            return False
+
+    if was_polling:
+        log_to_discord("🌐 Ingestion switched to webhook", "status", "info")
+    return True
+
+
+def switch_mode(mode, process_update):
+    # on the leader only; request_mode() is the entry point for the others
+    if mode == "polling":
+        return start_polling(process_update)
+    if mode == "webhook":
+        return start_webhook()
+    return False
+
+
+def stored_mode():
+    return get_setting(MODE_SETTING) or INGESTION_MODE
+
+
+def request_mode(mode):
+    """
+    Store the ingestion mode for the whole deployment. The leader applies
+    it now if this is the leader, else within MODE_CHECK_SECONDS. Returns
+    False if it could not be stored or applied.
+    """
+
+    if not save_setting(MODE_SETTING, mode):
+        return False
+
+    if leader.is_leader() and state["process_update"]:
+        return switch_mode(mode, state["process_update"])
+
+    return True
+
+
+def start(process_update):
+    # on each election: continue from the stored mode and offset
+    state["process_update"] = process_update
+
+    # the stored offset is ahead if another leader polled meanwhile
+    state["offset"] = get_setting(OFFSET_SETTING) or state["offset"]
+
+    return switch_mode(stored_mode(), process_update)
+
+
+def follow_mode(should_apply):
+    # leader loop (see jobs.py): apply a mode stored by another worker
+    while True:
+        time.sleep(MODE_CHECK_SECONDS)
+
+        if not should_apply() or not state["process_update"]:
+            continue
+
+        mode = get_setting(MODE_SETTING)
+
+        if mode and mode != state["mode"]:
+            switch_mode(mode, state["process_update"])
@@ -0,0 +1,124 @@
+# file: jobs.py
+
+import os
+import threading
+import time
+import psutil
+
+from bot import cleanup_pending_files, watch_broadcasts
+from database import db, movies_collection, is_db_available, monitor_mongo
+from handlers import process_update
+from webhook import log_to_discord
+import ingestion
+import leader
+import telegram_client
+
+
+# ================= STARTUP CHECK =================
+def startup_check():
+    try:
+        # Mongo
+        if not is_db_available():
+            mongo_status = "❌ Not Available"
+        else:
+            try:
+                db.command("ping")
+                mongo_status = "✅ Connected"
+            except Exception as e:
+                mongo_status = f"❌ Failed: {str(e)}"
+
+        # Movies
+        try:
+            movie_count = movies_collection.count_documents({})
+        except:
+            movie_count = "Error"
+
+        # RAM
+        process = psutil.Process()
+        mem = process.memory_info().rss / 1024 / 1024
+
+        # Webhook
+        webhook_url = os.getenv("WEBHOOK_URL")
+
+        try:
+            info = telegram_client.call("getWebhookInfo", http_method="get")
+
+            current_url = info.get("result", {}).get("url")
+
+            if ingestion.state["mode"] == "polling":
+                webhook_status = "📥 Polling" if not current_url else "⚠️ Polling, webhook still set"
+            else:
+                webhook_status = "✅ Active" if current_url == webhook_url else "⚠️ Mismatch"
+
+        except Exception as e:
+            webhook_status = f"❌ Error: {str(e)}"
+
+        log_to_discord(
+            "🚀 Bot Startup Report",
+            "status",
+            "info",
+            fields={
+                "🤖 Bot": "Started",
+                "🗄 MongoDB": mongo_status,
+                "🌐 Webhook": webhook_status,
+                "🎬 Movies": movie_count,
+                "🧠 RAM": f"{mem:.2f} MB",
+                "⏱ Time": time.strftime("%Y-%m-%d %H:%M:%S")
+            },
+            force_flush=True
+        )
+
+    except Exception as e:
+        log_to_discord(
+            "Startup check failed",
+            "status",
+            "error",
+            fields={"error": str(e)}
+        )
+
+
+# ================= MONGO MONITOR =================
+# loops that pause while this process is not leader: one thread serves
+# every leadership term
+_loops = {}
+
+
+def _start_loop(name, target):
+    if name in _loops and _loops[name].is_alive():
+        return
+
+    _loops[name] = threading.Thread(target=target, args=(leader.is_leader,), daemon=True)
+    _loops[name].start()
+
+
+def start_background_monitor():
+    # ping probes at adaptive intervals; state lives in mongo_health
+    _start_loop("mongo_monitor", monitor_mongo)
+
+
+# ================= LEADER JOBS =================
+_terms = {"elected": False}
+
+
+def start_leader_jobs(restart_cleanup=cleanup_pending_files):
+    """
+    Run on every election of this process. The startup report and the
+    restart cleanup only run on the first: after a re-election the pending
+    deliveries are live ones of other workers, not leftovers of a restart.
+    """
+
+    ingestion.start(process_update)
+
+    if not _terms["elected"]:
+        _terms["elected"] = True
+        startup_check()
+        restart_cleanup()
+
+    start_background_monitor()
+    _start_loop("broadcasts", watch_broadcasts)
+    _start_loop("ingestion", ingestion.follow_mode)
+
+
+def stop_leader_jobs():
+    # the next leader takes over polling; webhooks reach every process
+    ingestion.stop()
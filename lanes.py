@@ -0,0 +1,196 @@
+# file: lanes.py
+#
+# Priority lanes for the outbound Telegram budget. Every Bot API call made
+# through telegram_client.call takes a token from its bot's bucket
+# (TELEGRAM_RATE per second per bot, as Telegram's flood limits are per
+# token). When callers queue for tokens, lanes are
+# served by weight (stride scheduling), so a broadcast still progresses but
+# cannot starve /start deliveries:
+#
+#     interactive  user updates (/start deep links)        weight 8
+#     callback     inline-button presses                    weight 4
+#     admin        commands sent by the admin               weight 4
+#     bulk         broadcasts, auto-deletes, background     weight 1
+#
+# Admission control: while interactive calls wait longer than
+# INTERACTIVE_SLO_MS for a token, bulk calls are deferred (they wait;
+# nothing is dropped). Slow handlers do not count: only the budget is
+# measured. A bulk call deferred for BULK_MAX_DEFER_SECONDS goes anyway.
+#
+# The lane is per thread. router.dispatch sets it for each update; threads
+# that never set one (jobs, workers) are bulk.
+
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+from config import BULK_MAX_DEFER_SECONDS, INTERACTIVE_SLO_MS, TELEGRAM_BURST, TELEGRAM_RATE
+import metrics
+import tenants
+
+
+LANES = {
+    "interactive": 8,
+    "callback": 4,
+    "admin": 4,
+    "bulk": 1,
+}
+
+DEFAULT_LANE = "bulk"
+
+# an SLO breach only counts while interactive traffic keeps reporting it
+SLO_SAMPLE_TTL = 10
+SLO_SMOOTHING = 0.2
+
+_local = threading.local()
+_cond = threading.Condition()
+
+_state = {
+    "latency": 0.0,       # EWMA of interactive token wait, seconds
+    "latency_at": 0.0,
+}
+
+_budgets = {}  # bot id -> token bucket and lane queues
+
+
+def _queued(name):
+    return sum(len(budget["waiting"][name]) for budget in list(_budgets.values()))
+
+
+for _name in LANES:
+    metrics.gauge_callback("lane_queue_depth", lambda name=_name: _queued(name), lane=_name)
+metrics.gauge_callback("lane_bulk_deferred", lambda: 1 if overloaded() else 0)
+
+
+# ================= CONTEXT =================
+def current():
+    return getattr(_local, "lane", None) or DEFAULT_LANE
+
+
+@contextmanager
+def lane(name):
+    previous = getattr(_local, "lane", None)
+    _local.lane = name
+
+    try:
+        yield
+    finally:
+        _local.lane = previous
+
+
+def bulk(func):
+    # for bulk work that may run on a request thread (broadcasts)
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with lane("bulk"):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+# ================= ADMISSION =================
+def _observe_wait(seconds):
+    # caller holds _cond
+    _state["latency"] += SLO_SMOOTHING * (seconds - _state["latency"])
+    _state["latency_at"] = time.monotonic()
+
+
+def overloaded():
+    return (
+        _state["latency"] * 1000 > INTERACTIVE_SLO_MS
+        and time.monotonic() - _state["latency_at"] < SLO_SAMPLE_TTL
+    )
+
+
+# ================= BUDGET =================
+def _budget(bot_id):
+    # caller holds _cond
+    budget = _budgets.get(bot_id)
+
+    if budget is None:
+        budget = _budgets[bot_id] = {
+            "tokens": float(TELEGRAM_BURST),
+            "refilled": time.monotonic(),
+            "waiting": {name: deque() for name in LANES},
+            "pass": {name: 0.0 for name in LANES},  # stride scheduling virtual time
+        }
+
+    return budget
+
+
+def _refill(budget, now):
+    elapsed = now - budget["refilled"]
+    budget["tokens"] = min(TELEGRAM_BURST, budget["tokens"] + elapsed * TELEGRAM_RATE)
+    budget["refilled"] = now
+
+
+def _eligible(waiting, now):
+    # caller holds _cond; bulk is deferred until its oldest ticket has
+    # waited BULK_MAX_DEFER_SECONDS
+    bulk = waiting["bulk"]
+    deferred = bool(bulk) and overloaded() and now - bulk[0]["at"] < BULK_MAX_DEFER_SECONDS
+    return [
+        name for name in LANES
+        if waiting[name] and not (deferred and name == "bulk")
+    ]
+
+
+def acquire(name=None):
+    """
+    Block until the lane may make one Bot API call as the current bot.
+    No-op when TELEGRAM_RATE is 0.
+    """
+
+    if TELEGRAM_RATE <= 0:
+        return
+
+    name = name or current()
+    started = time.perf_counter()
+    ticket = {"at": time.monotonic()}
+    deferred = False
+
+    with _cond:
+        budget = _budget(tenants.current()["id"])
+        waiting, passes = budget["waiting"], budget["pass"]
+
+        if not waiting[name]:
+            # a lane coming back from idle joins at the current virtual
+            # time instead of spending credit it banked while idle
+            active = [passes[n] for n in LANES if waiting[n]]
+            if active:
+                passes[name] = max(passes[name], min(active))
+
+        waiting[name].append(ticket)
+
+        while True:
+            now = time.monotonic()
+            _refill(budget, now)
+            eligible = _eligible(waiting, now)
+
+            if name == "bulk" and "bulk" not in eligible and not deferred:
+                deferred = True
+                metrics.inc("lane_deferrals_total", lane=name)
+
+            if (
+                budget["tokens"] >= 1
+                and eligible
+                and min(eligible, key=passes.get) == name
+                and waiting[name][0] is ticket
+            ):
+                break
+
+            missing = max(0.0, 1 - budget["tokens"])
+            _cond.wait(max(0.005, missing / TELEGRAM_RATE))
+
+        waiting[name].popleft()
+        budget["tokens"] -= 1
+        passes[name] += 1 / LANES[name]
+        waited = time.perf_counter() - started
+
+        if name == "interactive":
+            _observe_wait(waited)
+
+        _cond.notify_all()
+
+    metrics.observe("telegram_lane_wait_seconds", waited, lane=name)
@@ -0,0 +1,169 @@
+# file: leader.py
+
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from config import (
+    BACKGROUND_JOBS,
+    LEADER_BACKEND,
+    LEADER_LEASE_SECONDS,
+    LEADER_LOCK_FILE,
+)
+from database import leases_collection
+from webhook import log_to_discord
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
+
+LEASE_ID = "background_jobs"
+IDENTITY = f"{socket.gethostname()}:{os.getpid()}"
+
+state = {
+    "leader": False,
+    "since": None,
+    "backend": None,
+    "lock_fd": None,
+}
+
+
+def is_leader():
+    return state["leader"]
+
+
+# ================= FILE LOCK =================
+# one host, many gunicorn workers: the first to flock the file wins and
+# holds it until the process dies (the OS releases it)
+def _acquire_file_lock():
+    if fcntl is None:
+        return False
+
+    if state["lock_fd"] is not None:
+        return True
+
+    fd = os.open(LEADER_LOCK_FILE, os.O_RDWR | os.O_CREAT, 0o644)
+
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        os.close(fd)
+        return False
+
+    os.ftruncate(fd, 0)
+    os.write(fd, IDENTITY.encode())
+    state["lock_fd"] = fd
+    return True
+
+
+# ================= MONGO LEASE =================
+# many hosts: a lease document that the holder keeps renewing
+def _acquire_mongo_lease():
+    now = datetime.now(timezone.utc)
+
+    try:
+        leases_collection.find_one_and_update(
+            {
+                "_id": LEASE_ID,
+                "$or": [{"holder": IDENTITY}, {"expires_at": {"$lt": now}}],
+            },
+            {
+                "$set": {
+                    "holder": IDENTITY,
+                    "expires_at": now + timedelta(seconds=LEADER_LEASE_SECONDS),
+                }
+            },
+            upsert=True,
+        )
+        return True
+
+    except DuplicateKeyError:
+        # someone else holds an unexpired lease
+        return False
+
+    except PyMongoError:
+        # cannot prove we still hold it; step down
+        return False
+
+
+def release():
+    if state["backend"] == "mongo" and state["leader"]:
+        try:
+            leases_collection.delete_one({"_id": LEASE_ID, "holder": IDENTITY})
+        except Exception:
+            pass
+
+    state["leader"] = False
+
+
+def backend():
+    if LEADER_BACKEND == "file" and fcntl is not None:
+        return "file"
+    return "mongo"
+
+
+def _try_acquire():
+    if backend() == "file":
+        return _acquire_file_lock()
+    return _acquire_mongo_lease()
+
+
+# ================= ELECTION =================
+def run_when_leader(start_jobs, stop_jobs=None):
+    """
+    Call start_jobs() each time this process becomes leader, and
+    stop_jobs() each time it loses leadership. Depending on
+    BACKGROUND_JOBS the jobs run inline (single process), never (a
+    separate scheduler.py process owns them) or after winning an election.
+    """
+
+    if BACKGROUND_JOBS == "inline":
+        state.update(leader=True, since=time.time(), backend="inline")
+        start_jobs()
+        return
+
+    if BACKGROUND_JOBS == "external":
+        return
+
+    threading.Thread(target=elect_forever, args=(start_jobs, stop_jobs), daemon=True).start()
+
+
+def elect_forever(start_jobs, stop_jobs=None):
+    state["backend"] = backend()
+    renew_every = max(1, LEADER_LEASE_SECONDS // 3)
+
+    while True:
+        held = _try_acquire()
+
+        if held and not state["leader"]:
+            state.update(leader=True, since=time.time())
+            log_to_discord(
+                "👑 Background leader elected",
+                "status",
+                "info",
+                fields={"holder": IDENTITY, "backend": state["backend"]}
+            )
+
+            start_jobs()
+
+        elif not held and state["leader"]:
+            # daemon loops check is_leader() before each pass; what does
+            # not (long polling) is stopped here
+            state["leader"] = False
+            log_to_discord(
+                "Background leadership lost",
+                "status",
+                "warning",
+                fields={"holder": IDENTITY}
+            )
+
+            if stop_jobs:
+                stop_jobs()
+
+        time.sleep(renew_every)
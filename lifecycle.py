@@ -0,0 +1,125 @@
+# file: lifecycle.py
+#
+# Coordinated shutdown. drain() runs once per process, in order:
+#
+#   1. stop taking updates (webhook answers 503, so Telegram redelivers
+#      to the next instance; polling stops and confirms its offset)
+#   2. wait, up to SHUTDOWN_GRACE_SECONDS, for in-flight updates;
+#      running broadcasts count as in flight, checkpoint and stop
+#   3. delete messages that are already due, flush user activity and
+#      analytics, write the metrics snapshot, give up leadership
+#   4. flush the log sinks last, so the steps above are reported
+#
+# Deliveries whose auto-delete is not due yet stay in sent_files and are
+# cleaned up by the next leader.
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from config import SHUTDOWN_GRACE_SECONDS
+from webhook import log_to_discord
+import database
+import deletions
+import ingestion
+import leader
+import metrics
+import webhook
+
+
+state = {
+    "draining": False,
+    "inflight": 0,
+}
+
+_cond = threading.Condition()
+_drain_once = threading.Lock()
+
+
+# ================= IN-FLIGHT =================
+def is_draining():
+    return state["draining"]
+
+
+@contextmanager
+def inflight():
+    with _cond:
+        state["inflight"] += 1
+
+    try:
+        yield
+    finally:
+        with _cond:
+            state["inflight"] -= 1
+            _cond.notify_all()
+
+
+def _wait_inflight(deadline):
+    with _cond:
+        while state["inflight"] and time.time() < deadline:
+            _cond.wait(deadline - time.time())
+        return state["inflight"]
+
+
+# ================= DRAIN =================
+def _step(name, func):
+    # one failing step must not keep the others from running
+    try:
+        func()
+    except Exception as e:
+        log_to_discord("Shutdown step failed", "status", "warning", fields={"step": name, "error": str(e)})
+
+
+def drain(reason="shutdown", grace=SHUTDOWN_GRACE_SECONDS):
+    """
+    Run the shutdown sequence; returns a summary. Safe to call from
+    several places (signal, /shutdown, lifespan): only the first runs it.
+    """
+
+    if not _drain_once.acquire(blocking=False):
+        return None
+
+    started = time.time()
+    deadline = started + grace
+    state["draining"] = True
+
+    log_to_discord("Bot shutting down", "status", "warning", fields={"reason": reason})
+
+    if ingestion.state["mode"] == "polling" and ingestion.state["thread"]:
+        _step("polling", ingestion.stop_polling)
+
+    unfinished = _wait_inflight(deadline)
+    deletes = {"calls": 0, "saved": 0}
+
+    def delete_due():
+        deletes["calls"], deletes["saved"] = deletions.drain()
+
+    _step("auto_delete", delete_due)
+    _step("activity", database.flush_activity)
+    _step("metrics", metrics.write_process_snapshot)
+    _step("leader", leader.release)
+
+    summary = {
+        "reason": reason,
+        "seconds": round(time.time() - started, 2),
+        "abandoned_updates": unfinished,
+        "delete_calls": deletes["calls"],
+        "deletes_left_for_restart": deletions.pending_count(),
+    }
+
+    log_to_discord("Bot stopped", "status", "info", fields=summary)
+    _step("logs", webhook.flush_all)
+
+    return summary
+
+
+def drain_and_exit(reason):
+    drain(reason)
+    os._exit(0)
+
+
+def start_drain(reason):
+    # off the calling thread: a signal may interrupt the very request the
+    # drain waits for
+    threading.Thread(target=drain_and_exit, args=(reason,)).start()
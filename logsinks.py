@@ -0,0 +1,301 @@
+# file: logsinks.py
+#
+# Structured event pipeline behind log_to_discord(). An event is a
+# message, a category ("status", "access", "group", ...), a severity and
+# raw fields. Every sink has its own level, routing table (category ->
+# channel) and batching; fields are only formatted when a sink flushes.
+# LOG_SINKS picks the sinks:
+#
+#     LOG_SINKS=discord         Discord embeds (default)
+#     LOG_SINKS=discord,jsonl   plus JSON lines on stdout or LOG_JSONL_PATH
+#     LOG_SINKS=jsonl           Discord disabled
+#
+# The standard library reaches the same sinks through the "rypera" logger:
+#
+#     logging.getLogger("rypera.access").info("🎬 File accessed", extra={"fields": {...}})
+
+import json
+import logging
+import sys
+import threading
+import time
+from datetime import datetime
+
+from config import LOG_JSONL_PATH, LOG_LEVEL, LOG_SINKS
+
+
+LEVELS = {
+    "info": 1,
+    "warning": 2,
+    "error": 3,
+}
+
+CATEGORIES = ("status", "list", "access", "group", "usage", "system")
+
+_sinks = {}
+_flusher = {"thread": None}
+_flusher_lock = threading.Lock()
+_state = {"min_level": max(LEVELS.values()) + 1}  # nothing passes until a sink registers
+
+
+# ================= EVENTS =================
+def event(message, category="status", severity="info", fields=None):
+    return {
+        "message": message,
+        "category": category,
+        "severity": severity,
+        "fields": fields,
+        "time": time.time(),
+    }
+
+
+def format_fields(fields):
+    """
+    Render raw fields for output. Callables are evaluated here, so an
+    expensive value costs nothing when no sink keeps the event.
+    """
+
+    formatted = {}
+
+    for key, value in (fields or {}).items():
+        try:
+            formatted[key] = value() if callable(value) else value
+        except Exception as e:
+            formatted[key] = f"<{e}>"
+
+    return formatted
+
+
+def timestamp(ev):
+    return datetime.utcfromtimestamp(ev["time"]).isoformat()
+
+
+# ================= SINKS =================
+class Sink:
+    """
+    Buffers events per channel and hands them to write_batch() once
+    batch_size events are queued or flush_interval has passed (checked on
+    each write and by the flusher thread, so a quiet channel still
+    flushes). Errors and forced events flush the channel at once.
+    """
+
+    name = "sink"
+    batch_size = 50
+    flush_interval = 1.0
+    routes = {"*": "events"}  # category -> channel, None drops
+
+    def __init__(self, level=LOG_LEVEL):
+        self.level = LEVELS.get(level, 1)
+        self.buffers = {}
+        self.last_flush = {}
+        self.lock = threading.Lock()
+
+    def route(self, category):
+        return self.routes.get(category, self.routes.get("*"))
+
+    def accept(self, channel, ev):
+        # hook for sinks that filter or fold events before buffering
+        return True
+
+    def write(self, channel, ev, force=False):
+        with self.lock:
+            buffer = self.buffers.setdefault(channel, [])
+            buffer.append(ev)
+
+            now = time.time()
+            last = self.last_flush.setdefault(channel, now)
+
+            if not (
+                force
+                or ev["severity"] == "error"
+                or len(buffer) >= self.batch_size
+                or now - last >= self.flush_interval
+            ):
+                _start_flusher()
+                return
+
+            self.buffers[channel] = []
+            self.last_flush[channel] = now
+
+        # network / disk I/O happens outside the lock
+        self.write_batch(channel, buffer)
+
+    def flush(self, due_only=False):
+        # due_only: just the channels whose flush_interval has passed
+        with self.lock:
+            now = time.time()
+            pending = {
+                channel: buffer for channel, buffer in self.buffers.items()
+                if buffer and not (
+                    due_only and now - self.last_flush.get(channel, now) < self.flush_interval
+                )
+            }
+
+            for channel in pending:
+                self.buffers[channel] = []
+                self.last_flush[channel] = now
+
+        for channel, buffer in pending.items():
+            self.write_batch(channel, buffer)
+
+    def write_batch(self, channel, events):
+        raise NotImplementedError
+
+
+class JsonLinesSink(Sink):
+    name = "jsonl"
+    routes = {"*": "events"}
+
+    def __init__(self, path=LOG_JSONL_PATH, level=LOG_LEVEL):
+        super().__init__(level)
+        self.path = path
+        self.io_lock = threading.Lock()
+
+    def write_batch(self, channel, events):
+        lines = "".join(
+            json.dumps(
+                {
+                    "ts": timestamp(ev),
+                    "category": ev["category"],
+                    "level": ev["severity"],
+                    "message": str(ev["message"]),
+                    "fields": format_fields(ev["fields"]),
+                },
+                default=str,
+                ensure_ascii=False,
+            ) + "\n"
+            for ev in events
+        )
+
+        with self.io_lock:
+            if self.path == "-":
+                sys.stdout.write(lines)
+                sys.stdout.flush()
+                return
+
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(lines)
+
+
+# ================= REGISTRY =================
+def enabled_sinks():
+    return [name.strip() for name in LOG_SINKS.split(",") if name.strip()]
+
+
+def register(sink):
+    """
+    Add a sink if LOG_SINKS enables it. Returns True when registered.
+    """
+
+    if sink.name not in enabled_sinks():
+        return False
+
+    _sinks[sink.name] = sink
+    _state["min_level"] = min(s.level for s in _sinks.values())
+    _logger.setLevel(_STDLIB_LEVELS[_state["min_level"]])
+    return True
+
+
+def get(name):
+    return _sinks.get(name)
+
+
+def enabled(severity):
+    return LEVELS.get(severity, 1) >= _state["min_level"]
+
+
+# ================= DISPATCH =================
+def dispatch(ev, force=False, exclude=()):
+    level = LEVELS.get(ev["severity"], 1)
+
+    for name, sink in list(_sinks.items()):
+        if level < sink.level or name in exclude:
+            continue
+
+        channel = sink.route(ev["category"])
+        if channel is None:
+            continue
+
+        try:
+            if sink.accept(channel, ev):
+                sink.write(channel, ev, force)
+        except Exception as e:
+            print("LOGGING FAILURE:", name, str(e))
+
+
+def emit(message, category="status", severity="info", fields=None, force=False):
+    # filtered-out levels return before anything is allocated
+    if LEVELS.get(severity, 1) < _state["min_level"]:
+        return
+
+    dispatch(event(message, category, severity, fields), force)
+
+
+def flush_all(due_only=False):
+    for sink in list(_sinks.values()):
+        try:
+            sink.flush(due_only)
+        except Exception as e:
+            print("LOGGING FAILURE:", sink.name, str(e))
+
+
+def _start_flusher():
+    # on the first buffered event, not at import (importing starts no threads)
+    if _flusher["thread"] is not None:
+        return
+
+    with _flusher_lock:
+        if _flusher["thread"] is None:
+            _flusher["thread"] = threading.Thread(target=_flush_loop, daemon=True)
+            _flusher["thread"].start()
+
+
+def _flush_loop():
+    # batches of a channel that goes quiet would otherwise wait for its
+    # next event
+    while True:
+        interval = min((sink.flush_interval for sink in list(_sinks.values())), default=1.0)
+        time.sleep(max(0.2, interval))
+        flush_all(due_only=True)
+
+
+# ================= STDLIB =================
+_STDLIB_LEVELS = {
+    1: logging.INFO,
+    2: logging.WARNING,
+    3: logging.ERROR,
+    4: logging.CRITICAL + 1,
+}
+
+
+class EventHandler(logging.Handler):
+    """
+    Front end for the standard library: "rypera.<category>" loggers feed
+    the sinks, with `extra={"fields": {...}}` for structured fields.
+    """
+
+    def emit(self, record):
+        if record.levelno >= logging.ERROR:
+            severity = "error"
+        elif record.levelno >= logging.WARNING:
+            severity = "warning"
+        else:
+            severity = "info"
+
+        fields = dict(getattr(record, "fields", None) or {})
+
+        if record.exc_info:
+            exc_info = record.exc_info
+            fields["traceback"] = lambda: logging.Formatter().formatException(exc_info)
+
+        category = record.name.partition(".")[2] or "status"
+        emit(record.getMessage(), category, severity, fields)
+
+
+_logger = logging.getLogger("rypera")
+_logger.addHandler(EventHandler())
+_logger.setLevel(_STDLIB_LEVELS[_state["min_level"]])
+# the sinks are the output; do not echo through the root logger too
+_logger.propagate = False
+
+register(JsonLinesSink())
@@ -1,254 +1,192 @@
 # file: main.py
 
 import atexit
+import hmac
 import os
 import signal
 import time
-import requests
-import psutil
 import threading
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify
 
-from bot import cleanup_pending_files
 from webhook import log_to_discord
-from config import BOT_TOKEN, ADMIN_ID
-from handlers import process_update
-from globals import start_time
-from database import is_db_available  # ✅ NEW
+from config import ADMIN_ID, DEBUG_TOKEN, WEBHOOK_MIN_INTERVAL
+from handlers import process_update, start_memory_cleanup
+import config
+import database
+import health
+import ingestion
+import jobs
+import leader
+import lifecycle
+import metrics
+import telegram_client
+import tenants
+import tracing
+
+# Importing this module does no I/O and starts no threads; create_app()
+# does the wiring. `gunicorn main:app` still works through __getattr__.
+routes = Blueprint("bot", __name__)
 
-app = Flask(__name__)
-
-is_shutting_down = False
-mongo_status_flag = True
 initialized = False
 init_lock = threading.Lock()
 
-# 🔥 RATE LIMIT (basic protection)
-LAST_REQUEST_TIME = 0
+_app = None
+_app_lock = threading.Lock()
 
+# 🔥 RATE LIMIT (basic protection), per bot
+LAST_REQUEST_TIME = {}
 
-# ================= AUTO WEBHOOK =================
-def set_webhook():
-    try:
-        webhook_url = os.getenv("WEBHOOK_URL")
 
-        if not webhook_url:
-            log_to_discord("WEBHOOK_URL not set", "status", "error")
+# ================= 🔥 INSTANT STARTUP =================
+def init_system():
+    global initialized
+
+    with init_lock:
+        if initialized:
             return
+        initialized = True
 
-        info = requests.get(
-            f"https://api.telegram.org/bot{BOT_TOKEN}/getWebhookInfo",
-            timeout=10
-        ).json()
+    log_to_discord("🟢 Bot is online", "status", "info")
 
-        current_url = info.get("result", {}).get("url")
+    # per-worker housekeeping
+    metrics.start_snapshot_writer()
+    health.start_sampler()
+    start_memory_cleanup()
 
-        if current_url == webhook_url:
-            log_to_discord("Webhook already set", "status", "info")
-            return
+    # indexes + catalog cache; retries without blocking requests
+    database.connect()
 
-        res = requests.post(
-            f"https://api.telegram.org/bot{BOT_TOKEN}/setWebhook",
-            json={"url": webhook_url},
-            timeout=10
-        ).json()
-
-        if res.get("ok"):
-            log_to_discord(
-                "Webhook set successfully",
-                "status",
-                "info",
-                fields={"url": webhook_url}
-            )
-        else:
-            log_to_discord(
-                "Webhook setup failed",
-                "status",
-                "error",
-                fields={"response": str(res)}
-            )
+    # once per deployment (see BACKGROUND_JOBS)
+    leader.run_when_leader(jobs.start_leader_jobs, jobs.stop_leader_jobs)
 
-    except Exception as e:
-        log_to_discord(
-            "Webhook setup error",
-            "status",
-            "error",
-            fields={"error": str(e)}
-        )
 
+def create_app(start_background=True):
+    """
+    Validate the environment and build the Flask app. Background startup
+    (Mongo, leader election, webhook) runs in a thread, so the app can
+    answer health checks before any of it finishes.
+    """
 
-# ================= STARTUP CHECK =================
-def startup_check():
-    try:
-        from database import db, movies_collection
-
-        # Mongo
-        if not is_db_available():
-            mongo_status = "❌ Not Available"
-        else:
-            try:
-                db.command("ping")
-                mongo_status = "✅ Connected"
-            except Exception as e:
-                mongo_status = f"❌ Failed: {str(e)}"
-
-        # Movies
-        try:
-            movie_count = movies_collection.count_documents({})
-        except:
-            movie_count = "Error"
-
-        # RAM
-        process = psutil.Process()
-        mem = process.memory_info().rss / 1024 / 1024
-
-        # Webhook
-        webhook_url = os.getenv("WEBHOOK_URL")
-
-        try:
-            info = requests.get(
-                f"https://api.telegram.org/bot{BOT_TOKEN}/getWebhookInfo",
-                timeout=10
-            ).json()
-
-            current_url = info.get("result", {}).get("url")
-            webhook_status = "✅ Active" if current_url == webhook_url else "⚠️ Mismatch"
-
-        except Exception as e:
-            webhook_status = f"❌ Error: {str(e)}"
+    config.validate()
 
-        log_to_discord(
-            "🚀 Bot Startup Report",
-            "status",
-            "info",
-            fields={
-                "🤖 Bot": "Started",
-                "🗄 MongoDB": mongo_status,
-                "🌐 Webhook": webhook_status,
-                "🎬 Movies": movie_count,
-                "🧠 RAM": f"{mem:.2f} MB",
-                "⏱ Time": time.strftime("%Y-%m-%d %H:%M:%S")
-            },
-            force_flush=True
-        )
+    app = Flask(__name__)
+    app.register_blueprint(routes)
 
-    except Exception as e:
-        log_to_discord(
-            "Startup check failed",
-            "status",
-            "error",
-            fields={"error": str(e)}
-        )
+    install_signal_handlers()
 
+    if start_background:
+        threading.Thread(target=init_system, daemon=True).start()
 
-# ================= MONGO MONITOR =================
-def monitor_mongo():
-    global mongo_status_flag
-    from database import db
+    return app
 
-    while True:
-        try:
-            if not is_db_available():
-                raise Exception("DB not available")
 
-            db.command("ping")
+def __getattr__(name):
+    # lazy module attribute: `main.app` builds the app on first access
+    global _app
 
-            if not mongo_status_flag:
-                log_to_discord("MongoDB reconnected", "status", "info")
-                mongo_status_flag = True
+    if name != "app":
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-        except Exception as e:
-            if mongo_status_flag:
-                log_to_discord(
-                    "MongoDB disconnected",
-                    "status",
-                    "error",
-                    fields={"error": str(e)}
-                )
-                mongo_status_flag = False
+    with _app_lock:
+        if _app is None:
+            _app = create_app()
 
-        time.sleep(60)
+    return _app
 
 
-def start_background_monitor():
-    threading.Thread(target=monitor_mongo, daemon=True).start()
+# ================= ROUTES =================
+@routes.route("/", methods=["GET"])
+def home():
+    return "Bot is running!", 200
 
 
-# ================= 🔥 INSTANT STARTUP =================
-def init_system():
-    global initialized
+@routes.route("/health", methods=["GET"])
+def health_endpoint():
+    # served from the sampler's snapshot; never blocks on psutil or Mongo
+    snap = health.snapshot()
 
-    with init_lock:
-        if initialized:
-            return
-        initialized = True
+    return jsonify(dict(
+        snap,
+        status="healthy" if health.is_fresh(snap) else "stale",
+        uptime_readable=health.uptime_readable(snap["uptime_seconds"]),
+    ))
 
-    log_to_discord("🟢 Bot is online", "status", "info")
 
-    set_webhook()
-    startup_check()
-    start_background_monitor()
-    cleanup_pending_files()
+@routes.route("/livez", methods=["GET"])
+def liveness():
+    return jsonify({"status": "alive"})
 
 
-threading.Thread(target=init_system, daemon=True).start()
+@routes.route("/readyz", methods=["GET"])
+def readiness():
+    ready, reason = health.readiness(health.snapshot())
+    return jsonify({"ready": ready, "reason": reason}), 200 if ready else 503
 
 
-# ================= ROUTES =================
-@app.route("/", methods=["GET"])
-def home():
-    return "Bot is running!", 200
+@routes.route("/metrics", methods=["GET"])
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
 
 
-@app.route("/health", methods=["GET"])
-def health():
-    try:
-        process = psutil.Process()
-        mem = process.memory_info().rss / 1024 / 1024
-        cpu = process.cpu_percent(interval=0.1)
-
-        uptime = time.time() - start_time
-        h = int(uptime // 3600)
-        m = int((uptime % 3600) // 60)
-        s = int(uptime % 60)
-
-        return jsonify({
-            "status": "healthy",
-            "uptime_seconds": uptime,
-            "uptime_readable": f"{h}h {m}m {s}s",
-            "memory_mb": mem,
-            "cpu_percent": cpu
-        })
+@routes.route("/debug/slow", methods=["GET"])
+def slow_updates():
+    # the admin's Telegram id is no secret; traces need a real token
+    if not DEBUG_TOKEN:
+        return jsonify({"error": "Not found"}), 404
 
-    except Exception as e:
-        log_to_discord(
-            "Health endpoint error",
-            "status",
-            "error",
-            fields={"error": str(e)}
-        )
-        return jsonify({"status": "error"}), 500
+    if not hmac.compare_digest(request.headers.get("X-Debug-Token", ""), DEBUG_TOKEN):
+        return jsonify({"error": "Unauthorized"}), 403
+
+    limit = request.args.get("limit", 20, type=int)
+    return jsonify({"slow_updates": tracing.recent_slow(limit)})
 
 
 # ================= WEBHOOK =================
-@app.route(f"/webhook/{BOT_TOKEN}", methods=["POST"])
-def handle_webhook():
-    global LAST_REQUEST_TIME
+# one route per bot token (see tenants.py)
+@routes.route("/webhook/<token>", methods=["POST"])
+def handle_webhook(token):
+    bot = tenants.by_token(token)
+
+    if bot is None:
+        return jsonify({"error": "Not found"}), 404
+
+    with tenants.use(bot), metrics.timer("webhook_request_seconds"):
+        return _handle_webhook(bot)
+
+
+def _handle_webhook(bot):
+    # draining: Telegram retries, and the retry reaches the new instance
+    if lifecycle.is_draining():
+        return jsonify({"status": "shutting_down"}), 503
 
     try:
+        # forged or oversized requests never reach the JSON decoder
+        status = ingestion.check_request(
+            request.headers.get(ingestion.SECRET_HEADER),
+            request.content_length
+        )
+        if status:
+            return jsonify({"status": "rejected"}), status
+
         # 🔥 SIMPLE RATE LIMIT
         now = time.time()
-        if now - LAST_REQUEST_TIME < 0.05:
+        if now - LAST_REQUEST_TIME.get(bot["id"], 0) < WEBHOOK_MIN_INTERVAL:
+            metrics.inc("rate_limit_rejections_total", scope="webhook")
             return jsonify({"status": "rate_limited"}), 200
 
-        LAST_REQUEST_TIME = now
+        LAST_REQUEST_TIME[bot["id"]] = now
 
-        update = request.get_json(silent=True)
+        update = ingestion.parse_update(request.get_data(cache=False))
 
-        if not isinstance(update, dict):
+        if update is None:
             return jsonify({"status": "ignored"}), 200
 
-        process_update(update)
+        with lifecycle.inflight(), telegram_client.reply_channel() as reply:
+            process_update(update)
+
+        # one Bot API call answered in the response body saves a round trip
+        if reply:
+            return jsonify(reply)
 
         return jsonify(success=True)
 
@@ -263,44 +201,37 @@ def handle_webhook():
 
 
 # ================= SHUTDOWN =================
-@app.route("/shutdown", methods=["POST"])
+@routes.route("/shutdown", methods=["POST"])
 def shutdown():
     if request.json.get("admin_id") == str(ADMIN_ID):
-        global is_shutting_down
-        is_shutting_down = True
-
-        log_to_discord("Bot shutting down", "status", "warning")
-
-        time.sleep(1)  # allow logs to flush
-        os._exit(0)
+        lifecycle.start_drain("admin request")
+        return jsonify({"status": "draining"}), 202
 
     return jsonify({"error": "Unauthorized"}), 403
 
 
 # ================= CLEAN EXIT =================
 def on_exit():
-    if is_shutting_down:
-        log_to_discord("Bot stopped", "status", "info")
+    # plain interpreter exit (no signal): same sequence, no os._exit
+    lifecycle.drain("exit")
 
 
 def handle_shutdown(signum, frame):
-    global is_shutting_down
-    is_shutting_down = True
-
-    log_to_discord("Process terminated", "status", "warning")
+    lifecycle.start_drain(signal.Signals(signum).name)
 
-    time.sleep(1)
-    os._exit(0)
 
+def install_signal_handlers():
+    atexit.register(on_exit)
 
-atexit.register(on_exit)
-signal.signal(signal.SIGTERM, handle_shutdown)
-signal.signal(signal.SIGINT, handle_shutdown)
+    # signal handlers can only be set from the main thread
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, handle_shutdown)
+        signal.signal(signal.SIGINT, handle_shutdown)
 
 
 # ================= LOCAL RUN =================
 if __name__ == "__main__":
-    app.run(
+    create_app().run(
         host="0.0.0.0",
         port=int(os.getenv("PORT", 8080)),
         use_reloader=False
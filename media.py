@@ -0,0 +1,349 @@
+# file: media.py
+
+import threading
+import time
+
+from config import ADMIN_ID
+from database import (
+    forget_bot_file_id,
+    get_catalog_file_ids,
+    save_bot_file_id,
+    save_movie_source,
+    set_file_status,
+)
+from webhook import log_to_discord
+import metrics
+import telegram_client
+import tenants
+
+
+# fields kept from a document/video payload at upload time
+METADATA_FIELDS = (
+    "file_unique_id",
+    "file_size",
+    "mime_type",
+    "file_name",
+    "duration",
+    "width",
+    "height",
+)
+
+# Bot API descriptions that mean the file_id itself is unusable
+INVALID_FILE_ERRORS = (
+    "wrong file identifier",
+    "invalid file_id",
+    "file reference expired",
+    "wrong remote file identifier",
+)
+
+# a full catalog sweep needs this many invalid ids in one batch, and runs
+# at most once per SWEEP_INTERVAL seconds
+SWEEP_MIN_INVALID = 2
+SWEEP_INTERVAL = 3600
+
+_pending = set()  # file_ids waiting for the next pass
+_forget = set()   # (bot id, file_id) refused for a bot other than the primary
+_lock = threading.Lock()
+_worker = {"running": False, "swept_at": None}
+
+
+# ================= METADATA =================
+def extract_metadata(msg):
+    """
+    Upload-time enrichment: everything Telegram already told us about the
+    file, without an extra API call. Returns None for non-file messages.
+    """
+
+    for kind in ("document", "video"):
+        payload = msg.get(kind)
+
+        if payload:
+            metadata = {"file_id": payload["file_id"], "kind": kind}
+            metadata.update({k: payload[k] for k in METADATA_FIELDS if k in payload})
+            return metadata
+
+    return None
+
+
+def is_invalid_file_error(description):
+    description = (description or "").lower()
+    return any(error in description for error in INVALID_FILE_ERRORS)
+
+
+# ================= PER-BOT FILE IDS =================
+# A file_id only works for the bot that received it. The catalog's
+# file_id is the primary bot's; other bots keep theirs in "file_ids"
+# (bot id -> file_id), all for the same file_unique_id. A bot without one
+# makes its delivery's storage copy by forwarding the movie's "source"
+# message (a copy in the primary's storage chat) to its own storage chat:
+# the forwarded message carries the file_id for that bot, so resolving
+# costs no extra message. Every bot must be able to read that chat.
+def _file_payload(message):
+    return (message or {}).get("document") or (message or {}).get("video")
+
+
+def _forward_source(source):
+    # as the current bot; returns the forwarded message or None
+    try:
+        data = telegram_client.call(
+            "forwardMessage",
+            {
+                "chat_id": tenants.current()["storage_chat_id"],
+                "from_chat_id": source["chat_id"],
+                "message_id": source["message_id"],
+                "disable_notification": True,
+            }
+        )
+    except Exception:
+        return None
+
+    return data.get("result") if data.get("ok") else None
+
+
+def _store_source(movie):
+    # movies uploaded before per-bot ids have no source message yet
+    with tenants.use(tenants.PRIMARY):
+        storage_chat_id = tenants.PRIMARY["storage_chat_id"]
+
+        if not storage_chat_id:
+            return None
+
+        try:
+            data = telegram_client.call(
+                "sendDocument",
+                {"chat_id": storage_chat_id, "document": movie["file_id"], "disable_notification": True}
+            )
+        except Exception:
+            return None
+
+    if not data.get("ok"):
+        return None
+
+    source = {"chat_id": storage_chat_id, "message_id": data["result"]["message_id"]}
+    save_movie_source(movie["name"], source)
+    return source
+
+
+def file_id_for(movie):
+    # the current bot's known file_id, None until resolve_by_storage_copy()
+    bot_id = tenants.scope()
+
+    if bot_id is None:
+        return movie.get("file_id")
+
+    return (movie.get("file_ids") or {}).get(bot_id)
+
+
+def resolve_by_storage_copy(movie):
+    """
+    The storage copy of a delivery by a bot that has no file_id for the
+    movie yet. Returns (file_id, storage message_id), after saving the
+    file_id, or (None, None).
+    """
+
+    bot_id = tenants.scope()
+    source = movie.get("source") or _store_source(movie)
+    message = _forward_source(source) if source else None
+    payload = _file_payload(message)
+
+    if not payload:
+        metrics.inc("file_id_resolutions_total", result="failed")
+        log_to_discord(
+            "File not resolvable for bot",
+            "status",
+            "warning",
+            fields={"movie": movie.get("name"), "bot": tenants.current()["username"]}
+        )
+        return None, None
+
+    metrics.inc("file_id_resolutions_total", result="ok")
+    save_bot_file_id(movie["name"], bot_id, payload["file_id"])
+    return payload["file_id"], message["message_id"]
+
+
+def catalog_metadata(metadata):
+    """
+    Upload metadata in catalog form. An upload to another bot carries
+    that bot's file_id: it is kept in file_ids, and the primary's id and
+    the source message are obtained by storing the file and forwarding
+    it as the primary. None if that fails.
+    """
+
+    bot_id = tenants.scope()
+
+    if bot_id is None:
+        return metadata
+
+    try:
+        data = telegram_client.call(
+            "sendDocument",
+            {
+                "chat_id": tenants.current()["storage_chat_id"],
+                "document": metadata["file_id"],
+                "disable_notification": True,
+            }
+        )
+    except Exception:
+        return None
+
+    if not data.get("ok"):
+        return None
+
+    stored = {"chat_id": data["result"]["chat"]["id"], "message_id": data["result"]["message_id"]}
+
+    with tenants.use(tenants.PRIMARY):
+        message = _forward_source(stored)
+
+    payload = _file_payload(message)
+
+    if not payload:
+        return None
+
+    return dict(
+        metadata,
+        file_id=payload["file_id"],
+        file_ids={bot_id: metadata["file_id"]},
+        source={"chat_id": message["chat"]["id"], "message_id": message["message_id"]},
+    )
+
+
+def report_invalid(file_id):
+    # a delivery was refused: the primary's ids are revalidated, another
+    # bot's id is dropped and resolved again on its next delivery
+    bot_id = tenants.scope()
+
+    if bot_id is None:
+        request_revalidation(file_id)
+        return
+
+    with _lock:
+        _forget.add((bot_id, file_id))
+    _wake_worker()
+
+
+# ================= REVALIDATION =================
+def validate_file_id(file_id):
+    """
+    True if Telegram still knows file_id, False if it rejects it, None if
+    the check itself failed (network, rate limit).
+    """
+
+    try:
+        data = telegram_client.call("getFile", {"file_id": file_id})
+    except Exception:
+        return None
+
+    if data.get("ok"):
+        return True
+
+    description = data.get("description", "")
+
+    # getFile refuses downloads over 20MB, but only for files it found
+    if "file is too big" in description.lower():
+        return True
+
+    if is_invalid_file_error(description):
+        return False
+
+    return None
+
+
+def request_revalidation(file_id):
+    # called from a failed delivery; the check runs off the request path
+    with _lock:
+        _pending.add(file_id)
+    _wake_worker()
+
+
+def _wake_worker():
+    # one worker thread drains every queued report, however many arrive
+    with _lock:
+        if _worker["running"]:
+            return
+        _worker["running"] = True
+
+    threading.Thread(target=_revalidation_loop, daemon=True).start()
+
+
+def _revalidation_loop():
+    while True:
+        with _lock:
+            if not _pending and not _forget:
+                _worker["running"] = False
+                return
+
+            batch = list(_pending)
+            forget = list(_forget)
+            _pending.clear()
+            _forget.clear()
+
+        for bot_id, file_id in forget:
+            forget_bot_file_id(bot_id, file_id)
+
+        if not batch:
+            continue
+
+        invalid = _revalidate(batch)
+
+        # file_ids tend to go stale together (re-created bot, deleted
+        # storage chat): several bad ids at once trigger a catalog sweep
+        if len(invalid) >= SWEEP_MIN_INVALID and _sweep_due():
+            _revalidate([f for f in get_catalog_file_ids() if f not in batch])
+
+
+def _sweep_due():
+    now = time.monotonic()
+
+    with _lock:
+        if _worker["swept_at"] is not None and now - _worker["swept_at"] < SWEEP_INTERVAL:
+            metrics.inc("file_revalidation_sweeps_total", result="skipped")
+            return False
+        _worker["swept_at"] = now
+
+    metrics.inc("file_revalidation_sweeps_total", result="run")
+    return True
+
+
+def _revalidate(file_ids):
+    invalid = []
+    names = []
+
+    for file_id in file_ids:
+        valid = validate_file_id(file_id)
+
+        if valid is None:
+            metrics.inc("file_revalidations_total", result="unknown")
+            continue
+
+        affected = set_file_status(file_id, "ok" if valid else "invalid")
+        metrics.inc("file_revalidations_total", result="ok" if valid else "invalid")
+
+        if not valid:
+            invalid.append(file_id)
+            names.extend(affected or [])
+
+        time.sleep(0.05)  # stay well under the Bot API limits
+
+    if names:
+        # only movies that just turned invalid; known ones were reported
+        log_to_discord(
+            "⚠️ Stale file_ids found",
+            "status",
+            "warning",
+            fields={"count": len(invalid), "movies": ", ".join(names[:10])}
+        )
+
+        listing = "\n".join(f"• {name}" for name in names[:20])
+
+        try:
+            telegram_client.call(
+                "sendMessage",
+                {
+                    "chat_id": ADMIN_ID,
+                    "text": f"⚠️ These files are no longer valid, re-upload them:\n\n{listing}"
+                }
+            )
+        except Exception:
+            pass
+
+    return invalid
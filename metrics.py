@@ -0,0 +1,277 @@
+# file: metrics.py
+
+import glob
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from config import METRICS_MULTIPROC_DIR
+
+
+# ================= DEFINITIONS =================
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+METRICS = {
+    # name: (type, help)
+    "webhook_request_seconds": ("histogram", "Time spent handling a Telegram webhook request"),
+    "update_processing_seconds": ("histogram", "process_update time per command type"),
+    "telegram_api_seconds": ("histogram", "Telegram Bot API call latency per method"),
+    "telegram_api_requests_total": ("counter", "Telegram Bot API calls per method and outcome"),
+    "telegram_inline_replies_total": ("counter", "Bot API calls returned in the webhook response instead"),
+    "telegram_lane_wait_seconds": ("histogram", "Time a Bot API call waited for the shared budget, per lane"),
+    "lane_queue_depth": ("gauge", "Bot API calls queued for the shared budget, per lane"),
+    "lane_deferrals_total": ("counter", "Bulk calls held back while the interactive SLO was breached"),
+    "lane_bulk_deferred": ("gauge", "1 while bulk calls are deferred by admission control"),
+    "db_query_seconds": ("histogram", "Latency of database.py functions"),
+    "db_queries_total": ("counter", "database.py calls per function and outcome"),
+    "discord_flush_seconds": ("histogram", "Discord webhook flush latency per channel"),
+    "discord_flush_failures_total": ("counter", "Discord webhook flushes that fell back to disk"),
+    "discord_events_aggregated_total": ("counter", "Log events folded into Discord activity summaries"),
+    "rate_limit_rejections_total": ("counter", "Requests rejected by a rate limiter"),
+    "webhook_rejections_total": ("counter", "Webhook requests refused before parsing (bad secret, oversized)"),
+    "dedup_hits_total": ("counter", "Duplicate updates or sends that were skipped"),
+    "pending_auto_deletes": ("gauge", "Delivered files waiting for auto-delete"),
+    "open_dialogs": ("gauge", "Admin dialogs (upload name, confirmations) still open"),
+    "deleted_messages_total": ("counter", "Messages deleted per path (batched, single, failed)"),
+    "delete_calls_saved_total": ("counter", "deleteMessage calls avoided by batching"),
+    "file_revalidations_total": ("counter", "Stored file_ids re-checked with getFile per result"),
+    "file_revalidation_sweeps_total": ("counter", "Full catalog revalidation sweeps, run or skipped by the rate limit"),
+    "file_id_resolutions_total": ("counter", "file_ids obtained for a bot other than the primary, per result"),
+    "broadcast_messages_total": ("counter", "Broadcast messages per result"),
+    "broadcast_progress_ratio": ("gauge", "Fraction of the running broadcast already sent"),
+    "ingestion_polling": ("gauge", "1 while updates are ingested via getUpdates"),
+    "polled_updates_total": ("counter", "Updates received through long polling"),
+}
+
+
+# ================= REGISTRY =================
+# counters and histograms are striped by thread so hot paths rarely share
+# a lock; shards are merged only when /metrics is scraped
+STRIPES = 16
+
+_shards = [
+    {"lock": threading.Lock(), "counters": {}, "histograms": {}}
+    for _ in range(STRIPES)
+]
+
+# thread idents are aligned addresses (ident % STRIPES is always 0), so
+# each thread takes the next stripe in turn instead
+_stripe = threading.local()
+_next_stripe = itertools.count()
+
+_gauges = {}
+_gauge_callbacks = {}
+_gauge_lock = threading.Lock()
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def _shard():
+    index = getattr(_stripe, "index", None)
+
+    if index is None:
+        index = _stripe.index = next(_next_stripe) % STRIPES
+
+    return _shards[index]
+
+
+def inc(name, value=1, **labels):
+    shard = _shard()
+    key = _key(name, labels)
+
+    with shard["lock"]:
+        shard["counters"][key] = shard["counters"].get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    shard = _shard()
+    key = _key(name, labels)
+
+    with shard["lock"]:
+        hist = shard["histograms"].get(key)
+
+        if hist is None:
+            # per-bucket counts (non cumulative), then sum, then count
+            hist = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            shard["histograms"][key] = hist
+
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                hist[i] += 1
+                break
+
+        hist[-2] += seconds
+        hist[-1] += 1
+
+
+def set_gauge(name, value, **labels):
+    with _gauge_lock:
+        _gauges[_key(name, labels)] = value
+
+
+def gauge_callback(name, fn, **labels):
+    # evaluated at scrape time, e.g. queue depths
+    _gauge_callbacks[_key(name, labels)] = fn
+
+
+@contextmanager
+def timer(name, **labels):
+    started = time.perf_counter()
+    try:
+        yield labels
+    finally:
+        observe(name, time.perf_counter() - started, **labels)
+
+
+# ================= SNAPSHOT =================
+def snapshot():
+    counters = {}
+    histograms = {}
+
+    for shard in _shards:
+        with shard["lock"]:
+            for key, value in shard["counters"].items():
+                counters[key] = counters.get(key, 0) + value
+
+            for key, hist in shard["histograms"].items():
+                merged = histograms.get(key)
+                if merged is None:
+                    histograms[key] = list(hist)
+                else:
+                    for i, value in enumerate(hist):
+                        merged[i] += value
+
+    with _gauge_lock:
+        gauges = dict(_gauges)
+
+    for key, fn in list(_gauge_callbacks.items()):
+        try:
+            gauges[key] = fn()
+        except Exception:
+            pass
+
+    return {"counters": counters, "histograms": histograms, "gauges": gauges}
+
+
+# ================= MULTIPROCESS (gunicorn) =================
+def _encode(snap):
+    return {
+        kind: [[name, list(labels), value] for (name, labels), value in values.items()]
+        for kind, values in snap.items()
+    }
+
+
+def _decode(data):
+    return {
+        kind: {(name, tuple(tuple(l) for l in labels)): value for name, labels, value in values}
+        for kind, values in data.items()
+    }
+
+
+def write_process_snapshot():
+    if not METRICS_MULTIPROC_DIR:
+        return
+
+    path = os.path.join(METRICS_MULTIPROC_DIR, f"metrics_{os.getpid()}.json")
+    tmp = path + ".tmp"
+
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(_encode(snapshot()), f)
+        os.replace(tmp, path)
+    except OSError:
+        pass
+
+
+def start_snapshot_writer(interval=10):
+    if not METRICS_MULTIPROC_DIR:
+        return
+
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+
+    def loop():
+        while True:
+            write_process_snapshot()
+            time.sleep(interval)
+
+    threading.Thread(target=loop, daemon=True).start()
+
+
+def _collect_all_processes():
+    write_process_snapshot()
+
+    merged = {"counters": {}, "histograms": {}, "gauges": {}}
+
+    for path in glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "metrics_*.json")):
+        pid = os.path.basename(path)[len("metrics_"):-len(".json")]
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = _decode(json.load(f))
+        except (OSError, ValueError):
+            continue
+
+        for key, value in data.get("counters", {}).items():
+            merged["counters"][key] = merged["counters"].get(key, 0) + value
+
+        for key, hist in data.get("histograms", {}).items():
+            if key not in merged["histograms"]:
+                merged["histograms"][key] = list(hist)
+            else:
+                for i, value in enumerate(hist):
+                    merged["histograms"][key][i] += value
+
+        # gauges are point-in-time per worker, keep them apart
+        for (name, labels), value in data.get("gauges", {}).items():
+            merged["gauges"][(name, labels + (("pid", pid),))] = value
+
+    return merged
+
+
+# ================= EXPOSITION =================
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def render():
+    snap = _collect_all_processes() if METRICS_MULTIPROC_DIR else snapshot()
+
+    by_name = {}
+    for kind in ("counters", "gauges", "histograms"):
+        for (name, labels), value in snap[kind].items():
+            by_name.setdefault(name, []).append((kind, labels, value))
+
+    lines = []
+
+    for name in sorted(by_name):
+        metric_type, help_text = METRICS.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+
+        for kind, labels, value in sorted(by_name[name], key=lambda item: item[1]):
+            if kind != "histograms":
+                lines.append(f"{name}{_labels(labels)} {value}")
+                continue
+
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, value):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels, [('le', bound)])} {cumulative}")
+
+            lines.append(f"{name}_bucket{_labels(labels, [('le', '+Inf')])} {value[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {value[-2]}")
+            lines.append(f"{name}_count{_labels(labels)} {value[-1]}")
+
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,230 @@
+# file: mongo_health.py
+
+import threading
+import time
+
+from pymongo.errors import AutoReconnect, ConnectionFailure, NetworkTimeout, ServerSelectionTimeoutError
+
+from config import (
+    MONGO_FAILURE_THRESHOLD,
+    MONGO_RECOVERY_TIMEOUT,
+    MONGO_PROBE_INTERVAL,
+    MONGO_PROBE_MIN_INTERVAL,
+)
+from webhook import log_to_discord
+
+
+# ================= CIRCUIT STATES =================
+CLOSED = "closed"        # healthy, every query goes through
+OPEN = "open"            # tripped, queries short-circuit to fallbacks
+HALF_OPEN = "half_open"  # recovering, one trial query decides the outcome
+
+_lock = threading.Lock()
+
+state = {
+    "status": CLOSED,
+    "failures": 0,
+    "probe_failures": 0,
+    "opened_at": 0.0,
+    "last_error": None,
+    "last_ping_ms": None,
+    "last_change": time.time(),
+    "trial_at": None,
+}
+
+# the server could not be reached. Anything else (duplicate key, write
+# errors, bad queries) means it answered: not an outage, so it never
+# counts towards opening the circuit
+CONNECTIVITY_ERRORS = (ConnectionFailure, AutoReconnect, ServerSelectionTimeoutError, NetworkTimeout)
+
+# callbacks fired when the circuit closes again (indexes, cache warmup).
+# They run on their own thread, never on the request that closed it
+RECOVERY_HOOKS = []
+
+_recovery = {"thread": None}
+
+
+# ================= TRANSITIONS =================
+def _transition(new_status):
+    # caller holds _lock
+    old_status = state["status"]
+
+    if old_status == new_status:
+        return None
+
+    state["status"] = new_status
+    state["last_change"] = time.time()
+
+    if new_status == OPEN:
+        state["opened_at"] = time.time()
+
+    state["trial_at"] = None
+    return old_status
+
+
+def _announce(old_status, new_status, error=None):
+    if old_status is None:
+        return
+
+    if new_status == OPEN:
+        log_to_discord(
+            "MongoDB disconnected",
+            "status",
+            "error",
+            fields={"error": str(error), "previous": old_status}
+        )
+
+    elif new_status == CLOSED:
+        log_to_discord("MongoDB reconnected", "status", "info")
+        _start_recovery()
+
+
+def _run_recovery_hooks():
+    for hook in list(RECOVERY_HOOKS):
+        try:
+            hook()
+        except Exception as e:
+            log_to_discord(
+                "Mongo recovery hook failed",
+                "status",
+                "warning",
+                fields={"hook": getattr(hook, "__name__", "hook"), "error": str(e)}
+            )
+
+
+def _start_recovery():
+    with _lock:
+        thread = _recovery["thread"]
+
+        # a flapping circuit must not stack index builds and cache reloads
+        if thread and thread.is_alive():
+            return
+
+        _recovery["thread"] = threading.Thread(target=_run_recovery_hooks, daemon=True)
+        _recovery["thread"].start()
+
+
+def on_recovery(hook):
+    RECOVERY_HOOKS.append(hook)
+    return hook
+
+
+# ================= QUERY GATE =================
+def _admit_trial():
+    # caller holds _lock. Half-open lets a single query through; the rest
+    # short-circuit until it reports back. A trial that never reports
+    # (application error, killed thread) expires after the probe interval
+    now = time.time()
+    trial_at = state["trial_at"]
+
+    if trial_at is not None and now - trial_at < MONGO_PROBE_MIN_INTERVAL:
+        return False
+
+    state["trial_at"] = now
+    return True
+
+
+def allow_request():
+    with _lock:
+        status = state["status"]
+
+        if status == CLOSED:
+            return True
+
+        if status == HALF_OPEN:
+            return _admit_trial()
+
+        # time-based half-open in case the probe thread is not running
+        if time.time() - state["opened_at"] >= MONGO_RECOVERY_TIMEOUT:
+            _transition(HALF_OPEN)
+            return _admit_trial()
+
+        return False
+
+
+def record_success():
+    with _lock:
+        state["failures"] = 0
+        state["last_error"] = None
+        old_status = _transition(CLOSED)
+
+    _announce(old_status, CLOSED)
+
+
+def record_failure(error=None):
+    with _lock:
+        state["failures"] += 1
+        state["last_error"] = str(error) if error else None
+
+        old_status = None
+        if state["status"] == HALF_OPEN or state["failures"] >= MONGO_FAILURE_THRESHOLD:
+            if state["status"] == OPEN:
+                # re-arm the recovery timer on every failure while open
+                state["opened_at"] = time.time()
+            else:
+                old_status = _transition(OPEN)
+
+    _announce(old_status, OPEN, error)
+
+
+def is_available():
+    return state["status"] != OPEN
+
+
+def snapshot():
+    with _lock:
+        return dict(state)
+
+
+# ================= PROBES =================
+def next_probe_interval():
+    status = state["status"]
+
+    if status == CLOSED:
+        return MONGO_PROBE_INTERVAL
+
+    if status == HALF_OPEN:
+        return MONGO_PROBE_MIN_INTERVAL
+
+    # open: back off exponentially while Atlas stays unreachable
+    backoff = MONGO_PROBE_MIN_INTERVAL * (2 ** state["probe_failures"])
+    return min(backoff, MONGO_PROBE_INTERVAL)
+
+
+def probe(ping):
+    started = time.time()
+
+    try:
+        ping()
+    except Exception as e:
+        with _lock:
+            state["probe_failures"] += 1
+
+        record_failure(e)
+        return False
+
+    with _lock:
+        state["probe_failures"] = 0
+        state["last_ping_ms"] = round((time.time() - started) * 1000, 2)
+
+        # open -> half-open on the first good ping, closed on the second
+        # (a successful real query closes it sooner)
+        old_status = None
+        if state["status"] == OPEN:
+            old_status = _transition(HALF_OPEN)
+        elif state["status"] == HALF_OPEN:
+            state["failures"] = 0
+            old_status = _transition(CLOSED)
+
+    _announce(old_status, state["status"])
+    return True
+
+
+def run_monitor(ping, should_probe=None):
+    while True:
+        time.sleep(next_probe_interval())
+
+        if should_probe and not should_probe():
+            continue
+
+        probe(ping)
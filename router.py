@@ -0,0 +1,152 @@
+# file: router.py
+
+from webhook import log_to_discord
+import lanes
+import metrics
+import telegram_client
+import tenants
+import tracing
+
+
+# ================= REGISTRY =================
+COMMANDS = {}          # "/stats" -> route
+CALLBACKS = {}         # "delete_confirm" (or "prefix" of "prefix:arg") -> route
+MESSAGE_HANDLERS = []  # ordered fallbacks for non-command messages
+
+
+def _route(name, handler, middleware):
+    return {"name": name, "handler": handler, "middleware": list(middleware)}
+
+
+def command(name, *middleware):
+    def decorator(func):
+        COMMANDS[name] = _route(name, func, middleware)
+        return func
+    return decorator
+
+
+def callback(prefix, *middleware):
+    def decorator(func):
+        CALLBACKS[prefix] = _route(f"callback:{prefix}", func, middleware)
+        return func
+    return decorator
+
+
+def message(name, predicate, *middleware):
+    def decorator(func):
+        route = _route(name, func, middleware)
+        route["predicate"] = predicate
+        MESSAGE_HANDLERS.append(route)
+        return func
+    return decorator
+
+
+# ================= RESOLVE =================
+def command_token(text):
+    # "/start@MyBot abc" -> "/start"
+    return text.split(maxsplit=1)[0].split("@", 1)[0]
+
+
+def _callback_context(update):
+    query = update["callback_query"]
+    data = query.get("data") or ""
+    key, _, arg = data.partition(":")
+
+    ctx = {
+        "update": update,
+        "query": query,
+        "data": data,
+        "arg": arg,
+        "user": query["from"],
+        "user_id": query["from"]["id"],
+        "chat_id": query["message"]["chat"]["id"],
+    }
+    return CALLBACKS.get(key), ctx
+
+
+def _message_context(update):
+    msg = update["message"]
+    text = msg.get("text", "")
+
+    ctx = {
+        "update": update,
+        "msg": msg,
+        "text": text,
+        "args": "",
+        "user": msg["from"],
+        "user_id": msg["from"]["id"],
+        "chat_id": msg["chat"]["id"],
+    }
+
+    if text.startswith("/"):
+        route = COMMANDS.get(command_token(text))
+        if route:
+            parts = text.split(maxsplit=1)
+            ctx["args"] = parts[1] if len(parts) > 1 else ""
+            return route, ctx
+
+    for route in MESSAGE_HANDLERS:
+        if route["predicate"](ctx):
+            return route, ctx
+
+    return None, ctx
+
+
+def resolve(update):
+    if "callback_query" in update:
+        return _callback_context(update)
+
+    if "message" in update:
+        return _message_context(update)
+
+    return None, None
+
+
+# ================= DISPATCH =================
+def update_lane(ctx):
+    # which share of the Telegram budget this update's calls draw from
+    if "query" in ctx:
+        return "callback"
+    if tenants.is_admin(ctx["user_id"]):
+        return "admin"
+    return "interactive"
+
+
+def dispatch(update):
+    try:
+        route, ctx = resolve(update)
+    except (KeyError, TypeError):
+        return  # malformed update
+
+    name = route["name"] if route else "unhandled"
+    lane = update_lane(ctx) if ctx else lanes.DEFAULT_LANE
+    tracing.begin(update.get("update_id"), name)
+
+    try:
+        with lanes.lane(lane), metrics.timer("update_processing_seconds", command=name):
+            if route is None:
+                if ctx and "query" in ctx:
+                    # stale or unknown button: stop the client's spinner
+                    telegram_client.reply(
+                        "answerCallbackQuery",
+                        {"callback_query_id": ctx["query"]["id"]}
+                    )
+                return
+
+            # middleware returns False to stop the chain
+            for middleware in route["middleware"]:
+                if not middleware(ctx):
+                    return
+
+            route["handler"](ctx)
+
+    except Exception as e:
+        log_to_discord(
+            "Handler crash",
+            "status",
+            "error",
+            fields={"command": name, "error": str(e)}
+        )
+
+    finally:
+        tracing.end()
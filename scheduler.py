@@ -0,0 +1,43 @@
+# file: scheduler.py
+#
+# Dedicated background-jobs process for BACKGROUND_JOBS=external:
+#
+#     web:       gunicorn main:app --workers 4
+#     scheduler: python scheduler.py
+#
+# Request workers then only serve webhooks; this process registers the
+# webhook (or long-polls), reports startup, monitors Mongo and cleans up
+# deliveries left over from a restart.
+
+import signal
+
+from database import connect
+from handlers import start_memory_cleanup
+from webhook import log_to_discord
+import config
+import jobs
+import leader
+import lifecycle
+import metrics
+
+
+def main():
+    config.validate()
+
+    log_to_discord("🗓 Scheduler process online", "status", "info")
+
+    metrics.start_snapshot_writer()
+    start_memory_cleanup()  # long-polled updates are processed here
+    connect()
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: lifecycle.start_drain("SIGTERM"))
+
+    # still elect, so two scheduler replicas never run the jobs twice
+    leader.elect_forever(jobs.start_leader_jobs, jobs.stop_leader_jobs)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        lifecycle.drain("SIGINT")
@@ -0,0 +1,122 @@
+# file: telegram_client.py
+
+import requests
+import threading
+import time
+from contextlib import contextmanager
+
+from config import TELEGRAM_API_BASE, TELEGRAM_POOL_SIZE
+import lanes
+import metrics
+import tenants
+import tracing
+
+
+# one keep-alive pool for every bot in the process (all on api.telegram.org)
+_session = requests.Session()
+for _prefix in ("https://", "http://"):
+    _session.mount(_prefix, requests.adapters.HTTPAdapter(pool_maxsize=TELEGRAM_POOL_SIZE))
+
+
+# not messages: ingestion and configuration calls skip the lane budget
+UNBUDGETED = {"getUpdates", "getWebhookInfo", "setWebhook", "deleteWebhook", "getFile"}
+
+
+def api_url(method):
+    # as the bot of the current update or job (see tenants.py)
+    return f"{TELEGRAM_API_BASE}/bot{tenants.current()['token']}/{method}"
+
+
+def file_url(file_path):
+    # download URL for a getFile result
+    return f"{TELEGRAM_API_BASE}/file/bot{tenants.current()['token']}/{file_path}"
+
+
+# ================= CALL =================
+def call(method, payload=None, timeout=10, http_method="post", files=None):
+    # single choke point for every Bot API request (metrics and trace spans per method)
+    if method not in UNBUDGETED:
+        lanes.acquire()
+
+    started = time.perf_counter()
+    outcome = "exception"
+
+    try:
+        with tracing.span("telegram", method):
+            if http_method == "get":
+                res = _session.get(api_url(method), params=payload, timeout=timeout)
+            elif files:
+                # multipart upload (sendDocument with a local file)
+                res = _session.post(api_url(method), data=payload, files=files, timeout=timeout)
+            else:
+                res = _session.post(api_url(method), json=payload, timeout=timeout)
+
+            data = res.json()
+
+        outcome = "ok" if data.get("ok") else "api_error"
+        return data
+
+    finally:
+        metrics.observe(
+            "telegram_api_seconds",
+            time.perf_counter() - started,
+            method=method
+        )
+        metrics.inc("telegram_api_requests_total", method=method, outcome=outcome)
+
+
+# ================= WEBHOOK REPLY =================
+# Telegram runs one Bot API method given in the webhook response body. While
+# an update is handled inside a webhook request, reply() parks the first
+# call there instead of opening a request of its own. Telegram does not
+# return that call's result, so only fire-and-forget calls (callback
+# answers, final text replies) should go this way, and only as the
+# handler's last call: anything sent after it through call() arrives first.
+_reply = threading.local()
+
+
+@contextmanager
+def reply_channel():
+    """
+    Open the response slot for the current thread. The yielded dict holds
+    the parked call ({"method": ..., **payload}) or stays empty.
+    """
+
+    slot = {}
+    _reply.slot = slot
+
+    try:
+        yield slot
+    finally:
+        _reply.slot = None
+
+
+def reply(method, payload):
+    slot = getattr(_reply, "slot", None)
+
+    # no webhook request (polling, worker threads) or the slot is taken
+    if slot is None or slot:
+        return call(method, payload)
+
+    slot.update(payload, method=method)
+    metrics.inc("telegram_inline_replies_total", method=method)
+    return {"ok": True, "inline": True}
+
+
+# ================= FILES =================
+def download(file_id, timeout=60):
+    """
+    Streamed response for a file the bot can see (the Bot API serves up
+    to 20MB), or None when getFile fails. Use as a context manager.
+    """
+
+    info = call("getFile", {"file_id": file_id})
+    file_path = info.get("result", {}).get("file_path")
+
+    if not file_path:
+        return None
+
+    res = _session.get(file_url(file_path), stream=True, timeout=timeout)
+    res.raise_for_status()
+    res.raw.decode_content = True
+    return res
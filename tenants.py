@@ -0,0 +1,161 @@
+# file: tenants.py
+#
+# Several bots served by one process, on one catalog. The primary bot is
+# configured as before (BOT_TOKEN, BOT_USERNAME, ADMIN_ID, STORAGE_CHAT_ID);
+# EXTRA_BOTS adds more as a JSON list:
+#
+#     EXTRA_BOTS='[{"token": "123:abc", "username": "OtherBot",
+#                   "admins": [42], "storage_chat_id": -100123}]'
+#
+# Per bot: webhook route (/webhook/<token>) and secret, admin list, storage
+# chat, Telegram budget (lanes.py), user rate limits, auto-deletes, dialogs
+# and broadcast audience. Shared: the HTTP session, Mongo client, catalog
+# cache, log sinks and background jobs.
+#
+# The bot an update belongs to is a context variable: set per request, it
+# follows asyncio tasks and asyncio.to_thread; threads that never set it
+# act as the primary bot. Records of the primary bot keep their
+# single-bot shape, so scope() is None for it.
+
+import contextvars
+import os
+import threading
+from contextlib import contextmanager
+
+from config import (
+    ADMIN_ID,
+    ADMIN_IDS,
+    BOT_TOKEN,
+    BOT_USERNAME,
+    STORAGE_CHAT_ID,
+    WEBHOOK_SECRET,
+    derive_webhook_secret,
+    parse_extra_bots,
+)
+
+
+# ================= REGISTRY =================
+def _bot(token, username, admins, storage_chat_id, secret=None, webhook_url=None, primary=False):
+    return {
+        "id": token.split(":", 1)[0],  # Telegram's numeric bot id, not secret
+        "token": token,
+        "username": username,
+        "admins": frozenset(int(a) for a in admins if a),
+        "storage_chat_id": int(storage_chat_id or 0),
+        "secret": secret,
+        "webhook_url": webhook_url,
+        "primary": primary,
+    }
+
+
+def _load():
+    bots = [
+        _bot(
+            BOT_TOKEN or "",
+            BOT_USERNAME,
+            [ADMIN_ID, *ADMIN_IDS],
+            STORAGE_CHAT_ID,
+            WEBHOOK_SECRET,
+            os.getenv("WEBHOOK_URL"),
+            primary=True,
+        )
+    ]
+
+    try:
+        extra = parse_extra_bots()
+    except ValueError:
+        extra = []  # reported by config.validate()
+
+    for entry in extra:
+        if not isinstance(entry, dict) or not entry.get("token"):
+            continue
+
+        bots.append(_bot(
+            entry["token"],
+            entry.get("username"),
+            entry.get("admins") or [],
+            entry.get("storage_chat_id") or STORAGE_CHAT_ID,
+            entry.get("secret") or derive_webhook_secret(entry["token"]),
+            entry.get("webhook_url"),
+        ))
+
+    return bots
+
+
+BOTS = _load()
+PRIMARY = BOTS[0]
+
+_by_id = {b["id"]: b for b in BOTS}
+_by_token = {b["token"]: b for b in BOTS}
+
+_current = contextvars.ContextVar("bot", default=PRIMARY)
+
+
+def by_token(token):
+    return _by_token.get(token)
+
+
+def get(bot_id):
+    # None (a primary-scoped record) and unknown ids resolve to the primary
+    return _by_id.get(bot_id, PRIMARY)
+
+
+# ================= CONTEXT =================
+def current():
+    return _current.get()
+
+
+@contextmanager
+def use(bot):
+    # a bot dict, a bot id, or None for the primary bot
+    if not isinstance(bot, dict):
+        bot = get(bot)
+
+    token = _current.set(bot)
+
+    try:
+        yield bot
+    finally:
+        _current.reset(token)
+
+
+def start_thread(target, *args):
+    # a plain Thread starts as the primary bot; this one keeps the caller's
+    ctx = contextvars.copy_context()
+    thread = threading.Thread(target=ctx.run, args=(target, *args), daemon=True)
+    thread.start()
+    return thread
+
+
+def scope(bot=None):
+    """
+    Key for per-bot records and state: None for the primary bot (the
+    single-bot shape), the bot id for the others.
+    """
+
+    bot = bot or current()
+    return None if bot["primary"] else bot["id"]
+
+
+def is_admin(user_id, bot=None):
+    try:
+        return int(user_id) in (bot or current())["admins"]
+    except (TypeError, ValueError):
+        return False
+
+
+def webhook_url(bot):
+    """
+    Where Telegram should deliver this bot's updates: its own webhook_url,
+    else WEBHOOK_URL with the primary token swapped for this bot's.
+    """
+
+    if bot["webhook_url"]:
+        return bot["webhook_url"]
+
+    base = PRIMARY["webhook_url"]
+
+    if not base or not PRIMARY["token"] or PRIMARY["token"] not in base:
+        return None
+
+    return base.replace(PRIMARY["token"], bot["token"])
@@ -0,0 +1,154 @@
+# file: tracing.py
+
+import contextvars
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from config import TRACING_ENABLED, SLOW_UPDATE_MS, SLOW_TRACE_BUFFER
+
+
+# ================= STATE =================
+# a context variable, not a thread local: on the asyncio runtime many
+# updates share one thread, each in its own task context
+_trace = contextvars.ContextVar("trace", default=None)
+
+# most recent slow updates, oldest dropped first
+SLOW_TRACES = deque(maxlen=SLOW_TRACE_BUFFER)
+
+PROFILE_DIR = "profiles"
+_profile_lock = threading.Lock()
+_profile_requests = {"remaining": 0}
+
+
+def enabled():
+    return TRACING_ENABLED or _profile_requests["remaining"] > 0
+
+
+# ================= TRACES =================
+def begin(update_id, command):
+    if not enabled():
+        _trace.set(None)
+        return
+
+    _trace.set({
+        "update_id": update_id,
+        "command": command,
+        "started": time.perf_counter(),
+        "wall_time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "spans": [],
+        "profiler": _start_profiler(),
+    })
+
+
+def end():
+    trace = _trace.get()
+    _trace.set(None)
+
+    if not trace:
+        return None
+
+    trace["duration_ms"] = round((time.perf_counter() - trace["started"]) * 1000, 2)
+
+    profiler = trace.pop("profiler")
+    if profiler:
+        profiler.disable()
+        trace["profile"] = _dump_profile(profiler, trace["update_id"])
+
+    if trace["duration_ms"] >= SLOW_UPDATE_MS or trace.get("profile"):
+        trace.pop("started")
+        SLOW_TRACES.append(trace)
+
+    return trace
+
+
+@contextmanager
+def span(kind, name):
+    trace = _trace.get()
+
+    if not trace:
+        yield
+        return
+
+    started = time.perf_counter()
+    error = None
+
+    try:
+        yield
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        record = {
+            "kind": kind,
+            "name": name,
+            "offset_ms": round((started - trace["started"]) * 1000, 2),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+        if error:
+            record["error"] = error
+        trace["spans"].append(record)
+
+
+def recent_slow(limit=10):
+    return list(SLOW_TRACES)[-limit:]
+
+
+def format_trace(trace, max_spans=8):
+    lines = [
+        f"#{trace['update_id']} {trace['command']} — {trace['duration_ms']}ms ({trace['wall_time']})"
+    ]
+
+    spans = sorted(trace["spans"], key=lambda s: s["duration_ms"], reverse=True)
+
+    for s in spans[:max_spans]:
+        flag = f" ❌{s['error']}" if s.get("error") else ""
+        lines.append(f"  {s['kind']}:{s['name']} {s['duration_ms']}ms @+{s['offset_ms']}{flag}")
+
+    if trace.get("profile"):
+        lines.append(f"  profile: {trace['profile']['path']}")
+
+    return "\n".join(lines)
+
+
+# ================= PROFILING =================
+def request_profile(count=1):
+    with _profile_lock:
+        _profile_requests["remaining"] += count
+
+
+def _start_profiler():
+    with _profile_lock:
+        if _profile_requests["remaining"] <= 0:
+            return None
+        _profile_requests["remaining"] -= 1
+
+    profiler = cProfile.Profile()
+
+    try:
+        profiler.enable()
+    except ValueError:
+        # another profile is already running (single profiler per process on 3.12+)
+        return None
+
+    return profiler
+
+
+def _dump_profile(profiler, update_id):
+    try:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"update_{update_id}_{int(time.time())}.prof")
+        profiler.dump_stats(path)
+
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(15)
+
+        return {"path": path, "top": out.getvalue()}
+
+    except Exception as e:
+        return {"path": None, "error": str(e)}
@@ -1,5 +1,6 @@
 # file: utils.py
 
+from bot import delete_user_messages
 from database import get_pending_files
 from webhook import log_to_discord
 from datetime import datetime
@@ -15,8 +16,6 @@ def cleanup_pending_files():
 
         for file_data in pending_files:
             try:
-                from bot import delete_user_messages  # avoid circular import
-
                 delete_user_messages(
                     file_data['chat_id'],
                     file_data['file_message_id'],
@@ -2,66 +2,177 @@
 
 import requests
 import logging
+import random
+import threading
 import time
 import json
+from collections import Counter
 from datetime import datetime
 from typing import Dict, Optional, List
 from config import (
+    DISCORD_LOG_LEVEL,
     DISCORD_WEBHOOK_STATUS,
     DISCORD_WEBHOOK_LIST_LOGS,
     DISCORD_WEBHOOK_FILE_ACCESS,
+    DISCORD_WEBHOOK_PREFIX,
 )
+import logsinks
+import metrics
+import tracing
 
 BATCH_SIZE = 5
 FLUSH_INTERVAL = 5
 MAX_FIELDS = 25
 
-# 🔥 LOG LEVEL CONTROL (ANTI-SPAM)
-LOG_LEVELS = {
-    "info": 1,
-    "warning": 2,
-    "error": 3,
-}
-
-CURRENT_LOG_LEVEL = 1  # 1=info, 2=warning, 3=error
-
 COLORS = {
     "info": 0x2ECC71,
     "warning": 0xF1C40F,
     "error": 0xE74C3C,
 }
 
-log_buffers = {
-    "status": [],
-    "list": [],
-    "access": [],
-}
-
-last_flush_time = {
-    "status": time.time(),
-    "list": time.time(),
-    "access": time.time(),
-}
-
 webhook_map = {
     "status": DISCORD_WEBHOOK_STATUS,
     "list": DISCORD_WEBHOOK_LIST_LOGS,
     "access": DISCORD_WEBHOOK_FILE_ACCESS,
 }
 
+# event category -> channel above; "group" / "usage" / "system" come from
+# utils.log_event, anything else lands in status
+ROUTES = {
+    "status": "status",
+    "list": "list",
+    "access": "access",
+    "group": "list",
+    "usage": "access",
+    "system": "status",
+    "*": "status",
+}
+
+
+# ================= AGGREGATION =================
+# High-frequency events are folded into one summary embed per channel and
+# window instead of one entry each. "sample" keeps that fraction as
+# individual entries too; "top" ranks a field in the summary. Errors are
+# never aggregated.
+AGGREGATE_WINDOW = 60
+TOP_K = 5
+
+EVENT_RULES = {
+    "📤 File Delivered": {"event": "deliveries"},
+    "🎬 File accessed": {"event": "accesses", "top": "movie"},
+    "📦 File stored": {"event": "storage copies"},
+    "Storage skipped": {"event": "storage skipped"},
+    "🧹 Cleanup complete": {"event": "cleanups"},
+    "❌ Invalid link attempt": {"event": "invalid links", "top": "query", "sample": 0.1},
+}
+
+# errors counted as "failures" in the summary of the channel whose events
+# they are failures of, whichever channel they are logged to
+ERROR_RULES = {
+    "Send file failed": "access",
+    "Send file crash": "access",
+    "Storage error": "access",
+    "Cleanup error": "status",
+}
+
+_windows = {}  # log_type -> {"started", "counts", "top", "errors"}
+_aggregate_lock = threading.Lock()
+_aggregator = {"thread": None}
+
+
+def aggregate(log_type, message, severity, fields=None):
+    """
+    Count an event into the current window. Returns True when the caller
+    should not send it individually.
+    """
+
+    rule = EVENT_RULES.get(message)
+
+    with _aggregate_lock:
+        if severity == "error":
+            # still sent on its own; the summary just reports how many
+            if message in ERROR_RULES:
+                _window(ERROR_RULES[message])["errors"] += 1
+            elif log_type in _windows:
+                _windows[log_type]["errors"] += 1
+            return False
+
+        if rule is None:
+            return False
+
+        window = _window(log_type)
+        window["counts"][rule["event"]] += 1
+
+        top = rule.get("top")
+        value = (fields or {}).get(top)
+        if value is not None:
+            window["top"].setdefault(top, Counter())[str(value)] += 1
+
+    sample = rule.get("sample", 0)
+    return not (sample and random.random() < sample)
+
+
+def _window(log_type):
+    # caller holds _aggregate_lock
+    window = _windows.get(log_type)
+
+    if window is None:
+        window = _windows[log_type] = {
+            "started": time.time(),
+            "counts": Counter(),
+            "top": {},
+            "errors": 0,
+        }
+
+    if _aggregator["thread"] is None:
+        _aggregator["thread"] = threading.Thread(target=_aggregate_loop, daemon=True)
+        _aggregator["thread"].start()
+
+    return window
+
+
+def _aggregate_loop():
+    while True:
+        time.sleep(AGGREGATE_WINDOW)
+        flush_aggregates()
+
+
+def flush_aggregates():
+    with _aggregate_lock:
+        windows = dict(_windows)
+        _windows.clear()
+
+    now = time.time()
+
+    for log_type, window in windows.items():
+        fields = dict(window["counts"].most_common())
+
+        for top, counter in window["top"].items():
+            fields[f"top {top}"] = ", ".join(
+                f"{value} ({count})" for value, count in counter.most_common(TOP_K)
+            )
+
+        if window["errors"]:
+            fields["failures"] = window["errors"]
+
+        fields["window"] = f"{int(now - window['started'])}s"
+
+        summary = logsinks.event("📊 Activity summary", log_type, "info", fields)
+        _discord.write(log_type, summary, force=True)
+
 
 # ================= FALLBACK =================
 def write_fallback_log(entry):
     try:
         with open("failed_logs.txt", "a", encoding="utf-8") as f:
-            f.write(json.dumps(entry) + "\n")
+            f.write(json.dumps(entry, default=str) + "\n")
     except:
         pass
 
 
 # ================= SAFETY =================
 def validate_webhook_url(url: str) -> bool:
-    return isinstance(url, str) and url.startswith("https://discord.com/api/webhooks/")
+    return isinstance(url, str) and url.startswith(DISCORD_WEBHOOK_PREFIX)
 
 
 # ================= EMBED =================
@@ -138,42 +249,75 @@ def send_in_chunks(log_type: str, entries: List[dict]):
 
     for i in range(0, len(entries), MAX_FIELDS):
         chunk = entries[i:i + MAX_FIELDS]
+        started = time.perf_counter()
 
         try:
             payload = build_embed(log_type, chunk)
-            success = send_with_retry(url, payload, log_type)
+
+            with tracing.span("discord", log_type):
+                success = send_with_retry(url, payload, log_type)
 
             if not success:
+                metrics.inc("discord_flush_failures_total", channel=log_type)
                 for e in chunk:
                     write_fallback_log(e)
 
         except Exception as e:
             logging.error(f"{log_type} chunk failed: {e}")
+            metrics.inc("discord_flush_failures_total", channel=log_type)
 
             for e in chunk:
                 write_fallback_log(e)
 
+        finally:
+            metrics.observe(
+                "discord_flush_seconds",
+                time.perf_counter() - started,
+                channel=log_type
+            )
+
+
+# ================= SINK =================
+def to_entry(channel, ev):
+    # fields are formatted here, at flush time, not when logged
+    fields = logsinks.format_fields(ev["fields"])
+    fields["source"] = channel
+
+    return {
+        "message": str(ev["message"]),
+        "severity": ev["severity"],
+        "fields": fields,
+        "timestamp": logsinks.timestamp(ev),
+    }
 
-# ================= FLUSH =================
-def flush(log_type: str):
-    try:
-        buffer = log_buffers.get(log_type, [])
 
-        if not buffer:
-            return
+class DiscordSink(logsinks.Sink):
+    name = "discord"
+    batch_size = BATCH_SIZE
+    flush_interval = FLUSH_INTERVAL
+    routes = ROUTES
 
-        send_in_chunks(log_type, buffer)
+    def accept(self, channel, ev):
+        if aggregate(channel, ev["message"], ev["severity"], ev["fields"]):
+            metrics.inc("discord_events_aggregated_total", channel=channel)
+            return False
+        return True
 
-        log_buffers[log_type] = []
-        last_flush_time[log_type] = time.time()
+    def write_batch(self, channel, events):
+        try:
+            send_in_chunks(channel, [to_entry(channel, ev) for ev in events])
+        except Exception as e:
+            logging.error(f"{channel} flush error: {e}")
 
-    except Exception as e:
-        logging.error(f"{log_type} flush error: {e}")
 
+_discord = DiscordSink(DISCORD_LOG_LEVEL)
+logsinks.register(_discord)
 
+
+# ================= FLUSH =================
 def flush_all():
-    for log_type in list(log_buffers.keys()):
-        flush(log_type)
+    flush_aggregates()
+    logsinks.flush_all()
 
 
 # ================= MAIN LOG =================
@@ -184,43 +328,10 @@ def log_to_discord(
     fields: Optional[Dict[str, str]] = None,
     force_flush: bool = False,
 ):
-    try:
-        # 🔥 LOG LEVEL FILTER
-        if LOG_LEVELS.get(severity, 1) < CURRENT_LOG_LEVEL:
-            return
-
-        if log_type not in log_buffers:
-            log_type = "status"
-
-        entry = {
-            "message": str(message),
-            "severity": severity,
-            "fields": fields or {},
-            "timestamp": datetime.utcnow().isoformat(),
-        }
-
-        # add source context
-        entry["fields"]["source"] = log_type
-
-        # 🔥 ERROR = instant send
-        if severity == "error":
-            send_in_chunks(log_type, [entry])
-            return
-
-        log_buffers[log_type].append(entry)
-
-        now = time.time()
-
-        if len(log_buffers[log_type]) >= BATCH_SIZE:
-            flush(log_type)
-            return
-
-        if now - last_flush_time[log_type] >= FLUSH_INTERVAL:
-            flush(log_type)
-            return
-
-        if force_flush:
-            flush(log_type)
+    """
+    Log an event to every enabled sink (Discord included, despite the
+    name). `log_type` is the event category; field values may be
+    callables, evaluated only if a sink keeps the event.
+    """
 
-    except Exception as e:
-        print("LOGGING FAILURE:", str(e))
\ No newline at end of file
+    logsinks.emit(message, log_type, severity, fields, force_flush)